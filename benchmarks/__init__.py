@@ -0,0 +1 @@
+"""Benchmarks run against a local stand-in for the API."""
@@ -0,0 +1,77 @@
+"""Nearest neighbour and distance queries on a point grid and the server.
+
+Usage: python -m benchmarks.bench_grid [num_features] [num_queries]
+"""
+
+import random
+import sys
+import time
+
+import benchmarks.standin
+
+import snowfloat.geometry
+import snowfloat.layer
+
+def fill(standin, num):
+    """Store random point features over a 1000x1000 extent."""
+    rand = random.Random(0)
+    for i in xrange(num):
+        uuid = 'feature_%d' % (i,)
+        standin.features.append({
+            'type': 'Feature',
+            'id': uuid,
+            'geometry': {'type': 'Point',
+                         'coordinates': [rand.uniform(0, 1000),
+                                         rand.uniform(0, 1000)]},
+            'properties': {'uri': '/geo/1/layers/bench/features/%s' % (uuid,),
+                           'date_created': i,
+                           'date_modified': i,
+                           'spatial': None,
+                           'field_ts': i}})
+
+def report(name, num_queries, elapsed):
+    """Print a query throughput."""
+    print '%-16s %8d queries %8.3fs %10.0f queries/s' % (
+        name, num_queries, elapsed, num_queries / elapsed)
+
+def main():
+    """Run the benchmark."""
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    standin = benchmarks.standin.StandIn()
+    fill(standin, num)
+    standin.install()
+    try:
+        layer = snowfloat.layer.Layer(uuid='bench', uri='/geo/1/layers/bench')
+        rand = random.Random(1)
+        points = [[rand.uniform(0, 1000), rand.uniform(0, 1000)]
+                  for _ in xrange(num_queries)]
+
+        start = time.time()
+        grid = layer.get_point_grid()
+        print 'build %8d points %8.2fs' % (len(grid), time.time() - start)
+
+        start = time.time()
+        for point in points:
+            grid.within(point, 10)
+        report('grid within', num_queries, time.time() - start)
+
+        start = time.time()
+        for point in points:
+            grid.nearest(point, k=10)
+        report('grid nearest', num_queries, time.time() - start)
+
+        # the stand-in scans all the features: a lower bound of the server
+        # time, without the network round trips
+        remote = max(num_queries // 20, 1)
+        start = time.time()
+        for point in points[:remote]:
+            layer.get_features(query='distance_lte',
+                geometry=snowfloat.geometry.Point(point), distance=10)
+        report('server within', remote, time.time() - start)
+        grid.close()
+    finally:
+        standin.uninstall()
+
+if __name__ == '__main__':
+    main()
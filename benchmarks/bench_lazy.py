@@ -0,0 +1,47 @@
+"""Attribute-only scans with eager and lazy geometry decoding.
+
+Usage: python -m benchmarks.bench_lazy [num_features]
+"""
+
+import sys
+import time
+
+import benchmarks.standin
+
+import snowfloat.layer
+
+def fill(standin, num):
+    """Store linestring features with 50 vertices in the stand-in."""
+    for i in xrange(num):
+        uuid = 'feature_%d' % (i,)
+        standin.features.append({
+            'type': 'Feature',
+            'id': uuid,
+            'geometry': {'type': 'LineString',
+                         'coordinates': [[i + j, j] for j in range(50)]},
+            'properties': {'uri': '/geo/1/layers/bench/features/%s' % (uuid,),
+                           'date_created': i,
+                           'date_modified': i,
+                           'spatial': None,
+                           'field_ts': i}})
+
+def main():
+    """Run the benchmark."""
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    standin = benchmarks.standin.StandIn()
+    fill(standin, num)
+    standin.install()
+    try:
+        layer = snowfloat.layer.Layer(uuid='bench', uri='/geo/1/layers/bench')
+        for lazy in (False, True):
+            start = time.time()
+            total = sum(f.fields['ts'] for f in layer.iter_features(
+                lazy=lazy))
+            elapsed = time.time() - start
+            print 'lazy=%-5s %8d features %8.2fs %10.0f features/s (%d)' % (
+                lazy, num, elapsed, num / elapsed, total)
+    finally:
+        standin.uninstall()
+
+if __name__ == '__main__':
+    main()
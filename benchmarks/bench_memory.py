@@ -0,0 +1,61 @@
+"""Memory used per Feature object.
+
+Usage: python -m benchmarks.bench_memory [num_features] [lazy|eager]
+
+Measures the resident set size growth while holding features parsed from
+pages, with geometries decoded or left as GeoJSON.
+"""
+
+import gc
+import os
+import subprocess
+import sys
+
+import snowfloat.feature
+
+def get_rss():
+    """Returns the process resident set size in bytes."""
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+def get_page(start, num):
+    """Returns a page of point feature dictionaries."""
+    return [{'type': 'Feature',
+             'id': 'feature_%d' % (i,),
+             'geometry': {'type': 'Point', 'coordinates': [i, i]},
+             'properties': {'uri': '/geo/1/layers/bench/features/feature_%d'
+                                % (i,),
+                            'date_created': i,
+                            'date_modified': i,
+                            'spatial': None,
+                            'field_ts': i}}
+            for i in xrange(start, start + num)]
+
+def measure(num, lazy):
+    """Returns the bytes per feature held in memory."""
+    pages = [get_page(start, 1000) for start in xrange(0, num, 1000)]
+    gc.collect()
+    before = get_rss()
+    features = []
+    for page in pages:
+        features.extend(snowfloat.feature.parse_features(page, lazy=lazy))
+    gc.collect()
+    used = get_rss() - before
+    del features
+    return used / float(num)
+
+def main():
+    """Run the benchmark, one process per mode."""
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    if len(sys.argv) > 2:
+        lazy = sys.argv[2] == 'lazy'
+        print '%-5s %8d features %8.0f bytes/feature' % (
+            sys.argv[2], num, measure(num, lazy))
+        return
+    for mode in ('lazy', 'eager'):
+        subprocess.check_call([sys.executable, '-m', 'benchmarks.bench_memory',
+            str(num), mode])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Throughput of bulk loads with and without spatial ordering.
+
+Usage: python -m benchmarks.bench_ordering [num_features]
+"""
+
+import random
+import sys
+import time
+
+import benchmarks.standin
+
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+
+def get_features(num):
+    """Returns random point features over a 1000x1000 extent."""
+    rand = random.Random(0)
+    return [snowfloat.feature.Feature(
+                snowfloat.geometry.Point(
+                    [rand.uniform(0, 1000), rand.uniform(0, 1000)]),
+                fields={'ts': i})
+            for i in xrange(num)]
+
+def run(num, spatial_order):
+    """Load features in the stand-in and print the throughput."""
+    standin = benchmarks.standin.StandIn()
+    standin.install()
+    try:
+        layer = snowfloat.layer.Layer(uuid='bench',
+            uri='/geo/1/layers/bench', extent=[0, 1000, 0, 1000])
+        features = get_features(num)
+        start = time.time()
+        layer.add_features(features, spatial_order=spatial_order)
+        elapsed = time.time() - start
+    finally:
+        standin.uninstall()
+    print '%-8s %8d features %8.2fs %10.0f features/s %8d pages written' % (
+        spatial_order or 'none', num, elapsed, num / elapsed,
+        standin.pages_written)
+
+def main():
+    """Run the benchmark."""
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for spatial_order in (None, 'zorder', 'hilbert'):
+        run(num, spatial_order)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Local stand-in for the API.
+
+Replaces the requests library methods used by snowfloat.request with an
+in-process server storing features in memory. Writes are charged a simulated
+index maintenance cost per distinct index page a batch touches.
+"""
+
+import json
+import math
+import time
+import urlparse
+
+import requests
+
+class Response(object):
+    """Stand-in HTTP response."""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self._content = content
+
+    def json(self):
+        """Returns the response content."""
+        return self._content
+
+
+class StandIn(object):
+    """In-memory layer features store.
+
+    Attributes:
+        page_size (float): Index page side in coordinates units.
+
+        page_cost (float): Seconds charged per index page written.
+
+        features (list): Stored GeoJSON features.
+
+        pages_written (int): Number of index pages written.
+    """
+
+    def __init__(self, page_size=10.0, page_cost=0.0005):
+        self.page_size = page_size
+        self.page_cost = page_cost
+        self.features = []
+        self.pages_written = 0
+        self._saved = {}
+
+    def install(self):
+        """Route requests methods to the stand-in."""
+        for name in ('get', 'post'):
+            self._saved[name] = getattr(requests, name)
+            method = getattr(self, name)
+            method.__func__.__name__ = name
+            setattr(requests, name, method)
+
+    def uninstall(self):
+        """Restore requests methods."""
+        for name, method in self._saved.items():
+            setattr(requests, name, method)
+
+    # pylint: disable=W0613
+    def post(self, url, params=None, data=None, headers=None, timeout=None,
+            verify=None):
+        """Store the features posted."""
+        layer_uuid = urlparse.urlparse(url).path.split('/')[4]
+        features = json.loads(data)['features']
+        pages = set()
+        for feature in features:
+            uuid = 'feature_%d' % (len(self.features),)
+            feature['id'] = uuid
+            feature['properties'].update({
+                'uri': '/geo/1/layers/%s/features/%s' % (layer_uuid, uuid),
+                'date_created': len(self.features),
+                'date_modified': len(self.features),
+                'spatial': None})
+            self.features.append(feature)
+            pages.update(self._pages(feature['geometry']['coordinates']))
+        self.pages_written += len(pages)
+        time.sleep(len(pages) * self.page_cost)
+        return Response(200, {'type': 'FeatureCollection',
+                              'features': features})
+
+    # pylint: disable=W0613
+    def get(self, url, params=None, data=None, headers=None, timeout=None,
+            verify=None):
+        """Return a page of the features stored."""
+        query = dict(urlparse.parse_qsl(urlparse.urlparse(url).query))
+        query.update(params or {})
+        page = int(query.get('page', 0))
+        page_size = int(query.get('page_size', 1000))
+        features = self.features
+        if 'geometry__distance_lte' in query:
+            features = self._within(features,
+                json.loads(query['geometry__distance_lte']))
+        total = len(features)
+        start = page * page_size
+        features = features[start:start + page_size]
+        next_page_uri = None
+        if start + page_size < total:
+            next_page_uri = '%s?page=%d&page_size=%d' % (
+                urlparse.urlparse(url).path, page + 1, page_size)
+        return Response(200, {'next_page_uri': next_page_uri,
+                              'total': total,
+                              'geo': {'type': 'FeatureCollection',
+                                      'features': features}})
+
+    def _within(self, features, geometry):
+        """Returns the point features within a distance of a point."""
+        x, y = geometry['coordinates'][:2]
+        distance = geometry['properties']['distance']
+        return [feature for feature in features
+                if feature['geometry']['type'] == 'Point' and math.hypot(
+                    feature['geometry']['coordinates'][0] - x,
+                    feature['geometry']['coordinates'][1] - y) <= distance]
+
+    def _pages(self, coordinates):
+        """Returns the index pages holding coordinates."""
+        stack = [coordinates]
+        while stack:
+            coords = stack.pop()
+            if coords and isinstance(coords[0], list):
+                stack.extend(coords)
+            elif coords:
+                yield (int(coords[0] // self.page_size),
+                       int(coords[1] // self.page_size))
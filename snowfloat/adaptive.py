@@ -0,0 +1,287 @@
+"""Adaptive batch size and concurrency for bulk writes."""
+
+import collections
+import random
+import threading
+import time
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.pool
+import snowfloat.request
+import snowfloat.settings
+import snowfloat.signals
+
+class AIMDController(object):
+    """Batch size and concurrency controller.
+
+    Both grow additively while requests succeed under the target latency and
+    shrink multiplicatively on slow requests, 413, 429, 5xx responses and
+    timeouts. Thread-safe.
+
+    Attributes:
+        batch_size (int): Current number of features per request.
+
+        concurrency (int): Current number of requests in flight.
+
+        max_batch_size (int): Maximum number of features per request.
+
+        max_concurrency (int): Maximum number of requests in flight.
+
+        batch_step (int): Batch size additive increase.
+
+        target_latency (float): Request latency in seconds above which the
+            server is considered overloaded.
+
+        decrease_factor (float): Multiplicative decrease factor.
+    """
+
+    # pylint: disable=R0902,R0913
+    def __init__(self, batch_size=None, concurrency=1, max_batch_size=None,
+            max_concurrency=None, batch_step=None, target_latency=None,
+            decrease_factor=None):
+        settings = snowfloat.settings
+        self.max_batch_size = max_batch_size or \
+            settings.ADAPTIVE_MAX_BATCH_SIZE
+        self.max_concurrency = max_concurrency or \
+            settings.ADAPTIVE_MAX_CONCURRENCY
+        self.batch_size = min(batch_size or settings.ADAPTIVE_BATCH_SIZE,
+            self.max_batch_size)
+        self.concurrency = min(concurrency, self.max_concurrency)
+        self.batch_step = batch_step or settings.ADAPTIVE_BATCH_STEP
+        self.target_latency = target_latency or \
+            settings.ADAPTIVE_TARGET_LATENCY
+        self.decrease_factor = decrease_factor or \
+            settings.ADAPTIVE_DECREASE_FACTOR
+        self._window = float(self.concurrency)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'features': 0, 'slow': 0,
+                          'too_large': 0, 'throttled': 0, 'server_errors': 0,
+                          'timeouts': 0}
+        self._latency = None
+
+    def success(self, num_features, latency):
+        """Record a successful request.
+
+        Args:
+            num_features (int): Number of features sent.
+
+            latency (float): Request latency in seconds.
+        """
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters['features'] += num_features
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency = 0.8 * self._latency + 0.2 * latency
+            if latency > self.target_latency:
+                self._counters['slow'] += 1
+                self._decrease(batch=True, concurrency=True)
+                return
+            self.batch_size = min(self.batch_size + self.batch_step,
+                self.max_batch_size)
+            # one more request in flight per window of successes
+            self._window = min(self._window + 1.0 / int(self._window),
+                float(self.max_concurrency))
+            self.concurrency = int(self._window)
+
+    def failure(self, exception):
+        """Record a failed request.
+
+        Args:
+            exception (RequestError): Request error.
+
+        Returns:
+            bool: True if the request can be retried.
+        """
+        status = exception.status
+        with self._lock:
+            self._counters['requests'] += 1
+            if status == 413:
+                self._counters['too_large'] += 1
+                self._decrease(batch=True, concurrency=False)
+            elif status == 429:
+                self._counters['throttled'] += 1
+                self._decrease(batch=False, concurrency=True)
+            elif status is None:
+                self._counters['timeouts'] += 1
+                self._decrease(batch=True, concurrency=True)
+            elif status >= 500:
+                self._counters['server_errors'] += 1
+                self._decrease(batch=True, concurrency=True)
+            else:
+                return False
+        return True
+
+    def metrics(self):
+        """Returns the current settings and counters.
+
+        Returns:
+            dict: Metrics dictionary.
+        """
+        with self._lock:
+            metrics = dict(self._counters)
+            metrics['batch_size'] = self.batch_size
+            metrics['concurrency'] = self.concurrency
+            metrics['latency'] = self._latency
+        return metrics
+
+    def _decrease(self, batch, concurrency):
+        """Multiplicative decrease. Called with the lock held.
+
+        Args:
+            batch (bool): Decrease the batch size.
+
+            concurrency (bool): Decrease the concurrency.
+        """
+        if batch:
+            self.batch_size = max(
+                int(self.batch_size * self.decrease_factor), 1)
+        if concurrency:
+            self._window = max(self._window * self.decrease_factor, 1.0)
+            self.concurrency = int(self._window)
+
+
+def add_features(uri, features, controller, max_bytes=None):
+    """POST features to the server, sizing requests with a controller.
+
+    Each batch is sent once, without the request retries, so the controller
+    sees the server load as it happens. Batches rejected because of the
+    server load are sent again after an exponential backoff, with the
+    controller's reduced batch size and concurrency.
+
+    Args:
+        uri (str): Features URI.
+
+        features (list): List of Feature objects.
+
+        controller (AIMDController): Batch size and concurrency controller.
+
+    Kwargs:
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
+    Returns:
+        list: List of Feature objects stored.
+
+    Raises:
+        snowfloat.errors.RequestError. Other errors raised while sending a
+            batch are raised once the batches in flight are done.
+    """
+    if not max_bytes:
+        max_bytes = snowfloat.settings.BATCH_MAX_BYTES
+    sizes = [snowfloat.feature.estimate_feature_size(feature)
+             for feature in features]
+    cond = threading.Condition()
+    retries = collections.deque()
+    state = {'in_flight': 0, 'error': None}
+
+    def send_batch(batch, attempts):
+        """POST a batch and report the outcome to the controller."""
+        start = time.time()
+        try:
+            res = snowfloat.request.post(uri, [features[i] for i in batch],
+                format_func=snowfloat.feature.format_features, retries=1)
+            for i, feature in enumerate(res['features']):
+                snowfloat.feature.update_feature(features[batch[i]], feature)
+        except snowfloat.errors.RequestError, exception:
+            retry = controller.failure(exception) and \
+                attempts < snowfloat.settings.ADAPTIVE_MAX_RETRIES and \
+                (exception.status != 413 or len(batch) > 1)
+            if retry:
+                time.sleep(get_backoff(attempts))
+            with cond:
+                if retry:
+                    retries.append((batch, attempts + 1))
+                elif not state['error']:
+                    state['error'] = exception
+        # pylint: disable=W0703
+        except Exception, exception:
+            with cond:
+                if not state['error']:
+                    state['error'] = exception
+        else:
+            controller.success(len(batch), time.time() - start)
+        finally:
+            with cond:
+                state['in_flight'] -= 1
+                cond.notify_all()
+
+    pool = snowfloat.pool.WorkerPool(controller.max_concurrency)
+    position = 0
+    with cond:
+        while not state['error']:
+            if not retries and position >= len(features):
+                if not state['in_flight']:
+                    break
+                cond.wait()
+                continue
+            if state['in_flight'] >= controller.concurrency:
+                cond.wait()
+                continue
+            if retries:
+                batch, attempts = retries.popleft()
+                end = _get_batch_end(batch, sizes, controller.batch_size,
+                    max_bytes)
+                if end < len(batch):
+                    retries.appendleft((batch[end:], attempts))
+                    batch = batch[:end]
+            else:
+                indexes = xrange(position, len(features))
+                batch = range(position, position + _get_batch_end(indexes,
+                    sizes, controller.batch_size, max_bytes))
+                attempts = 0
+                position += len(batch)
+            state['in_flight'] += 1
+            pool.submit(send_batch, batch, attempts)
+    pool.shutdown()
+
+    layer_uuid = snowfloat.signals.get_layer_uuid(uri)
+    if state['error']:
+        # previous batches may have been stored
+        snowfloat.signals.send(layer_uuid, 'add')
+        raise state['error']
+
+    snowfloat.signals.send(layer_uuid, 'add', features)
+    return features
+
+def get_backoff(attempts):
+    """Returns the delay before sending a failed batch again.
+
+    The delay doubles on each attempt up to settings.ADAPTIVE_MAX_BACKOFF,
+    with a random jitter so that failed batches are not sent again all at
+    once.
+
+    Args:
+        attempts (int): Number of failed attempts before this one.
+
+    Returns:
+        float: Delay in seconds.
+    """
+    delay = min(snowfloat.settings.ADAPTIVE_BACKOFF * 2 ** attempts,
+        snowfloat.settings.ADAPTIVE_MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1)
+
+def _get_batch_end(indexes, sizes, batch_size, max_bytes):
+    """Returns the number of features of the next batch.
+
+    Args:
+        indexes (list): Indexes of the features left to send.
+
+        sizes (list): Estimated serialized size of each feature.
+
+        batch_size (int): Maximum number of features.
+
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
+    Returns:
+        int: Number of features, at least one.
+    """
+    total = 0
+    for count, i in enumerate(indexes):
+        if count >= batch_size:
+            return count
+        total += sizes[i]
+        if count and total > max_bytes:
+            return count
+    return len(indexes)
@@ -0,0 +1,381 @@
+"""Apache Arrow record batches and Parquet/Feather export of features."""
+
+import json
+import os
+import tempfile
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # pragma: no cover
+    pyarrow = None
+
+try:
+    import pyproj
+except ImportError: # pragma: no cover
+    pyproj = None
+
+import snowfloat.columnar
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.settings
+import snowfloat.wkb
+
+FORMATS = ('parquet', 'feather')
+
+GEOMETRY_ENCODINGS = ('wkb', 'geoarrow')
+
+GEOPARQUET_VERSION = '1.1.0'
+
+COORDINATE_NAMES = ('x', 'y', 'z')
+
+def get_field_type(field):
+    """Returns the Arrow type of a field definition.
+
+    Args:
+        field (dict): Field definition.
+
+    Returns:
+        pyarrow.DataType: string, int64, float64 or bool. Unknown types are
+            stored as strings.
+    """
+    field_type = field.get('type')
+    if field_type == 'integer':
+        return pyarrow.int64()
+    if field_type in ('real', 'float'):
+        return pyarrow.float64()
+    if field_type == 'boolean':
+        return pyarrow.bool_()
+    return pyarrow.string()
+
+def infer_fields(features):
+    """Returns fields definitions inferred from GeoJSON features.
+
+    Args:
+        features (list): GeoJSON feature dictionaries.
+
+    Returns:
+        list: List of fields definitions.
+    """
+    kinds = {}
+    for feature in features:
+        for key, val in feature['properties'].iteritems():
+            if key.startswith('field_') and val is not None:
+                kinds.setdefault(key[6:], set()).add(type(val))
+    fields = []
+    for name in sorted(kinds):
+        types = kinds[name]
+        if types == set([bool]):
+            field_type = 'boolean'
+        elif types <= set([int, long]):
+            field_type = 'integer'
+        elif types <= set([int, long, float]):
+            field_type = 'real'
+        else:
+            field_type = 'string'
+        fields.append({'name': name, 'type': field_type})
+    return fields
+
+def make_schema(fields, geometry_type=None):
+    """Returns the Arrow schema of features.
+
+    Args:
+        fields (list): List of fields definitions.
+
+    Kwargs:
+        geometry_type (pyarrow.DataType): Type of the geometry column.
+            binary (WKB) if None.
+
+    Returns:
+        pyarrow.Schema: Columns uuid, uri, date_created, date_modified,
+            geometry and one per field.
+    """
+    columns = [pyarrow.field(name, pyarrow.string()) for name in
+               ('uuid', 'uri', 'date_created', 'date_modified')]
+    columns.append(pyarrow.field('geometry',
+        geometry_type or pyarrow.binary()))
+    columns.extend(pyarrow.field(field['name'], get_field_type(field))
+                   for field in fields)
+    return pyarrow.schema(columns)
+
+def make_record_batch(features, fields, geometry_encoding='wkb'):
+    """Returns an Arrow record batch of GeoJSON features.
+
+    Args:
+        features (list): GeoJSON feature dictionaries.
+
+        fields (list): List of fields definitions.
+
+    Kwargs:
+        geometry_encoding (str): wkb for a binary column, geoarrow for
+            nested lists of x, y and z structs. geoarrow requires all the
+            geometries to be of the same type.
+
+    Returns:
+        pyarrow.RecordBatch: Columns uuid, uri, date_created,
+            date_modified, geometry and one per field.
+
+    Raises:
+        snowfloat.errors.Error, ValueError
+    """
+    if geometry_encoding not in GEOMETRY_ENCODINGS:
+        raise ValueError('Unknown geometry encoding %r.'
+            % (geometry_encoding,))
+    names = ['uuid', 'uri', 'date_created', 'date_modified', 'geometry']
+    columns = [pyarrow.array([feature['id'] for feature in features],
+        type=pyarrow.string())]
+    for name in names[1:4]:
+        columns.append(pyarrow.array(
+            [_to_string(feature['properties'].get(name))
+             for feature in features], type=pyarrow.string()))
+    if geometry_encoding == 'wkb':
+        columns.append(pyarrow.array(
+            [snowfloat.wkb.dumps(feature['geometry'])
+             if feature['geometry'] else None for feature in features],
+            type=pyarrow.binary()))
+    else:
+        columns.append(_make_geoarrow_column(features))
+    for field in fields:
+        key = 'field_%s' % (field['name'],)
+        field_type = get_field_type(field)
+        values = [feature['properties'].get(key) for feature in features]
+        if field_type == pyarrow.string():
+            values = [_to_string(val) for val in values]
+        names.append(field['name'])
+        columns.append(pyarrow.array(values, type=field_type))
+    return pyarrow.RecordBatch.from_arrays(columns, names)
+
+def write_features(uri, path, fields=None, srid=None, format='parquet',
+        geometry_encoding='wkb', row_group_size=None, compression='snappy',
+        **kwargs):
+    """GET features from the server and write them to an Arrow file.
+
+    Pages are buffered as JSON until row_group_size features are received,
+    then converted to a record batch and written: memory use is bounded by
+    one record batch. The file is written next to path and renamed once
+    complete, so a failed export leaves no partial file.
+
+    The geo metadata follows GeoParquet 1.1.0. The CRS is written as
+    PROJJSON when pyproj is installed. Without pyproj, SRID 4326 is left
+    to the OGC:CRS84 default and other SRIDs are written as unknown.
+
+    Args:
+        uri (str): Layer URI.
+
+        path (str): Output file path.
+
+    Kwargs:
+        fields (list): Fields definitions typing the columns. Inferred from
+            the first page if None.
+
+        srid (int): Spatial reference system SRID code of the geometries.
+
+        format (str): parquet or feather (Arrow IPC file).
+
+        geometry_encoding (str): wkb or geoarrow.
+
+        row_group_size (int): Number of features per row group.
+
+        compression (str): Parquet compression codec.
+
+        Same as snowfloat.feature.get_pages.
+
+    Returns:
+        dict: Export statistics: features and row_groups.
+
+    Raises:
+        snowfloat.errors.RequestError, snowfloat.errors.Error, ValueError
+    """
+    # pylint: disable=W0622,R0913
+    if pyarrow is None: # pragma: no cover
+        raise snowfloat.errors.Error('pyarrow is required for Arrow export.')
+    if format not in FORMATS:
+        raise ValueError('Unknown Arrow format %r.' % (format,))
+    if geometry_encoding not in GEOMETRY_ENCODINGS:
+        raise ValueError('Unknown geometry encoding %r.'
+            % (geometry_encoding,))
+    row_group_size = row_group_size or \
+        snowfloat.settings.ARROW_ROW_GROUP_SIZE
+    stats = {'features': 0, 'row_groups': 0}
+    state = {'writer': None, 'schema': None, 'fields': fields}
+    buf = []
+    handle, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix='.%s.' % (os.path.basename(path),), suffix='.tmp')
+    os.close(handle)
+
+    def write(features):
+        """Convert buffered features to a record batch and write it."""
+        if state['fields'] is None:
+            state['fields'] = infer_fields(features)
+        batch = make_record_batch(features, state['fields'],
+            geometry_encoding=geometry_encoding)
+        if state['writer'] is None:
+            # the geometry type is only known from the features in GeoArrow
+            geometry_type = None if geometry_encoding == 'wkb' else \
+                batch.column(4).type
+            metadata = _get_geo_metadata(geometry_encoding,
+                _get_geometry_type(features), srid)
+            state['schema'] = make_schema(state['fields'],
+                geometry_type).with_metadata({'geo': json.dumps(metadata)})
+            if format == 'parquet':
+                state['writer'] = pyarrow.parquet.ParquetWriter(tmp_path,
+                    state['schema'], compression=compression)
+            else:
+                state['writer'] = pyarrow.RecordBatchFileWriter(tmp_path,
+                    state['schema'])
+        if not batch.schema.remove_metadata().equals(
+                state['schema'].remove_metadata()):
+            raise snowfloat.errors.Error(
+                'Record batch schema changed: %s' % (batch.schema,))
+        if format == 'parquet':
+            state['writer'].write_table(
+                pyarrow.Table.from_batches([batch], state['schema']),
+                row_group_size=row_group_size)
+        else:
+            state['writer'].write_batch(batch)
+        stats['features'] += batch.num_rows
+        stats['row_groups'] += 1
+
+    try:
+        pages = snowfloat.feature.get_pages(uri, **kwargs)
+        try:
+            for page in pages:
+                while page:
+                    count = row_group_size - len(buf)
+                    buf.extend(page[:count])
+                    page = page[count:]
+                    if len(buf) >= row_group_size:
+                        write(buf)
+                        buf = []
+            if buf or state['writer'] is None:
+                write(buf)
+        finally:
+            pages.close()
+            if state['writer'] is not None:
+                state['writer'].close()
+        if os.path.exists(path):
+            # os.rename does not replace files on Windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return stats
+
+def _make_geoarrow_column(features):
+    """Returns a GeoArrow geometry column.
+
+    Vertices are x, y and z structs, nested in lists for each level of the
+    geometry type.
+
+    Args:
+        features (list): GeoJSON feature dictionaries.
+
+    Returns:
+        pyarrow.Array: Geometry column.
+
+    Raises:
+        snowfloat.errors.Error
+    """
+    batch = snowfloat.columnar.parse_feature_batch([features])
+    types = set(batch.geometry_types.tolist())
+    if len(types) > 1 or 0 in types or batch.collections:
+        raise snowfloat.errors.Error('GeoArrow encoding requires all the '
+            'geometries to be of the same type.')
+    # GeoParquet stores the separated representation only
+    dims = batch.dims or 2
+    coordinates = batch.coordinates.reshape(-1, dims)
+    vertices = pyarrow.StructArray.from_arrays(
+        [pyarrow.array(coordinates[:, i]) for i in xrange(dims)],
+        COORDINATE_NAMES[:dims])
+    if not types:
+        return vertices
+    geometry_type = snowfloat.columnar.GEOMETRY_TYPES[types.pop()]
+    if geometry_type == 'Point':
+        return vertices
+    rings = _list_array(batch.ring_offsets, vertices)
+    if geometry_type in ('LineString', 'MultiPoint'):
+        return rings
+    if geometry_type == 'Polygon':
+        return _list_array(batch.part_offsets, rings)
+    if geometry_type == 'MultiLineString':
+        return _list_array(batch.geometry_offsets, rings)
+    return _list_array(batch.geometry_offsets,
+        _list_array(batch.part_offsets, rings))
+
+def _list_array(offsets, values):
+    """Returns a list array.
+
+    Args:
+        offsets (numpy.ndarray): Lists offsets.
+
+        values (pyarrow.Array): Lists values.
+
+    Returns:
+        pyarrow.ListArray: List array.
+    """
+    return pyarrow.ListArray.from_arrays(
+        pyarrow.array(offsets.astype('int32')), values)
+
+def _get_geometry_type(features):
+    """Returns the geometry type shared by GeoJSON features.
+
+    Args:
+        features (list): GeoJSON feature dictionaries.
+
+    Returns:
+        str: Geometry type. None if mixed or without geometries.
+    """
+    types = set(feature['geometry']['type'] for feature in features
+                if feature['geometry'])
+    return types.pop() if len(types) == 1 else None
+
+def _get_crs(srid):
+    """Returns the PROJJSON CRS of an SRID.
+
+    Args:
+        srid (int): Spatial reference system SRID code.
+
+    Returns:
+        tuple: (bool, dict). Whether a crs member is written, and its
+            value. None for an unknown CRS.
+    """
+    if pyproj is not None and srid:
+        return True, pyproj.CRS.from_epsg(srid).to_json_dict()
+    if srid == 4326:
+        # same axis order and datum as the OGC:CRS84 default
+        return False, None
+    return True, None
+
+def _get_geo_metadata(geometry_encoding, geometry_type=None, srid=None):
+    """Returns the GeoParquet metadata of the geometry column.
+
+    Args:
+        geometry_encoding (str): wkb or geoarrow.
+
+    Kwargs:
+        geometry_type (str): Geometry type of the features, encoding the
+            GeoArrow column. Point if None.
+
+        srid (int): Spatial reference system SRID code.
+
+    Returns:
+        dict: geo metadata.
+    """
+    column = {'encoding': 'WKB' if geometry_encoding == 'wkb'
+                          else (geometry_type or 'Point').lower(),
+              'geometry_types': []}
+    has_crs, crs = _get_crs(srid)
+    if has_crs:
+        column['crs'] = crs
+    return {'version': GEOPARQUET_VERSION,
+            'primary_column': 'geometry',
+            'columns': {'geometry': column}}
+
+def _to_string(val):
+    """Returns a value as a string, JSON-encoded unless already one."""
+    if val is None or isinstance(val, basestring):
+        return val
+    return json.dumps(val)
@@ -0,0 +1,291 @@
+"""Cache of features query results."""
+
+import collections
+import json
+import threading
+import time
+
+import snowfloat.feature
+import snowfloat.settings
+import snowfloat.signals
+
+_cache = None
+
+# features counts by layer uuid and query parameters: (count, expires)
+_counts = {}
+_counts_lock = threading.Lock()
+
+class QueryCache(object):
+    """Least recently used cache of get_features results.
+
+    Results are keyed by layer uuid and the formatted query parameters, so
+    calls with the same conditions written differently share an entry. They
+    are stored as the JSON features received, under a total size limit, and
+    decoded in new Feature objects on each hit.
+
+    Entries of a layer are dropped when features are added, updated or
+    deleted, or the layer is updated, through the client. A query running
+    during a write does not store its result. Thread-safe.
+
+    Attributes:
+        max_entries (int): Maximum number of results.
+
+        max_bytes (int): Maximum total size of the results in bytes.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or \
+            snowfloat.settings.QUERY_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or snowfloat.settings.QUERY_CACHE_MAX_BYTES
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                       'invalidations': 0}
+        snowfloat.signals.connect(self._on_write)
+
+    def get_features(self, uri, limit=None, lazy=False, **kwargs):
+        """Returns layer's features, from the cache if possible.
+
+        Args:
+            uri (str): Layer URI.
+
+        Kwargs:
+            limit (int): Maximum number of features returned.
+
+            lazy (bool): Decode the geometries on first access only.
+
+            Same as snowfloat.feature.get_pages.
+
+        Returns:
+            list: List of Feature objects.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        layer_uuid = snowfloat.signals.get_layer_uuid(uri)
+        key = make_key(layer_uuid, kwargs, limit=limit)
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+                self._stats['hits'] += 1
+            else:
+                self._stats['misses'] += 1
+                generation = self._get_generation(layer_uuid)
+        if data is None:
+            features = _fetch(uri, limit, kwargs)
+            data = json.dumps(features, separators=(',', ':'))
+            self._store(key, data, generation)
+        else:
+            features = json.loads(data)
+        return snowfloat.feature.parse_features(features, lazy=lazy)
+
+    def invalidate(self, layer_uuid=None):
+        """Drop the cached results of a layer.
+
+        Kwargs:
+            layer_uuid (str): Layer's UUID. All layers if None.
+        """
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if layer_uuid is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                for key in [key for key in self._entries
+                            if key[0] == layer_uuid]:
+                    self._bytes -= len(self._entries.pop(key))
+            # results being fetched can not be stored anymore
+            self._generations[layer_uuid] = \
+                self._generations.get(layer_uuid, 0) + 1
+
+    def stats(self):
+        """Returns the cache statistics.
+
+        Returns:
+            dict: hits, misses, hit_rate, entries, bytes, evictions and
+                invalidations.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / float(lookups) if lookups else 0.0
+        return stats
+
+    def close(self):
+        """Drop the results and stop listening to the writes."""
+        snowfloat.signals.disconnect(self._on_write)
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key, data, generation):
+        """Store a result unless its layer was written since the query.
+
+        Args:
+            key (tuple): Cache key.
+
+            data (str): JSON features.
+
+            generation (tuple): Writes count when the query started.
+        """
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if self._get_generation(key[0]) != generation:
+                return
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or \
+                    self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+                self._stats['evictions'] += 1
+
+    def _get_generation(self, layer_uuid):
+        """Returns the invalidations counts of a layer and all layers."""
+        return (self._generations.get(layer_uuid, 0),
+                self._generations.get(None, 0))
+
+    def _on_write(self, layer_uuid, action, features):
+        """Signal listener dropping the results of the layer written."""
+        # pylint: disable=W0613
+        self.invalidate(layer_uuid)
+
+
+def make_key(layer_uuid, kwargs, limit=None):
+    """Returns the cache key of a features query.
+
+    Args:
+        layer_uuid (str): Layer's UUID.
+
+        kwargs (dict): Query conditions. Same as get_pages.
+
+    Kwargs:
+        limit (int): Maximum number of features returned.
+
+    Returns:
+        tuple: Layer's UUID, formatted parameters in canonical JSON and
+            limit.
+    """
+    conditions = dict((key, val) for key, val in kwargs.iteritems()
+                      if key not in ('page_size', 'prefetch'))
+    params = snowfloat.feature.format_query_params(conditions)
+    return (layer_uuid, json.dumps(params, sort_keys=True), limit)
+
+def enable(max_entries=None, max_bytes=None):
+    """Serve Layer.get_features and Client.get_features from a cache.
+
+    Kwargs:
+        Same as QueryCache.
+
+    Returns:
+        QueryCache: Cache enabled.
+    """
+    global _cache # pylint: disable=W0603
+    disable()
+    _cache = QueryCache(max_entries=max_entries, max_bytes=max_bytes)
+    return _cache
+
+def disable():
+    """Stop caching the features queries."""
+    global _cache # pylint: disable=W0603
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+def get_cache():
+    """Returns the enabled cache.
+
+    Returns:
+        QueryCache: Cache. None if not enabled.
+    """
+    return _cache
+
+def get_count(uri, **kwargs):
+    """Returns the number of layer's features matching conditions.
+
+    Counts are cached for settings.COUNT_CACHE_TTL seconds, shared by the
+    Layer objects of a layer. The counts of a layer are dropped when it is
+    written through the client.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        Same conditions as snowfloat.feature.get_pages. Paging arguments
+        are ignored.
+
+    Returns:
+        int: Number of features.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    conditions = dict((key, val) for key, val in kwargs.iteritems()
+                      if key not in ('page_size', 'prefetch', 'limit', 'lazy'))
+    key = make_key(snowfloat.signals.get_layer_uuid(uri), conditions)[:2]
+    now = time.time()
+    with _counts_lock:
+        count, expires = _counts.get(key, (None, 0))
+    if expires > now:
+        return count
+    count = snowfloat.feature.count_features(uri, **conditions)
+    with _counts_lock:
+        if len(_counts) >= snowfloat.settings.COUNT_CACHE_MAX_ENTRIES:
+            for old_key, (_, expires) in _counts.items():
+                if expires <= now:
+                    del _counts[old_key]
+            if len(_counts) >= snowfloat.settings.COUNT_CACHE_MAX_ENTRIES:
+                del _counts[min(_counts, key=lambda k: _counts[k][1])]
+        _counts[key] = (count, now + snowfloat.settings.COUNT_CACHE_TTL)
+    return count
+
+def clear_counts(layer_uuid=None):
+    """Forget the cached features counts.
+
+    Kwargs:
+        layer_uuid (str): Layer's UUID. All layers by default.
+    """
+    with _counts_lock:
+        for key in _counts.keys():
+            if layer_uuid is None or key[0] == layer_uuid:
+                del _counts[key]
+
+def _clear_counts_on_write(layer_uuid, action, features):
+    """Signal listener dropping the counts of the layer written."""
+    # pylint: disable=W0613
+    clear_counts(layer_uuid)
+
+snowfloat.signals.connect(_clear_counts_on_write)
+
+def _fetch(uri, limit, kwargs):
+    """Returns the JSON features of a query.
+
+    Args:
+        uri (str): Layer URI.
+
+        limit (int): Maximum number of features returned.
+
+        kwargs (dict): Same as get_pages.
+
+    Returns:
+        list: List of GeoJSON feature dictionaries.
+    """
+    features = []
+    pages = snowfloat.feature.get_pages(uri, **kwargs)
+    try:
+        for page in pages:
+            features.extend(page)
+            if limit is not None and len(features) >= limit:
+                del features[limit:]
+                break
+    finally:
+        pages.close()
+    return features
@@ -6,10 +6,14 @@ This is the first object to instantiate to interact with the API.
 import json
 import time
 
+import snowfloat.adaptive
+import snowfloat.cache
+import snowfloat.columnar
 import snowfloat.layer
 import snowfloat.errors
 import snowfloat.request
 import snowfloat.result
+import snowfloat.signals
 import snowfloat.task
 
 class Client(object):
@@ -79,14 +83,20 @@ class Client(object):
         """
         uri = '%s/layers' % (self.uri,)
         snowfloat.request.delete(uri)
+        snowfloat.signals.send(None, 'layer')
 
-    def add_features(self, layer_uuid, features):
+    def add_features(self, layer_uuid, features, controller=None):
         """Add features to a layer.
 
         Args:
             layer_uuid (str): Layer's ID.
 
-            features (list): List of features to add. Maximum 1000 items.
+            features (list): List of features to add. Sent in batches
+                under the payload size limit.
+
+        Kwargs:
+            controller (AIMDController): Adapt the batch size and number of
+                requests in flight to the server load.
 
         Returns:
             list. List of Feature objects.
@@ -95,15 +105,20 @@ class Client(object):
             snowfloat.errors.RequestError
         """
         uri = '%s/layers/%s/features' % (self.uri, layer_uuid)
+        if controller:
+            return snowfloat.adaptive.add_features(uri, features, controller)
         return snowfloat.feature.add_features(uri, features)
 
-    def get_features(self, layer_uuid, **kwargs):
+    def get_features(self, layer_uuid, as_columns=False, **kwargs):
         """Returns layer's features.
 
         Args:
             layer_uuid (str): Layer's ID.
 
         Kwargs:
+            as_columns (bool): Return a columnar FeatureBatch instead of a
+                list of Feature objects.
+
             geometry_type (str): Geometries type.
 
             query (str): Spatial or distance query.
@@ -122,16 +137,55 @@ class Client(object):
 
             query_slice (tuple): Tuple to limit entries returned.
 
+            include_fields (tuple): Names of the fields to return.
+
+            geometry_format (str): full (default), none, bbox or centroid.
+
         Returns:
-            list. List of Feature objects.
+            list. List of Feature objects or FeatureBatch. Served from the
+                query cache when one is enabled, except FeatureBatch.
         
         Raises:
-            snowfloat.errors.RequestError
+            snowfloat.errors.RequestError, ValueError
         """
         uri = '%s/layers/%s' % (self.uri, layer_uuid)
+        if as_columns:
+            return snowfloat.columnar.get_feature_batch(uri, **kwargs)
+        cache = snowfloat.cache.get_cache()
+        if cache is not None:
+            return cache.get_features(uri, **kwargs)
         return [feature for feature in snowfloat.feature.get_features(
             uri, **kwargs)]
 
+    def iter_features(self, layer_uuid, **kwargs):
+        """Returns an iterator over layer's features.
+
+        Pages are requested as the features are consumed.
+
+        Args:
+            layer_uuid (str): Layer's ID.
+
+        Kwargs:
+            page_size (int): Number of features per page.
+
+            prefetch (int): Number of pages fetched ahead in a background
+                thread.
+
+            limit (int): Maximum number of features returned.
+
+            lazy (bool): Decode the geometries on first access only.
+
+            Same as get_features.
+
+        Returns:
+            generator. Yields Feature objects.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        uri = '%s/layers/%s' % (self.uri, layer_uuid)
+        return snowfloat.feature.get_features(uri, **kwargs)
+
     def delete_features(self, layer_uuid,
             **kwargs):
         """Deletes layer's features.
@@ -152,6 +206,7 @@ class Client(object):
  
         uri = '%s/layers/%s/features' % (self.uri, layer_uuid)
         snowfloat.request.delete(uri, params)
+        snowfloat.signals.send(layer_uuid, 'delete')
 
     def execute_tasks(self, tasks, interval=5):
         """Execute a list tasks.
@@ -0,0 +1,564 @@
+"""Columnar feature batches backed by NumPy arrays."""
+
+import struct
+import warnings
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.wkb
+
+GEOMETRY_TYPES = (None, 'Point', 'LineString', 'Polygon', 'MultiPoint',
+                  'MultiLineString', 'MultiPolygon', 'GeometryCollection')
+
+class FeatureBatch(object):
+    """Features stored in columns.
+
+    Geometries are split in parts, parts in rings and rings in vertices
+    (GeoArrow layout). The parts of geometry i are
+    part_offsets[geometry_offsets[i]:geometry_offsets[i + 1]] and so on down
+    to the vertices, stored in a flat coordinates array.
+
+    Attributes:
+        uuids (numpy.ndarray): Features UUIDs.
+
+        uris (numpy.ndarray): Features URIs.
+
+        date_created (numpy.ndarray): Creation dates, datetime64[us] in UTC.
+
+        date_modified (numpy.ndarray): Modification dates, datetime64[us]
+            in UTC.
+
+        geometry_types (numpy.ndarray): Geometry type codes, indexes in
+            GEOMETRY_TYPES. 0 for features without geometry.
+
+        coordinates (numpy.ndarray): Flat float64 vertices coordinates.
+
+        dims (int): Number of dimensions of each vertex.
+
+        geometry_offsets (numpy.ndarray): Offsets of each geometry parts.
+
+        part_offsets (numpy.ndarray): Offsets of each part rings.
+
+        ring_offsets (numpy.ndarray): Offsets of each ring vertices.
+
+        fields (dict): Field name to column array.
+
+        collections (dict): Row to GeoJSON dictionary for the geometry
+            collections, not stored in the coordinates columns.
+    """
+
+    # pylint: disable=R0902,R0913
+    def __init__(self, uuids, uris, date_created, date_modified,
+            geometry_types, coordinates, dims, geometry_offsets,
+            part_offsets, ring_offsets, fields, collections=None):
+        self.uuids = uuids
+        self.uris = uris
+        self.date_created = date_created
+        self.date_modified = date_modified
+        self.geometry_types = geometry_types
+        self.coordinates = coordinates
+        self.dims = dims
+        self.geometry_offsets = geometry_offsets
+        self.part_offsets = part_offsets
+        self.ring_offsets = ring_offsets
+        self.fields = fields
+        self.collections = collections or {}
+
+    def __len__(self):
+        return len(self.uuids)
+
+    def __repr__(self):
+        return '%s(features=%d, vertices=%d, fields=%r)' % (
+            self.__class__.__name__, len(self), len(self.vertices),
+            sorted(self.fields))
+
+    @property
+    def vertices(self):
+        """Coordinates as a (number of vertices, dims) array view."""
+        return self.coordinates.reshape(-1, self.dims or 1)
+
+    def get_geojson(self, index):
+        """Returns a feature geometry in the GeoJSON format.
+
+        Args:
+            index (int): Feature row.
+
+        Returns:
+            dict: GeoJSON geometry dictionary. None without geometry.
+        """
+        geometry_type = GEOMETRY_TYPES[self.geometry_types[index]]
+        if geometry_type is None:
+            return None
+        if geometry_type == 'GeometryCollection':
+            return self.collections[index]
+        vertices = self.vertices
+        parts = []
+        for part in xrange(self.geometry_offsets[index],
+                self.geometry_offsets[index + 1]):
+            rings = []
+            for ring in xrange(self.part_offsets[part],
+                    self.part_offsets[part + 1]):
+                rings.append(vertices[self.ring_offsets[ring]:
+                    self.ring_offsets[ring + 1]].tolist())
+            parts.append(rings)
+        return {'type': geometry_type,
+                'coordinates': _unsplit(geometry_type, parts)}
+
+    def to_wkb(self):
+        """Returns the geometries in the ISO WKB format.
+
+        Encoded from the offset arrays, without GeoJSON dictionaries. The
+        points of all the rows are packed in one NumPy operation.
+
+        Returns:
+            numpy.ndarray: Object array of WKB bytes. None without geometry.
+        """
+        res = numpy.empty(len(self), dtype=object)
+        dims = min(self.dims, 3)
+        vertices = numpy.ascontiguousarray(self.vertices[:, :dims],
+            dtype='<f8')
+        # Z types are the 2D ones plus 1000
+        z_type = 1000 if dims == 3 else 0
+        rows = numpy.flatnonzero(self.geometry_types == 1)
+        if len(rows):
+            first = self.ring_offsets[
+                self.part_offsets[self.geometry_offsets[rows]]]
+            data = _pack_points(vertices[first], z_type)
+            size = len(data) // len(rows)
+            res[rows] = [data[i:i + size]
+                         for i in xrange(0, len(data), size)]
+        for row in numpy.flatnonzero(self.geometry_types > 1):
+            geometry_type = GEOMETRY_TYPES[self.geometry_types[row]]
+            if geometry_type == 'GeometryCollection':
+                res[row] = snowfloat.wkb.dumps(self.collections[row])
+                continue
+            wkb_type = snowfloat.wkb.WKB_TYPES[geometry_type] + z_type
+            chunks = []
+            parts = xrange(self.geometry_offsets[row],
+                self.geometry_offsets[row + 1])
+            for part in parts:
+                rings = xrange(self.part_offsets[part],
+                    self.part_offsets[part + 1])
+                if geometry_type == 'MultiPoint':
+                    ring = rings[0]
+                    points = vertices[self.ring_offsets[ring]:
+                                      self.ring_offsets[ring + 1]]
+                    chunks.append(struct.pack('<BII', 1, wkb_type,
+                        len(points)))
+                    chunks.append(_pack_points(points, z_type))
+                    continue
+                if geometry_type in ('Polygon', 'MultiPolygon'):
+                    if geometry_type == 'MultiPolygon' and part == parts[0]:
+                        chunks.append(struct.pack('<BII', 1, wkb_type,
+                            len(parts)))
+                    chunks.append(struct.pack('<BII', 1, 3 + z_type,
+                        len(rings)))
+                elif geometry_type == 'MultiLineString':
+                    if part == parts[0]:
+                        chunks.append(struct.pack('<BII', 1, wkb_type,
+                            len(parts)))
+                    chunks.append(struct.pack('<BI', 1, 2 + z_type))
+                else:
+                    chunks.append(struct.pack('<BI', 1, wkb_type))
+                for ring in rings:
+                    start = self.ring_offsets[ring]
+                    end = self.ring_offsets[ring + 1]
+                    chunks.append(struct.pack('<I', end - start))
+                    chunks.append(vertices[start:end].tobytes())
+            if not parts and geometry_type.startswith('Multi'):
+                chunks.append(struct.pack('<BII', 1, wkb_type, 0))
+            res[row] = ''.join(chunks)
+        return res
+
+    def get_feature(self, index):
+        """Returns a Feature object for a row.
+
+        Args:
+            index (int): Feature row.
+
+        Returns:
+            Feature: Feature object, its geometry decoded on first access.
+        """
+        fields = {}
+        for name, column in self.fields.iteritems():
+            fields[name] = _item(column[index])
+        return snowfloat.feature.Feature(self.get_geojson(index),
+            fields=fields,
+            uuid=self.uuids[index],
+            uri=self.uris[index],
+            date_created=date_item(self.date_created[index]),
+            date_modified=date_item(self.date_modified[index]),
+            layer_uuid=self.uris[index].split('/')[4])
+
+
+def get_feature_batch(uri, fields=None, limit=None, lazy=False, **kwargs):
+    """GET features from the server in a columnar batch.
+
+    Kwargs:
+        fields (list): Fields definitions giving the columns dtypes.
+
+        limit (int): Maximum number of rows. No more pages are requested
+            once reached.
+
+        lazy (bool): Accepted like snowfloat.feature.get_features. Batches
+            never build Geometry objects.
+
+        Same as snowfloat.feature.get_pages.
+
+    Returns:
+        FeatureBatch: Features batch.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    # pylint: disable=W0613
+    pages = snowfloat.feature.get_pages(uri, **kwargs)
+    try:
+        return parse_feature_batch(_limit_pages(pages, limit), fields=fields)
+    finally:
+        pages.close()
+
+def _limit_pages(pages, limit):
+    """Yield pages truncated to limit features in total."""
+    count = 0
+    for page in pages:
+        if limit is not None:
+            page = page[:limit - count]
+        count += len(page)
+        yield page
+        if limit is not None and count >= limit:
+            return
+
+def parse_feature_batch(pages, fields=None):
+    """Build a columnar batch from pages of GeoJSON features.
+
+    Args:
+        pages: Iterable of lists of GeoJSON feature dictionaries.
+
+    Kwargs:
+        fields (list): Fields definitions giving the columns dtypes. The
+            dtypes of other fields are inferred from their values.
+
+    Returns:
+        FeatureBatch: Features batch.
+
+    Raises:
+        snowfloat.errors.Error
+    """
+    if numpy is None: # pragma: no cover
+        raise snowfloat.errors.Error('numpy is required for feature batches.')
+    builder = _BatchBuilder()
+    for page in pages:
+        builder.add_page(page)
+    return builder.build(fields)
+
+
+class _BatchBuilder(object):
+    """Accumulate pages of GeoJSON features into columns."""
+
+    def __init__(self):
+        self.rows = 0
+        self.dims = None
+        self.uuids = []
+        self.uris = []
+        self.date_created = []
+        self.date_modified = []
+        self.geometry_types = []
+        self.coordinate_chunks = []
+        self.geometry_parts = []
+        self.part_rings = []
+        self.ring_vertices = []
+        self.fields = {}
+        self.collections = {}
+
+    def add_page(self, features):
+        """Add a page of GeoJSON features.
+
+        Args:
+            features (list): GeoJSON feature dictionaries.
+        """
+        coordinates = []
+        for feature in features:
+            properties = feature['properties']
+            self.uuids.append(feature['id'])
+            self.uris.append(properties.get('uri'))
+            self.date_created.append(properties.get('date_created'))
+            self.date_modified.append(properties.get('date_modified'))
+            for key, val in properties.iteritems():
+                if key.startswith('field_'):
+                    name = key[6:]
+                    if name not in self.fields:
+                        self.fields[name] = [None] * self.rows
+                    self.fields[name].append(val)
+            self.rows += 1
+            for column in self.fields.itervalues():
+                if len(column) < self.rows:
+                    column.append(None)
+            self._add_geometry(feature['geometry'], coordinates)
+        if coordinates:
+            self.coordinate_chunks.append(
+                numpy.array(coordinates, dtype=numpy.float64))
+
+    def _add_geometry(self, geojson, coordinates):
+        """Add a geometry parts, rings and vertices.
+
+        Args:
+            geojson (dict): GeoJSON geometry dictionary or None.
+
+            coordinates (list): Page vertices list to extend.
+
+        Raises:
+            snowfloat.errors.Error
+        """
+        if not geojson:
+            self.geometry_types.append(0)
+            self.geometry_parts.append(0)
+            return
+        geometry_type = geojson['type']
+        self.geometry_types.append(GEOMETRY_TYPES.index(geometry_type))
+        if geometry_type == 'GeometryCollection':
+            self.collections[self.rows - 1] = geojson
+            self.geometry_parts.append(0)
+            return
+        parts = _split(geometry_type, geojson['coordinates'])
+        self.geometry_parts.append(len(parts))
+        for rings in parts:
+            self.part_rings.append(len(rings))
+            for vertices in rings:
+                self.ring_vertices.append(len(vertices))
+                for vertex in vertices:
+                    if self.dims is None:
+                        self.dims = len(vertex)
+                    elif len(vertex) != self.dims:
+                        raise snowfloat.errors.Error(
+                            'Mixed coordinates dimensions %d and %d.'
+                            % (self.dims, len(vertex)))
+                    coordinates.append(vertex)
+
+    def build(self, fields=None):
+        """Returns the features batch.
+
+        Kwargs:
+            fields (list): Fields definitions giving the columns dtypes.
+
+        Returns:
+            FeatureBatch: Features batch.
+        """
+        if self.coordinate_chunks:
+            coordinates = numpy.concatenate(
+                self.coordinate_chunks).reshape(-1)
+        else:
+            coordinates = numpy.zeros(0, dtype=numpy.float64)
+        field_types = dict((field['name'], field.get('type'))
+                           for field in fields or [])
+        for name in field_types:
+            if name not in self.fields:
+                self.fields[name] = [None] * self.rows
+        return FeatureBatch(
+            uuids=make_column(self.uuids),
+            uris=make_column(self.uris),
+            date_created=make_date_column(self.date_created),
+            date_modified=make_date_column(self.date_modified),
+            geometry_types=numpy.array(self.geometry_types, dtype=numpy.int8),
+            coordinates=coordinates,
+            dims=self.dims or 2,
+            geometry_offsets=_offsets(self.geometry_parts),
+            part_offsets=_offsets(self.part_rings),
+            ring_offsets=_offsets(self.ring_vertices),
+            fields=dict((name, make_column(values, field_types.get(name)))
+                for name, values in self.fields.iteritems()),
+            collections=self.collections)
+
+
+def make_column(values, field_type=None):
+    """Returns a typed column array for a list of values.
+
+    Integers become int64 columns, or float64 with NaN for missing values.
+    Numbers become float64 columns, booleans bool columns and everything
+    else object columns. A field type gives the dtype whatever the values,
+    boolean columns with missing values being object columns.
+
+    Args:
+        values (list): Column values.
+
+    Kwargs:
+        field_type (str): Field type: string, integer, real or boolean.
+            Inferred from the values if None.
+
+    Returns:
+        numpy.ndarray: Column array.
+    """
+    kinds = set(type(val) for val in values if val is not None)
+    missing = len(values) != sum(1 for val in values if val is not None)
+    if field_type == 'integer':
+        kinds = set([int]) if missing else set([long])
+    elif field_type in ('real', 'float'):
+        kinds = set([float])
+    elif field_type == 'boolean':
+        kinds = set([bool])
+    elif field_type == 'string':
+        kinds = set([unicode])
+    try:
+        if kinds and kinds <= set([int, long]) and not missing:
+            return numpy.array(values, dtype=numpy.int64)
+        if kinds and kinds <= set([int, long, float]):
+            return numpy.array([numpy.nan if val is None else val
+                for val in values], dtype=numpy.float64)
+        if kinds == set([bool]) and not missing:
+            return numpy.array(values, dtype=numpy.bool_)
+    except (OverflowError, TypeError, ValueError):
+        # values not of the field type
+        pass
+    column = numpy.empty(len(values), dtype=object)
+    for i, val in enumerate(values):
+        column[i] = val
+    return column
+
+def make_date_column(values):
+    """Returns a datetime64[us] column of dates.
+
+    Args:
+        values (list): ISO format dates, seconds since the epoch or None
+            for missing values.
+
+    Returns:
+        numpy.ndarray: datetime64[us] column in UTC, NaT for missing
+            values. Object column if a value is not a date.
+    """
+    column = numpy.empty(len(values), dtype='datetime64[us]')
+    try:
+        for i, val in enumerate(values):
+            column[i] = to_datetime64(val)
+    except (TypeError, ValueError):
+        return make_column(values)
+    return column
+
+def to_datetime64(val):
+    """Returns a date as a datetime64[us] scalar.
+
+    Args:
+        val: ISO format date, seconds since the epoch, datetime or None.
+
+    Returns:
+        numpy.datetime64: Date in UTC. NaT for None.
+
+    Raises:
+        ValueError, TypeError
+    """
+    if val is None:
+        return numpy.datetime64('NaT', 'us')
+    if isinstance(val, bool):
+        raise TypeError('%r is not a date.' % (val,))
+    if isinstance(val, (int, long, float)):
+        return numpy.datetime64(int(round(val * 1e6)), 'us')
+    if isinstance(val, basestring):
+        if val.endswith('Z'):
+            val = val[:-1]
+        elif val.endswith('+00:00'):
+            val = val[:-6]
+        with warnings.catch_warnings():
+            # other offsets are converted to UTC
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return numpy.datetime64(val, 'us')
+    return numpy.datetime64(val, 'us')
+
+def _offsets(counts):
+    """Returns offsets from a list of counts.
+
+    Args:
+        counts (list): Number of children of each item.
+
+    Returns:
+        numpy.ndarray: int64 offsets, one more than counts.
+    """
+    offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    return offsets
+
+def _split(geometry_type, coordinates):
+    """Split GeoJSON coordinates in parts of rings of vertices.
+
+    Args:
+        geometry_type (str): GeoJSON geometry type.
+
+        coordinates (list): GeoJSON coordinates.
+
+    Returns:
+        list: List of parts.
+    """
+    if geometry_type == 'Point':
+        return [[[coordinates]]]
+    if geometry_type in ('LineString', 'MultiPoint'):
+        return [[coordinates]]
+    if geometry_type == 'Polygon':
+        return [coordinates]
+    if geometry_type == 'MultiLineString':
+        return [[linestring] for linestring in coordinates]
+    return coordinates
+
+def _pack_points(vertices, z_type):
+    """Returns the WKB points of vertices, one after the other.
+
+    Args:
+        vertices (numpy.ndarray): Little-endian (number of vertices, dims)
+            array.
+
+        z_type (int): 1000 for 3D points, 0 otherwise.
+
+    Returns:
+        str: WKB bytes.
+    """
+    points = numpy.empty(len(vertices), dtype=[('order', 'u1'),
+        ('type', '<u4'), ('coordinates', '<f8', (vertices.shape[1],))])
+    points['order'] = 1
+    points['type'] = 1 + z_type
+    points['coordinates'] = vertices
+    return points.tobytes()
+
+def _unsplit(geometry_type, parts):
+    """Returns GeoJSON coordinates from parts of rings of vertices.
+
+    Args:
+        geometry_type (str): GeoJSON geometry type.
+
+        parts (list): List of parts.
+
+    Returns:
+        list: GeoJSON coordinates.
+    """
+    if geometry_type == 'Point':
+        return parts[0][0][0]
+    if geometry_type in ('LineString', 'MultiPoint'):
+        return parts[0][0]
+    if geometry_type == 'Polygon':
+        return parts[0]
+    if geometry_type == 'MultiLineString':
+        return [rings[0] for rings in parts]
+    return parts
+
+def _item(val):
+    """Returns a Python value from a NumPy scalar."""
+    if isinstance(val, numpy.generic):
+        return val.item()
+    return val
+
+def date_item(val):
+    """Returns an ISO format date from a datetime64 scalar.
+
+    Args:
+        val: datetime64 scalar, or any NumPy or Python value returned as a
+            Python value.
+
+    Returns:
+        ISO format date, None for NaT.
+    """
+    if isinstance(val, numpy.datetime64):
+        if numpy.isnat(val):
+            return None
+        return numpy.datetime_as_string(val)
+    return _item(val)
@@ -0,0 +1,209 @@
+"""Conversion of features to and from pandas data frames."""
+
+import collections
+import json
+
+try:
+    import numpy
+    import pandas
+except ImportError: # pragma: no cover
+    pandas = None
+
+try:
+    import geopandas
+    import shapely.wkb
+except ImportError: # pragma: no cover
+    geopandas = None
+
+import snowfloat.columnar
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+
+def to_dataframe(uri, fields=None, srid=None, geo=True, **kwargs):
+    """GET features from the server in a data frame.
+
+    The frame is built from the columns of a FeatureBatch, without Feature
+    objects.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        fields (list): Fields definitions giving the columns dtypes.
+
+        srid (int): Spatial reference system SRID code of the
+            GeoDataFrame.
+
+        geo (bool): Return a GeoDataFrame with shapely geometries if
+            geopandas is installed.
+
+        Same as snowfloat.feature.get_pages.
+
+    Returns:
+        pandas.DataFrame: Columns uuid, uri, date_created, date_modified,
+            one per field and geometry: GeoJSON dictionaries, or shapely
+            geometries in a GeoDataFrame.
+
+    Raises:
+        snowfloat.errors.RequestError, snowfloat.errors.Error
+    """
+    if pandas is None: # pragma: no cover
+        raise snowfloat.errors.Error('pandas is required for data frames.')
+    return make_dataframe(snowfloat.columnar.get_feature_batch(uri,
+        fields=fields, **kwargs), fields=fields, srid=srid, geo=geo)
+
+def make_dataframe(batch, fields=None, srid=None, geo=True):
+    """Returns a data frame of a features batch.
+
+    GeoDataFrame geometries are decoded from the WKB encoded from the batch
+    offset arrays, without GeoJSON dictionaries.
+
+    Args:
+        batch (FeatureBatch): Features batch.
+
+    Kwargs:
+        Same as to_dataframe.
+
+    Returns:
+        pandas.DataFrame: Features data frame.
+    """
+    field_types = dict((field['name'], field.get('type'))
+                       for field in fields or [])
+    data = collections.OrderedDict()
+    data['uuid'] = batch.uuids
+    data['uri'] = batch.uris
+    data['date_created'] = batch.date_created
+    data['date_modified'] = batch.date_modified
+    for name in sorted(batch.fields):
+        data[name] = make_series(batch.fields[name], field_types.get(name))
+    if geo and geopandas is not None:
+        frame = pandas.DataFrame(data, columns=list(data))
+        crs = 'EPSG:%d' % (srid,) if srid else None
+        wkbs = batch.to_wkb()
+        if hasattr(geopandas.GeoSeries, 'from_wkb'):
+            geometries = geopandas.GeoSeries.from_wkb(wkbs, crs=crs)
+        else: # pragma: no cover
+            geometries = [shapely.wkb.loads(wkb) if wkb is not None else None
+                          for wkb in wkbs]
+        return geopandas.GeoDataFrame(frame, geometry=geometries, crs=crs)
+    data['geometry'] = [batch.get_geojson(i) for i in xrange(len(batch))]
+    return pandas.DataFrame(data, columns=list(data))
+
+def make_series(column, field_type=None):
+    """Returns a column as a series of the field type dtype.
+
+    Integer columns with missing values get the nullable Int64 dtype.
+
+    Args:
+        column (numpy.ndarray): Column array.
+
+    Kwargs:
+        field_type (str): Field type: string, integer, real or boolean.
+
+    Returns:
+        pandas.Series: Column series.
+    """
+    series = pandas.Series(column)
+    if field_type == 'integer' and column.dtype != numpy.int64:
+        return pandas.Series(column, dtype='float64').astype('Int64')
+    if field_type in ('real', 'float') and column.dtype != numpy.float64:
+        return pandas.Series(column, dtype='float64')
+    if field_type == 'string' and column.dtype != object:
+        return series.astype(object)
+    return series
+
+def make_geojson_features(frame, geometry='geometry'):
+    """Returns GeoJSON features from the rows of a data frame.
+
+    Columns other than the geometry and the uuid, uri and dates attributes
+    are fields. Missing values are dropped.
+
+    Args:
+        frame (pandas.DataFrame): Data frame.
+
+    Kwargs:
+        geometry (str): Geometry column name. Values are GeoJSON
+            dictionaries, Geometry objects or shapely geometries.
+
+    Returns:
+        list: GeoJSON feature dictionaries.
+    """
+    attributes = ('uuid', 'uri', 'date_created', 'date_modified')
+    names = [name for name in frame.columns
+             if name != geometry and name not in attributes]
+    keys = ['field_%s' % (name,) for name in names]
+    columns = [_to_list(frame[name]) for name in names]
+    features = []
+    for i, geom in enumerate(frame[geometry].tolist()):
+        properties = {}
+        for key, column in zip(keys, columns):
+            if column[i] is not None:
+                properties[key] = column[i]
+        features.append({'type': 'Feature', 'geometry': _to_geojson(geom),
+                         'properties': properties})
+    return features
+
+def parse_dataframe(frame, geometry='geometry'):
+    """Returns Feature objects from the rows of a data frame.
+
+    Columns other than the geometry and the uuid, uri and dates attributes
+    are fields. Missing values are dropped.
+
+    Args:
+        frame (pandas.DataFrame): Data frame.
+
+    Kwargs:
+        geometry (str): Geometry column name. Values are GeoJSON
+            dictionaries, Geometry objects or shapely geometries.
+
+    Returns:
+        list: List of Feature objects.
+    """
+    attributes = ('uuid', 'uri', 'date_created', 'date_modified')
+    names = [name for name in frame.columns
+             if name != geometry and name not in attributes]
+    columns = [_to_list(frame[name]) for name in names]
+    geometries = frame[geometry].tolist()
+    features = []
+    for i, geom in enumerate(geometries):
+        if isinstance(geom, dict):
+            geom = snowfloat.feature.get_geometry_from_geojson(geom)
+        elif geom is not None and \
+                not isinstance(geom, snowfloat.geometry.Geometry):
+            # shapely geometries coordinates are tuples
+            geom = snowfloat.feature.get_geometry_from_geojson(
+                json.loads(json.dumps(geom.__geo_interface__)))
+        fields = {}
+        for name, column in zip(names, columns):
+            if column[i] is not None:
+                fields[name] = column[i]
+        features.append(snowfloat.feature.Feature(geom, fields=fields))
+    return features
+
+def _to_geojson(geom):
+    """Returns the GeoJSON dictionary of a GeoJSON, Geometry or shapely
+    geometry."""
+    if geom is None or isinstance(geom, dict):
+        return geom
+    if isinstance(geom, snowfloat.geometry.Geometry):
+        if geom.geometry_type == 'GeometryCollection':
+            return {'type': geom.geometry_type,
+                    'geometries': [_to_geojson(part)
+                                   for part in geom.geometries]}
+        return {'type': geom.geometry_type,
+                'coordinates': geom.coordinates}
+    # shapely geometries coordinates are tuples, serialized as lists
+    return geom.__geo_interface__
+
+def _to_list(series):
+    """Returns a series values as Python objects, None if missing. Dates
+    are in the ISO format, like in feature batches."""
+    mask = series.isnull().tolist()
+    if series.dtype.kind == 'M':
+        # time zone aware values are in UTC
+        values = [snowfloat.columnar.date_item(val)
+                  for val in series.values.astype('datetime64[us]')]
+    else:
+        values = series.astype(object).tolist()
+    return [None if missing else val for val, missing in zip(values, mask)]
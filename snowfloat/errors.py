@@ -39,3 +39,30 @@ class RequestError(Error):
         return "RequestError(status=%r, code=%r, message=%r, more=%r)" % (
             self.status, self.code, self.message, self.more)
 
+
+class TimeoutError(Error):
+    """Operation did not complete in the time allowed."""
+
+
+class ValidationError(Error):
+    """Features failed validation.
+
+    Attributes:
+        errors (list): List of (index, feature, messages) tuples, one per
+            invalid feature.
+
+        features (list): Valid features.
+    """
+
+    errors = None
+    features = None
+
+    def __init__(self, message, errors, features=None):
+        Error.__init__(self, message)
+        self.errors = errors
+        self.features = features
+
+    def __str__(self):
+        return "ValidationError: message=%s, errors=%s" % (
+            self.message, [(index, messages)
+                for index, _, messages in self.errors])
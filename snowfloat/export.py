@@ -0,0 +1,121 @@
+"""Streaming export of features to GeoJSON text sequence and NDJSON files."""
+
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import snowfloat.feature
+
+FORMATS = ('geojsonseq', 'ndjson')
+
+# feature attributes written with the fields
+ATTRIBUTES = ('uri', 'date_created', 'date_modified')
+
+# RFC 8142 record separator
+RECORD_SEPARATOR = '\x1e'
+
+def export_features(uri, path, format='geojsonseq', raw=False,
+        compress=False, **kwargs):
+    """GET features from the server and write them to a file.
+
+    Pages are written as they are received and released, so memory use does
+    not depend on the number of features. The GeoJSON dictionaries are
+    written without building Feature objects, with the fields as
+    properties named without their field_ prefix, plus the uri and dates
+    attributes. The file is written to a temporary file in the same
+    directory, renamed to path once complete.
+
+    Args:
+        uri (str): Layer URI.
+
+        path (str): Output file path.
+
+    Kwargs:
+        format (str): geojsonseq (RFC 8142) or ndjson, one feature per line.
+
+        raw (bool): Also write the other properties received, like the
+            spatial operations results.
+
+        compress (bool): Write a gzip file.
+
+        Same as snowfloat.feature.get_pages.
+
+    Returns:
+        dict: Export statistics: features, bytes written before compression,
+            seconds and features_per_sec.
+
+    Raises:
+        snowfloat.errors.RequestError, ValueError
+    """
+    # pylint: disable=W0622
+    if format not in FORMATS:
+        raise ValueError('Unknown export format %r.' % (format,))
+    prefix = RECORD_SEPARATOR if format == 'geojsonseq' else ''
+    stats = {'features': 0, 'bytes': 0}
+    start = time.time()
+    handle, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix='.%s.' % (os.path.basename(path),), suffix='.tmp')
+    os.close(handle)
+    try:
+        if compress:
+            output = gzip.open(tmp_path, 'wb')
+        else:
+            output = open(tmp_path, 'wb')
+        try:
+            pages = snowfloat.feature.get_pages(uri, **kwargs)
+            try:
+                for page in pages:
+                    lines = ['%s%s\n' % (prefix,
+                                json.dumps(format_feature(feature, raw=raw),
+                                           separators=(',', ':')))
+                             for feature in page]
+                    data = ''.join(lines)
+                    output.write(data)
+                    stats['features'] += len(lines)
+                    stats['bytes'] += len(data)
+            finally:
+                pages.close()
+        finally:
+            output.close()
+        if os.path.exists(path):
+            # os.rename does not replace files on Windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    stats['seconds'] = time.time() - start
+    stats['features_per_sec'] = \
+        stats['features'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+def format_feature(feature, raw=False):
+    """Returns a GeoJSON feature dictionary with plain properties.
+
+    Args:
+        feature (dict): GeoJSON feature dictionary as received, left
+            unchanged.
+
+    Kwargs:
+        raw (bool): Keep the other properties received.
+
+    Returns:
+        dict: GeoJSON feature dictionary. Fields, named without their
+            field_ prefix, and the uri and dates attributes are properties.
+    """
+    properties = {}
+    attributes = {}
+    for key, val in (feature.get('properties') or {}).iteritems():
+        if key.startswith('field_'):
+            properties[key[6:]] = val
+        elif raw or key in ATTRIBUTES:
+            attributes[key] = val
+    properties.update(attributes)
+    return {'type': 'Feature',
+            'id': feature.get('id'),
+            'geometry': feature.get('geometry'),
+            'properties': properties}
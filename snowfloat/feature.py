@@ -2,8 +2,18 @@
 
 import json
 
+import snowfloat.errors
 import snowfloat.geometry
 import snowfloat.request
+import snowfloat.settings
+import snowfloat.signals
+
+# Serialized size estimates in bytes.
+FEATURE_SIZE = 96
+COORDINATE_SIZE = 20
+FIELD_SIZE = 16
+
+GEOMETRY_FORMATS = (None,) + snowfloat.request.GEOMETRY_FORMATS
 
 class Feature(object):
     """Layer's features class.
@@ -17,34 +27,56 @@ class Feature(object):
 
         date_modified (str): Modification date in ISO format.
 
-        geometry (Geometry): Geometry.
+        geometry (Geometry): Geometry. Can be set to a GeoJSON dictionary
+            decoded on first access.
 
         fields (dict): Feature's fields.
 
         layer_uuid (str): Layer's UUID.
 
-        spatial: Attribute to store spatial operation result.
+        spatial: Attribute to store spatial operation result. Can be set to
+            a GeoJSON dictionary decoded on first access.
     """
 
-    uuid = None
-    uri = None
-    date_created = None
-    date_modified = None
-    geometry = None
-    fields = {}
-    layer_uuid = None
-    spatial = None
+    __slots__ = ('uuid', 'uri', 'date_created', 'date_modified', 'fields',
+                 'layer_uuid', '_geometry', '_spatial')
 
     def __init__(self, geometry, fields=None, **kwargs):
+        self.uuid = None
+        self.uri = None
+        self.date_created = None
+        self.date_modified = None
+        self.layer_uuid = None
+        self._spatial = None
         for key, val in kwargs.items():
             getattr(self, key)
             setattr(self, key, val)
         self.geometry = geometry
-        if fields:
-            self.fields = fields
-        # spatial can be a geometry in the geojson format
-        if self.spatial and isinstance(self.spatial, dict):
-            self.spatial = get_geometry_from_geojson(self.spatial)
+        self.fields = fields or {}
+
+    @property
+    def geometry(self):
+        """Feature's geometry, decoded from GeoJSON on first access."""
+        if isinstance(self._geometry, dict):
+            self._geometry = get_geometry_from_geojson(self._geometry)
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry):
+        """Set the geometry: Geometry object or GeoJSON dictionary."""
+        self._geometry = geometry
+
+    @property
+    def spatial(self):
+        """Spatial operation result, decoded from GeoJSON on first access."""
+        if isinstance(self._spatial, dict):
+            self._spatial = get_geometry_from_geojson(self._spatial)
+        return self._spatial
+
+    @spatial.setter
+    def spatial(self, spatial):
+        """Set the spatial operation result."""
+        self._spatial = spatial
     
     def __str__(self):
         return '%s: uuid=%s, uri=%s, ' \
@@ -77,6 +109,8 @@ class Feature(object):
             setattr(self, key, value)
         snowfloat.request.put(self.uri,
             data=snowfloat.feature.format_feature(self))
+        snowfloat.signals.send(snowfloat.signals.get_layer_uuid(self.uri),
+            'update', [self])
 
     def delete(self):
         """Deletes a feature.
@@ -85,29 +119,265 @@ class Feature(object):
             snowfloat.errors.RequestError
         """
         snowfloat.request.delete(self.uri)
+        snowfloat.signals.send(snowfloat.signals.get_layer_uuid(self.uri),
+            'delete', [self.uuid])
 
 
-def add_features(uri, features):
+def add_features(uri, features, max_bytes=None):
     """POST features to the server.
 
+    Features are sent in batches packed under the payload size limit. A batch
+    rejected by the server as too large is split in half and sent again.
+
     Args:
         features (list): List of Feature objects.
 
+    Kwargs:
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
     Returns:
         list: List of Feature objects stored.
     """
-    res = snowfloat.request.post(uri, features,
-        format_func=format_features)
+    if not max_bytes:
+        max_bytes = snowfloat.settings.BATCH_MAX_BYTES
+    layer_uuid = snowfloat.signals.get_layer_uuid(uri)
+    try:
+        for batch in batch_features(features, max_bytes,
+                snowfloat.settings.BATCH_MAX_FEATURES):
+            _post_features(uri, batch)
+    except snowfloat.errors.RequestError:
+        # previous batches may have been stored
+        snowfloat.signals.send(layer_uuid, 'add')
+        raise
+
+    snowfloat.signals.send(layer_uuid, 'add', features)
+    return features
+
+def add_geojson_features(uri, features, max_bytes=None):
+    """POST GeoJSON features to the server, without Feature objects.
+
+    Each feature is serialized once, and batches are packed on the
+    serialized sizes under the payload size limit. A batch rejected by the
+    server as too large is split in half and sent again. Once all stored,
+    the listeners following the layer's writes are notified with Feature
+    objects keeping the geometries in the GeoJSON format.
+
+    Args:
+        uri (str): Features URI.
+
+        features (list): GeoJSON feature dictionaries.
+
+    Kwargs:
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
+    Returns:
+        list: UUIDs of the features stored, in order.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    if not max_bytes:
+        max_bytes = snowfloat.settings.BATCH_MAX_BYTES
+    layer_uuid = snowfloat.signals.get_layer_uuid(uri)
+    stored = []
+    batch = []
+    batch_size = 0
+    try:
+        for feature in features:
+            data = json.dumps(feature)
+            if batch and (batch_size + len(data) > max_bytes
+                    or len(batch) >= snowfloat.settings.BATCH_MAX_FEATURES):
+                stored.extend(_post_geojson_features(uri, batch))
+                batch = []
+                batch_size = 0
+            batch.append(data)
+            batch_size += len(data) + 1
+        if batch:
+            stored.extend(_post_geojson_features(uri, batch))
+    except snowfloat.errors.RequestError:
+        # previous batches may have been stored
+        snowfloat.signals.send(layer_uuid, 'add')
+        raise
+    res = []
+    for feature, source in zip(features, stored):
+        obj = Feature(feature.get('geometry') or None, fields=dict(
+            (key[6:], val) for key, val in
+            (feature.get('properties') or {}).iteritems()
+            if key.startswith('field_')))
+        update_feature(obj, source)
+        res.append(obj)
+    snowfloat.signals.send(layer_uuid, 'add', res)
+    return [source['id'] for source in stored]
+
+def _post_geojson_features(uri, chunks):
+    """POST a batch of serialized features, splitting it in half if too
+    large.
+
+    Args:
+        uri (str): Features URI.
+
+        chunks (list): JSON serialized GeoJSON features.
+
+    Returns:
+        list: GeoJSON features stored, as returned by the server.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    data = '{"type": "FeatureCollection", "features": [%s]}' % (
+        ', '.join(chunks),)
+    try:
+        res = snowfloat.request.post(uri, data, serialize=False)
+    except snowfloat.errors.RequestError, exception:
+        if exception.status != 413 or len(chunks) < 2:
+            raise
+        middle = len(chunks) // 2
+        return _post_geojson_features(uri, chunks[:middle]) + \
+            _post_geojson_features(uri, chunks[middle:])
+    return res['features']
+
+def _post_features(uri, features):
+    """POST a batch of features, splitting it in half if too large.
+
+    Args:
+        uri (str): Features URI.
+
+        features (list): List of Feature objects.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    try:
+        res = snowfloat.request.post(uri, features,
+            format_func=format_features)
+    except snowfloat.errors.RequestError, exception:
+        if exception.status != 413 or len(features) < 2:
+            raise
+        middle = len(features) // 2
+        _post_features(uri, features[:middle])
+        _post_features(uri, features[middle:])
+        return
+
     # convert list of json features to Feature objects
     for i, feature in enumerate(res['features']):
         update_feature(features[i], feature)
 
-    return features
+def batch_features(features, max_bytes, max_features):
+    """Split features in batches under a serialized size limit.
+
+    A feature larger than the limit gets its own batch.
+
+    Args:
+        features (list): List of Feature objects.
 
-def get_features(uri, **kwargs):
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
+        max_features (int): Maximum number of features per batch.
+
+    Returns:
+        generator. Yields lists of Feature objects.
+    """
+    batch = []
+    batch_size = 0
+    for feature in features:
+        size = estimate_feature_size(feature)
+        if batch and (batch_size + size > max_bytes
+                or len(batch) >= max_features):
+            yield batch
+            batch = []
+            batch_size = 0
+        batch.append(feature)
+        batch_size += size
+    if batch:
+        yield batch
+
+def estimate_feature_size(feature):
+    """Returns an estimate of the feature serialized size.
+
+    The estimate is based on the geometry number of points and the fields
+    sizes, without serializing the feature.
+
+    Args:
+        feature (Feature): Feature object.
+
+    Returns:
+        int: Size in bytes.
+    """
+    size = FEATURE_SIZE
+    if feature.geometry:
+        size += feature.geometry.num_points() * \
+            _get_dims(feature.geometry) * COORDINATE_SIZE
+    for key, val in feature.fields.iteritems():
+        size += FIELD_SIZE + len(key)
+        if isinstance(val, basestring):
+            size += len(val)
+        else:
+            size += COORDINATE_SIZE
+    return size
+
+def _get_dims(geometry):
+    """Returns the number of dimensions of a geometry coordinates.
+
+    Args:
+        geometry (Geometry): Geometry object.
+
+    Returns:
+        int: Number of dimensions.
+    """
+    if geometry.geometry_type == 'GeometryCollection':
+        return max([_get_dims(geom) for geom in geometry.geometries] or [2])
+    coordinates = geometry.coordinates
+    while coordinates and isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return len(coordinates) or 2
+
+def get_features(uri, limit=None, lazy=False, **kwargs):
     """GET features from the server.
 
+    Pages are requested as the features are consumed and released once
+    consumed.
+
     Kwargs:
+        limit (int): Maximum number of features returned. No more pages are
+            requested once reached.
+
+        lazy (bool): Decode the geometries on first access only.
+
+        Same as get_pages.
+
+    Returns:
+        generator. Yield Feature objects.
+    """
+    pages = get_pages(uri, **kwargs)
+    count = 0
+    try:
+        for page in pages:
+            # convert list of json features to Feature objects
+            features = parse_features(page, lazy=lazy)
+            del page
+            for feature in features:
+                if limit is not None and count >= limit:
+                    return
+                yield feature
+                count += 1
+            if limit is not None and count >= limit:
+                return
+    finally:
+        pages.close()
+
+def get_pages(uri, page_size=None, prefetch=0, **kwargs):
+    """GET pages of features from the server.
+
+    Kwargs:
+        page_size (int): Number of features per page.
+
+        prefetch (int): Number of pages fetched ahead in a background thread.
+
+        include_fields (tuple): Names of the fields to return. All by
+            default.
+
+        geometry_format (str): full (default), none, bbox or centroid.
+
         query (str): Distance or spatial query.
         
         geometry (Geometry): Geometry object for query lookup.
@@ -127,10 +397,40 @@ def get_features(uri, **kwargs):
         query_slice (tuple): Tuple to limit entries returned.
 
     Returns:
-        generator. Yield Feature objects.
+        generator. Yields lists of GeoJSON feature dictionaries.
     """
     get_uri = '%s/features' % (uri,)
 
+    params = format_query_params(kwargs)
+    if page_size:
+        params['page_size'] = page_size
+
+    pages = snowfloat.request.get(get_uri, params)
+    if prefetch:
+        pages = snowfloat.request.prefetch(pages, prefetch)
+    include_fields = kwargs.get('include_fields')
+    geometry_format = kwargs.get('geometry_format')
+    project = include_fields is not None or \
+        geometry_format not in (None, 'full')
+    try:
+        for res in pages:
+            page = res['geo']['features']
+            if project:
+                page = project_features(page, include_fields=include_fields,
+                    geometry_format=geometry_format)
+            yield page
+    finally:
+        pages.close()
+
+def format_query_params(kwargs):
+    """Returns the request parameters of a features query.
+
+    Args:
+        kwargs (dict): Query conditions. Same as get_pages.
+
+    Returns:
+        dict: Dictionary of formatted parameters.
+    """
     params = {}
             
     if 'spatial_operation' in kwargs:
@@ -145,28 +445,260 @@ def get_features(uri, **kwargs):
 
     exclude = ('distance', 'geometry')
     params.update(snowfloat.request.format_params(kwargs, exclude=exclude))
-    
-    for res in snowfloat.request.get(get_uri, params):
-        # convert list of json features to Feature objects
-        features = parse_features(res['geo']['features'])
-        for feature in features:
+    return params
+
+def count_features(uri, **kwargs):
+    """Returns the number of features matching conditions.
+
+    Requests a single feature without geometry and reads the total from the
+    response.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        Same conditions as get_pages.
+
+    Returns:
+        int: Number of features.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    params = format_query_params(kwargs)
+    params.update({'slice_start': 0, 'slice_end': 1, 'page_size': 1,
+                   'geometry_format': 'none'})
+    return _get_first_page(uri, params)['total']
+
+def get_layer_version(uri):
+    """Returns the number of features and the last modification date of
+    layer's features.
+
+    Requests the last modified feature without geometry nor fields. The
+    version changes when features are added, updated or deleted.
+
+    Args:
+        uri (str): Layer URI.
+
+    Returns:
+        list: Number of features and last modification date. The date is
+            None if the layer has no features.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    params = format_query_params({'order_by': ('-date_modified',),
+                                  'query_slice': (0, 1),
+                                  'include_fields': (),
+                                  'geometry_format': 'none'})
+    params['page_size'] = 1
+    response = _get_first_page(uri, params)
+    features = response['geo']['features']
+    return [response['total'],
+            features[0]['properties'].get('date_modified') if features
+            else None]
+
+def get_features_keyset(uri, key='date_created', page_size=None, lazy=False,
+        after=None, **kwargs):
+    """GET features from the server by keyset pagination.
+
+    Features are ordered by key then uuid. Each page is requested with
+    conditions on the last feature returned instead of an offset, so deep
+    pages cost the same as the first ones and features added or deleted
+    during the scan do not shift the next pages.
+
+    Features sharing the last key value are fetched first with
+    key_exact=value and uuid_gt=uuid conditions, then the next ones with
+    key_gt=value. The key field is always requested, even if include_fields
+    leaves it out.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        key (str): uuid, feature attribute or field_<name> property to
+            order by.
+
+        page_size (int): Number of features per page.
+
+        lazy (bool): Decode the geometries on first access only.
+
+        after (tuple): Key value and uuid of the feature to resume after.
+
+        Same conditions as get_pages, except conditions on key and uuid,
+        order_by and query_slice.
+
+    Returns:
+        generator. Yields Feature objects.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    for page in get_pages_keyset(uri, key=key, page_size=page_size,
+            after=after, **kwargs):
+        for feature in parse_features(page, lazy=lazy):
             yield feature
 
-def parse_features(features):
+def get_pages_keyset(uri, key='date_created', page_size=None, after=None,
+        **kwargs):
+    """GET pages of features from the server by keyset pagination.
+
+    Same as get_features_keyset, without decoding the features.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        key (str): uuid, feature attribute or field_<name> property to
+            order by.
+
+        page_size (int): Number of features per page.
+
+        after (tuple): Key value and uuid of the feature to resume after.
+
+        Same conditions as get_features_keyset.
+
+    Returns:
+        generator. Yields non empty lists of GeoJSON feature dictionaries.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    page_size = page_size or snowfloat.settings.KEYSET_PAGE_SIZE
+    include_fields = kwargs.get('include_fields')
+    if include_fields is not None and key.startswith('field_') and \
+            key[6:] not in include_fields:
+        kwargs['include_fields'] = tuple(include_fields) + (key[6:],)
+    last = tuple(after) if after is not None else None
+    # features sharing the key value resumed after may remain
+    same_key = last is not None
+    while True:
+        conditions = dict(kwargs)
+        if key == 'uuid':
+            # uuids are unique: no ties to break
+            conditions['order_by'] = ('uuid',)
+            if last is not None:
+                conditions['uuid_gt'] = last[1]
+        elif last is None:
+            conditions['order_by'] = (key, 'uuid')
+        elif same_key:
+            conditions['%s_exact' % (key,)] = last[0]
+            conditions['uuid_gt'] = last[1]
+            conditions['order_by'] = ('uuid',)
+        else:
+            conditions['%s_gt' % (key,)] = last[0]
+            conditions['order_by'] = (key, 'uuid')
+        conditions['query_slice'] = (0, page_size)
+        params = format_query_params(conditions)
+        params['page_size'] = page_size
+        page = _get_first_page(uri, params)['geo']['features']
+        if page:
+            last = (page[-1]['id'] if key == 'uuid' else
+                    page[-1]['properties'][key], page[-1]['id'])
+            yield page
+        if len(page) < page_size:
+            if not same_key or key == 'uuid':
+                return
+            # no more features sharing the last key value
+            same_key = False
+        else:
+            same_key = True
+
+def _get_first_page(uri, params):
+    """GET the first page of features only.
+
+    Args:
+        uri (str): Layer URI.
+
+        params (dict): Request parameters.
+
+    Returns:
+        dict: Server response.
+    """
+    pages = snowfloat.request.get('%s/features' % (uri,), params)
+    try:
+        return next(pages)
+    finally:
+        pages.close()
+
+def project_features(features, include_fields=None, geometry_format=None):
+    """Returns features without the fields and geometry data not requested.
+
+    Applied to the pages returned by servers not supporting projections,
+    before any Feature or Geometry object is built.
+
+    Args:
+        features (list): GeoJSON feature dictionaries, left unchanged.
+
+    Kwargs:
+        include_fields (tuple): Names of the fields to keep. All if None.
+
+        geometry_format (str): full, none, bbox or centroid. The centroid
+            is the mean of the geometry vertices.
+
+    Returns:
+        list: Projected GeoJSON feature dictionaries.
+
+    Raises:
+        ValueError
+    """
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError('Unknown geometry format %r.' % (geometry_format,))
+    if include_fields is not None:
+        keep = set('field_%s' % (name,) for name in include_fields)
+    res = []
+    for feature in features:
+        feature = dict(feature)
+        res.append(feature)
+        if include_fields is not None:
+            feature['properties'] = dict((key, val) for key, val in
+                feature['properties'].iteritems()
+                if not key.startswith('field_') or key in keep)
+        geojson = feature['geometry']
+        if not geojson or geometry_format in (None, 'full'):
+            continue
+        if geometry_format == 'none':
+            feature['geometry'] = None
+            continue
+        if geojson['type'] == 'GeometryCollection':
+            coordinates = [geom['coordinates']
+                for geom in geojson['geometries']]
+        else:
+            coordinates = geojson['coordinates']
+        if geometry_format == 'bbox':
+            extent = snowfloat.geometry.get_extent(coordinates)
+            if extent and geojson['type'] != 'Point':
+                xmin, xmax, ymin, ymax = extent
+                feature['geometry'] = {'type': 'Polygon', 'coordinates': [[
+                    [xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax],
+                    [xmin, ymin]]]}
+        else:
+            centroid = snowfloat.geometry.get_centroid(coordinates)
+            feature['geometry'] = centroid and \
+                {'type': 'Point', 'coordinates': centroid}
+    return res
+
+def parse_features(features, lazy=False):
     """Convert feature dictionaries to Feature objects.
 
     Args:
         features (list): Dictionaries.
 
+    Kwargs:
+        lazy (bool): Keep the geometries in the GeoJSON format until first
+            access.
+
     Returns:
         list: List of Feature objects.
     """
     res = []
     for feature in features:
-        if feature['geometry']:
-            geometry = get_geometry_from_geojson(feature['geometry'])
-        else:
+        if not feature['geometry']:
             geometry = None
+        elif lazy:
+            geometry = feature['geometry']
+        else:
+            geometry = get_geometry_from_geojson(feature['geometry'])
 
         feature_to_add = Feature(
             geometry,
@@ -0,0 +1,256 @@
+"""Local evaluation of the features query conditions."""
+
+import operator
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+import snowfloat.columnar
+import snowfloat.index
+
+ATTRIBUTES = ('uuid', 'uri', 'date_created', 'date_modified', 'layer_uuid')
+
+# arguments ignored as they only control the paging or the payload
+PAGING_ARGUMENTS = ('page_size', 'prefetch', 'limit', 'lazy',
+                    'include_fields', 'geometry_format')
+
+def _compare(func):
+    """Returns a lookup false for missing values."""
+    return lambda val, arg: val is not None and func(val, arg)
+
+def _text(func):
+    """Returns a case-insensitive text lookup false for missing values."""
+    return lambda val, arg: val is not None and \
+        func(unicode(val).lower(), unicode(arg).lower())
+
+LOOKUPS = {
+    'exact': lambda val, arg: val is None if arg is None else val == arg,
+    'iexact': _text(operator.eq),
+    'contains': _compare(lambda val, arg: arg in val),
+    'icontains': _text(lambda val, arg: arg in val),
+    'startswith': _compare(lambda val, arg: val.startswith(arg)),
+    'istartswith': _text(lambda val, arg: val.startswith(arg)),
+    'endswith': _compare(lambda val, arg: val.endswith(arg)),
+    'iendswith': _text(lambda val, arg: val.endswith(arg)),
+    'gt': _compare(operator.gt),
+    'gte': _compare(operator.ge),
+    'lt': _compare(operator.lt),
+    'lte': _compare(operator.le),
+    'in': _compare(lambda val, arg: val in arg),
+    'range': _compare(lambda val, arg: arg[0] <= val <= arg[1]),
+    'isnull': lambda val, arg: (val is None) == bool(arg)}
+
+NUMPY_LOOKUPS = {'exact': 'equal', 'gt': 'greater', 'gte': 'greater_equal',
+                 'lt': 'less', 'lte': 'less_equal'}
+
+class Filter(object):
+    """Query conditions compiled to run on local features.
+
+    Takes the keyword arguments of Layer.get_features: attributes and fields
+    conditions like field_ts_gte=5 or uuid_in=(...), the query, geometry and
+    distance spatial conditions, order_by and query_slice. Missing values
+    match no condition but isnull and exact None, and are sorted last in
+    ascending order, like on the server. Distances are in meters, like on
+    the server, and are only evaluated on longitudes and latitudes.
+
+    Attributes:
+        conditions (list): List of (attribute, lookup, argument) tuples.
+            Attribute is a feature attribute or field_<name>.
+
+        spatial (tuple): (query, geometry, distance) or None.
+
+        order_by (tuple): Attributes and fields to order by.
+
+        query_slice (tuple): Slice of the ordered features returned.
+
+        geodesic (bool): Coordinates are longitudes and latitudes.
+    """
+
+    def __init__(self, geodesic=False, **kwargs):
+        self.conditions = []
+        self.geodesic = geodesic
+        self.spatial = None
+        self._shape = None
+        self.order_by = tuple(kwargs.pop('order_by', ()))
+        self.query_slice = kwargs.pop('query_slice', None)
+        if 'query' in kwargs:
+            self.spatial = (kwargs.pop('query'), kwargs.pop('geometry'),
+                            kwargs.pop('distance', None))
+            _check_spatial_query(self.spatial[0])
+            if self.spatial[0] in snowfloat.index.DISTANCE_QUERIES:
+                snowfloat.index.check_distance_query(self.spatial[0],
+                    self.spatial[2], geodesic)
+            self._shape = snowfloat.index.to_shape(self.spatial[1])
+        for key, val in kwargs.iteritems():
+            if key in PAGING_ARGUMENTS:
+                continue
+            if key.startswith('spatial_'):
+                raise ValueError('Spatial operations are not evaluated '
+                    'locally: %s.' % (key,))
+            try:
+                attribute, lookup = key.rsplit('_', 1)
+            except ValueError:
+                raise ValueError('Invalid condition %s.' % (key,))
+            if lookup not in LOOKUPS:
+                raise ValueError('Unknown lookup %s in %s.' % (lookup, key))
+            if not attribute.startswith('field_') and \
+                    attribute not in ATTRIBUTES:
+                raise ValueError('Unknown attribute %s in %s.'
+                    % (attribute, key))
+            self.conditions.append((attribute, lookup, val))
+        for key in self.order_by:
+            attribute = key.lstrip('-')
+            if not attribute.startswith('field_') and \
+                    attribute not in ATTRIBUTES:
+                raise ValueError('Unknown order by attribute %s.' % (key,))
+
+    def matches(self, feature):
+        """Returns True if a feature matches the conditions.
+
+        Args:
+            feature (Feature): Feature object.
+
+        Returns:
+            bool: True if the feature matches.
+        """
+        for attribute, lookup, arg in self.conditions:
+            if not LOOKUPS[lookup](_get_value(feature, attribute), arg):
+                return False
+        if self.spatial:
+            if feature.geometry is None:
+                return False
+            return self._match_spatial(
+                snowfloat.index.to_shape(feature.geometry))
+        return True
+
+    def apply(self, features):
+        """Returns the features matching the conditions, ordered and sliced.
+
+        Args:
+            features: Iterable of Feature objects.
+
+        Returns:
+            list: List of Feature objects.
+        """
+        res = [feature for feature in features if self.matches(feature)]
+        for key in reversed(self.order_by):
+            attribute = key.lstrip('-')
+            res.sort(key=lambda feature: _sort_key(
+                _get_value(feature, attribute)), reverse=key[0] == '-')
+        return self._slice(res)
+
+    def apply_batch(self, batch):
+        """Returns the rows of a batch matching the conditions.
+
+        Conditions on numeric columns are evaluated on the arrays.
+
+        Args:
+            batch (FeatureBatch): Features batch.
+
+        Returns:
+            numpy.ndarray: Row indexes, ordered and sliced.
+        """
+        mask = numpy.ones(len(batch), dtype=numpy.bool_)
+        for attribute, lookup, arg in self.conditions:
+            column = _get_column(batch, attribute)
+            if column is not None and column.dtype.kind == 'M':
+                arg = _to_datetime(lookup, arg)
+            if column is None:
+                mask &= LOOKUPS[lookup](None, arg)
+            elif column.dtype != object and lookup in NUMPY_LOOKUPS and \
+                    arg is not None and not isinstance(arg, basestring):
+                # NaN compares false, like missing values
+                with numpy.errstate(invalid='ignore'):
+                    mask &= getattr(numpy, NUMPY_LOOKUPS[lookup])(column, arg)
+            else:
+                func = LOOKUPS[lookup]
+                values = column.tolist()
+                if column.dtype.kind == 'f':
+                    values = [None if val != val else val for val in values]
+                mask &= numpy.array([func(val, arg) for val in values],
+                                    dtype=numpy.bool_)
+        rows = numpy.nonzero(mask)[0]
+        if self.spatial:
+            rows = numpy.array([row for row in rows.tolist()
+                if batch.geometry_types[row] and self._match_spatial(
+                    _get_batch_shape(batch, row))], dtype=numpy.int64)
+        for key in reversed(self.order_by):
+            column = _get_column(batch, key.lstrip('-'))
+            if column is None:
+                continue
+            values = column[rows].tolist()
+            if column.dtype.kind == 'f':
+                values = [None if val != val else val for val in values]
+            order = sorted(xrange(len(rows)),
+                key=lambda i: _sort_key(values[i]), reverse=key[0] == '-')
+            rows = rows[order]
+        return self._slice(rows)
+
+    def _match_spatial(self, shape):
+        """Returns True if a shapely geometry matches the spatial condition.
+
+        Args:
+            shape (BaseGeometry): Feature shapely geometry.
+
+        Returns:
+            bool: True if the geometry matches.
+        """
+        query, _, distance = self.spatial
+        if query in snowfloat.index.PREDICATES:
+            return getattr(shape, query)(self._shape)
+        return snowfloat.index.DISTANCE_QUERIES[query](
+            snowfloat.index.get_distance(shape, self._shape), distance)
+
+    def _slice(self, res):
+        """Returns the query slice of ordered results."""
+        if not self.query_slice:
+            return res
+        if len(self.query_slice) == 2:
+            return res[self.query_slice[0]:self.query_slice[1]]
+        return res[self.query_slice[0]:]
+
+
+def _sort_key(val):
+    """Returns a sort key putting missing values last in ascending order."""
+    return (val is None, val)
+
+def _get_value(feature, attribute):
+    """Returns a feature's attribute or field value."""
+    if attribute.startswith('field_'):
+        return feature.fields.get(attribute[6:])
+    return getattr(feature, attribute)
+
+def _get_column(batch, attribute):
+    """Returns a batch attribute or field column. None if missing."""
+    if attribute.startswith('field_'):
+        return batch.fields.get(attribute[6:])
+    if attribute == 'layer_uuid':
+        return snowfloat.columnar.make_column([uri.split('/')[4] if uri
+            else None for uri in batch.uris.tolist()])
+    return {'uuid': batch.uuids, 'uri': batch.uris,
+            'date_created': batch.date_created,
+            'date_modified': batch.date_modified}[attribute]
+
+def _to_datetime(lookup, arg):
+    """Returns a date condition argument as datetime objects, compared
+    with the values of a datetime64 column."""
+    if lookup == 'isnull' or arg is None:
+        return arg
+    if lookup in ('in', 'range'):
+        return [_to_datetime('exact', val) for val in arg]
+    try:
+        return snowfloat.columnar.to_datetime64(arg).tolist()
+    except (TypeError, ValueError):
+        return arg
+
+def _get_batch_shape(batch, row):
+    """Returns the shapely geometry of a batch row."""
+    return snowfloat.index.shapely.geometry.shape(batch.get_geojson(row))
+
+def _check_spatial_query(query):
+    """Raise ValueError if a spatial query is unknown."""
+    if query not in snowfloat.index.PREDICATES and \
+            query not in snowfloat.index.DISTANCE_QUERIES:
+        raise ValueError('Unknown spatial query %r.' % (query,))
@@ -24,7 +24,7 @@ class Geometry(object):
         
     """
 
-    coordinates = None
+    __slots__ = ('coordinates',)
     geometry_type = None
 
     def __init__(self, coordinates):
@@ -42,12 +42,21 @@ class Geometry(object):
         """Returns the geometry number of points."""
         raise NotImplementedError()
 
+    def extent(self):
+        """Returns the geometry spatial extent.
+
+        Returns:
+            list: Spatial extent list. (xmin, xmax, ymin, ymax).
+        """
+        return get_extent(self.coordinates)
+
 
 # pylint: disable=W0223
 class Point(Geometry, POINT_CLS):
     """Geometry Point.
     """
 
+    __slots__ = ()
     geometry_type = 'Point'
 
     def __init__(self, coordinates):
@@ -66,8 +75,8 @@ class LineString(Geometry, LINESTRING_CLS):
     """Geometry LineString.
     """
 
+    __slots__ = ('points',)
     geometry_type = 'LineString'
-    points = None
 
     def __init__(self, coordinates):
         coords = coordinates[:]
@@ -85,6 +94,7 @@ class LineString(Geometry, LINESTRING_CLS):
 class Polygon(Geometry, POLYGON_CLS):
     """Geometry Polygon."""
 
+    __slots__ = ()
     geometry_type = 'Polygon'
 
     def __init__(self, coordinates):
@@ -106,8 +116,8 @@ class Polygon(Geometry, POLYGON_CLS):
 class MultiPoint(Geometry, MULTIPOINT_CLS):
     """Geometry MultiPoint."""
 
+    __slots__ = ('points',)
     geometry_type = 'MultiPoint'
-    points = None
 
     def __init__(self, coordinates):
         coords = coordinates[:]
@@ -125,8 +135,8 @@ class MultiPoint(Geometry, MULTIPOINT_CLS):
 class MultiPolygon(Geometry, MULTIPOLYGON_CLS):
     """Geometry MultiPolygon."""
 
+    __slots__ = ('polygons',)
     geometry_type = 'MultiPolygon'
-    polygons = None
 
     def __init__(self, coordinates):
         coords = coordinates[:]
@@ -143,8 +153,8 @@ class MultiPolygon(Geometry, MULTIPOLYGON_CLS):
 class MultiLineString(Geometry, MULTILINESTRING_CLS):
     """Geometry MultiLineString."""
 
+    __slots__ = ('linestrings',)
     geometry_type = 'MultiLineString'
-    linestrings = None
 
     def __init__(self, coordinates):
         coords = coordinates[:]
@@ -162,8 +172,8 @@ class MultiLineString(Geometry, MULTILINESTRING_CLS):
 class GeometryCollection(Geometry):
     """Geometry Collection."""
 
+    __slots__ = ('geometries',)
     geometry_type = 'GeometryCollection'
-    geometries = None
 
     def __init__(self, geometries):
         self.geometries = geometries
@@ -172,3 +182,119 @@ class GeometryCollection(Geometry):
     def num_points(self):
         """Returns the number of points defining this collection."""
         return sum([e.num_points() for e in self.geometries])
+
+    def extent(self):
+        """Returns the collection spatial extent.
+
+        Returns:
+            list: Spatial extent list. (xmin, xmax, ymin, ymax).
+        """
+        extents = [e.extent() for e in self.geometries]
+        extents = [e for e in extents if e]
+        if not extents:
+            return None
+        return [min([e[0] for e in extents]), max([e[1] for e in extents]),
+                min([e[2] for e in extents]), max([e[3] for e in extents])]
+
+
+def get_extent(coordinates):
+    """Returns the spatial extent of GeoJSON coordinates.
+
+    Args:
+        coordinates (list): Coordinates of any nesting depth.
+
+    Returns:
+        list: Spatial extent list. (xmin, xmax, ymin, ymax). None if there
+            are no coordinates.
+    """
+    xmin = ymin = float('inf')
+    xmax = ymax = float('-inf')
+    stack = [coordinates]
+    while stack:
+        coords = stack.pop()
+        if not coords:
+            continue
+        if isinstance(coords[0], (list, tuple)):
+            stack.extend(coords)
+            continue
+        xmin = min(xmin, coords[0])
+        xmax = max(xmax, coords[0])
+        ymin = min(ymin, coords[1])
+        ymax = max(ymax, coords[1])
+    if xmin > xmax:
+        return None
+    return [xmin, xmax, ymin, ymax]
+
+
+def get_geojson_extent(geojson):
+    """Returns the spatial extent of a GeoJSON geometry.
+
+    Args:
+        geojson (dict): GeoJSON geometry dictionary or None.
+
+    Returns:
+        list: Spatial extent list. (xmin, xmax, ymin, ymax). None if empty.
+    """
+    if not geojson:
+        return None
+    if geojson['type'] == 'GeometryCollection':
+        return get_extent(
+            [geom['coordinates'] for geom in geojson['geometries']])
+    return get_extent(geojson['coordinates'])
+
+
+def get_geojson_num_points(geojson):
+    """Returns the number of points of a GeoJSON geometry.
+
+    Counted like Geometry.num_points: the points of a polygon are the
+    points of its exterior ring.
+
+    Args:
+        geojson (dict): GeoJSON geometry dictionary or None.
+
+    Returns:
+        int: Number of points.
+    """
+    if not geojson:
+        return 0
+    geometry_type = geojson['type']
+    if geometry_type == 'GeometryCollection':
+        return sum([get_geojson_num_points(geom)
+                    for geom in geojson['geometries']])
+    coordinates = geojson['coordinates']
+    if geometry_type == 'Point':
+        return 1
+    if geometry_type == 'Polygon':
+        return len(coordinates[0]) if coordinates else 0
+    if geometry_type == 'MultiPolygon':
+        return sum([len(polygon[0]) for polygon in coordinates if polygon])
+    if geometry_type == 'MultiLineString':
+        return sum([len(line) for line in coordinates])
+    return len(coordinates)
+
+
+def get_centroid(coordinates):
+    """Returns the mean of GeoJSON coordinates vertices.
+
+    Args:
+        coordinates (list): Coordinates of any nesting depth.
+
+    Returns:
+        list: Centroid coordinates (x, y). None if there are no coordinates.
+    """
+    x_sum = y_sum = 0.0
+    count = 0
+    stack = [coordinates]
+    while stack:
+        coords = stack.pop()
+        if not coords:
+            continue
+        if isinstance(coords[0], (list, tuple)):
+            stack.extend(coords)
+            continue
+        x_sum += coords[0]
+        y_sum += coords[1]
+        count += 1
+    if not count:
+        return None
+    return [x_sum / count, y_sum / count]
@@ -0,0 +1,393 @@
+"""Grid index of point features for nearest neighbour and distance queries."""
+
+import math
+import threading
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+import snowfloat.errors
+import snowfloat.settings
+import snowfloat.signals
+
+EARTH_RADIUS = 6371008.8
+
+# cell keys are cx * CELL_KEY_FACTOR + cy + CELL_KEY_OFFSET
+CELL_KEY_FACTOR = 2 ** 31
+CELL_KEY_OFFSET = 2 ** 30
+
+# above this number of grid columns, queries scan all the points
+MAX_COLUMNS = 1024
+
+MIN_REBUILD_CHANGES = 1024
+
+# initial size of the array of the points inserted after the build
+MIN_PENDING_SIZE = 64
+
+class PointGrid(object):
+    """Uniform grid of point features.
+
+    Coordinates are kept in numpy arrays sorted by grid cell: a query finds
+    the cells around its point with binary searches, then computes the
+    distances of all the candidates at once. Distances are in the
+    coordinates units, or haversine meters for longitude and latitude
+    coordinates when geodesic is set.
+
+    Points inserted after the build are appended to an array, doubled when
+    full, scanned on each query and deleted points are masked, until enough
+    changes trigger a rebuild. Features whose geometry is not a Point are skipped.
+
+    Given a layer uuid, the grid follows the features added, updated and
+    deleted through the client. Writes it can not follow, like deletes by
+    conditions, set its stale attribute. Thread-safe.
+
+    Attributes:
+        cell_size (float): Grid cell side. Computed from the points extent
+            when not set.
+
+        geodesic (bool): Coordinates are longitudes and latitudes in
+            degrees.
+
+        layer_uuid (str): Layer's UUID the grid follows the writes of.
+
+        stale (bool): True once the layer was written in a way the grid
+            could not follow.
+    """
+
+    def __init__(self, features=(), cell_size=None, geodesic=False,
+            layer_uuid=None):
+        if numpy is None: # pragma: no cover
+            raise snowfloat.errors.Error('numpy is required for point grids.')
+        self.cell_size = cell_size
+        self._auto_cell_size = not cell_size
+        self.geodesic = geodesic
+        self.layer_uuid = layer_uuid
+        self.stale = False
+        self._lock = threading.Lock()
+        self._features = []
+        self._ids = {}
+        self._xy = numpy.zeros((0, 2))
+        self._keys = numpy.zeros(0, dtype=numpy.int64)
+        self._alive = numpy.zeros(0, dtype=numpy.bool_)
+        self._pending = numpy.zeros((0, 2))
+        self._pending_alive = numpy.zeros(0, dtype=numpy.bool_)
+        self._num_pending = 0
+        self._deleted = 0
+        self._bounds = None
+        for feature in features:
+            self._add(feature)
+        self._build()
+        if layer_uuid is not None:
+            snowfloat.signals.connect(self._on_write)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def insert(self, feature):
+        """Add a point feature to the grid.
+
+        Args:
+            feature (Feature): Feature object.
+
+        Returns:
+            bool: False if the feature geometry is not a Point.
+        """
+        with self._lock:
+            added = self._add(feature)
+            self._maybe_build()
+        return added
+
+    def delete(self, uuid):
+        """Remove a feature from the grid.
+
+        Args:
+            uuid (str): Feature's uuid.
+
+        Raises:
+            KeyError
+        """
+        with self._lock:
+            self._delete(uuid)
+            self._maybe_build()
+
+    def nearest(self, point, k=1, max_distance=None):
+        """Returns the k nearest features of a point.
+
+        The search area grows from one cell until it holds k features.
+
+        Args:
+            point: Point geometry or [x, y] coordinates.
+
+        Kwargs:
+            k (int): Number of features.
+
+            max_distance (float): Maximum distance.
+
+        Returns:
+            list: List of (Feature, distance) tuples, nearest first.
+        """
+        x, y = _get_xy(point)
+        with self._lock:
+            radius = self.cell_size
+            if self.geodesic:
+                radius = math.radians(radius) * EARTH_RADIUS
+            while True:
+                if max_distance is not None:
+                    radius = min(radius, max_distance)
+                positions, distances = self._search(x, y, radius)
+                # points in the search area but out of the radius could be
+                # farther than points out of the search area
+                found = numpy.count_nonzero(distances <= radius)
+                if found >= k or radius == max_distance or \
+                        self._covers_all(x, y, radius):
+                    break
+                radius *= 2
+            if max_distance is not None:
+                inside = distances <= max_distance
+                positions = positions[inside]
+                distances = distances[inside]
+            if len(distances) > k:
+                top = numpy.argpartition(distances, k - 1)[:k]
+                positions = positions[top]
+                distances = distances[top]
+            order = numpy.argsort(distances, kind='mergesort')
+            return [(self._features[i], d) for i, d in zip(
+                positions[order].tolist(), distances[order].tolist())]
+
+    def within(self, point, distance):
+        """Returns the features within a distance of a point.
+
+        Args:
+            point: Point geometry or [x, y] coordinates.
+
+            distance (float): Maximum distance.
+
+        Returns:
+            list: List of (Feature, distance) tuples, nearest first.
+        """
+        x, y = _get_xy(point)
+        with self._lock:
+            positions, distances = self._search(x, y, distance)
+            inside = distances <= distance
+            positions = positions[inside]
+            distances = distances[inside]
+            order = numpy.argsort(distances, kind='mergesort')
+            return [(self._features[i], d) for i, d in zip(
+                positions[order].tolist(), distances[order].tolist())]
+
+    def close(self):
+        """Stop following the layer's writes."""
+        snowfloat.signals.disconnect(self._on_write)
+
+    def _add(self, feature):
+        """Store a point feature, replacing the feature with the same uuid.
+        Called with the lock held."""
+        if feature.uuid in self._ids:
+            self._delete(feature.uuid)
+        geometry = feature.geometry
+        if geometry is None or geometry.geometry_type != 'Point':
+            return False
+        if feature.uuid is not None:
+            self._ids[feature.uuid] = len(self._features)
+        self._features.append(feature)
+        x, y = _get_xy(geometry)
+        if self._num_pending == len(self._pending):
+            size = max(MIN_PENDING_SIZE, 2 * len(self._pending))
+            pending = numpy.zeros((size, 2))
+            pending[:self._num_pending] = self._pending
+            pending_alive = numpy.zeros(size, dtype=numpy.bool_)
+            pending_alive[:self._num_pending] = self._pending_alive
+            self._pending = pending
+            self._pending_alive = pending_alive
+        self._pending[self._num_pending] = (x, y)
+        self._pending_alive[self._num_pending] = True
+        self._num_pending += 1
+        if self._bounds is None:
+            self._bounds = [x, x, y, y]
+        else:
+            self._bounds = [min(self._bounds[0], x), max(self._bounds[1], x),
+                            min(self._bounds[2], y), max(self._bounds[3], y)]
+        return True
+
+    def _delete(self, uuid):
+        """Mask a feature. Called with the lock held."""
+        position = self._ids.pop(uuid)
+        self._features[position] = None
+        if position < len(self._alive):
+            self._alive[position] = False
+        else:
+            self._pending_alive[position - len(self._alive)] = False
+        self._deleted += 1
+
+    def _maybe_build(self):
+        """Rebuild the grid once the changes are a fraction of it."""
+        if self._num_pending + self._deleted > \
+                max(MIN_REBUILD_CHANGES, len(self._keys) // 4):
+            self._build()
+
+    def _build(self):
+        """Sort the points by grid cell. Called with the lock held."""
+        packed = len(self._alive)
+        features = [feature for feature in self._features[:packed]
+                    if feature is not None]
+        features.extend(feature for feature in self._features[packed:]
+                        if feature is not None)
+        xy = numpy.concatenate([self._xy[self._alive],
+            self._pending[:self._num_pending][
+                self._pending_alive[:self._num_pending]]])
+        if self._auto_cell_size:
+            self.cell_size = _get_cell_size(xy)
+        keys = self._get_keys(xy[:, 0], xy[:, 1])
+        order = numpy.argsort(keys, kind='mergesort')
+        self._xy = xy[order]
+        self._keys = keys[order]
+        self._alive = numpy.ones(len(order), dtype=numpy.bool_)
+        self._features = [features[i] for i in order.tolist()]
+        self._ids = dict((feature.uuid, i)
+                         for i, feature in enumerate(self._features)
+                         if feature.uuid is not None)
+        self._pending = numpy.zeros((0, 2))
+        self._pending_alive = numpy.zeros(0, dtype=numpy.bool_)
+        self._num_pending = 0
+        self._deleted = 0
+        self._bounds = None
+        if len(xy):
+            self._bounds = [xy[:, 0].min(), xy[:, 0].max(),
+                            xy[:, 1].min(), xy[:, 1].max()]
+
+    def _get_cells(self, values):
+        """Returns the cell indexes of a coordinates array."""
+        limit = CELL_KEY_OFFSET - 1
+        return numpy.clip(numpy.floor(values / self.cell_size), -limit,
+            limit).astype(numpy.int64)
+
+    def _get_keys(self, x, y):
+        """Returns the cell keys of coordinates arrays."""
+        return self._get_cells(x) * CELL_KEY_FACTOR + self._get_cells(y) + \
+            CELL_KEY_OFFSET
+
+    def _search(self, x, y, radius):
+        """Returns the positions and distances of the points in the cells
+        around a point. Called with the lock held.
+
+        Args:
+            x (float): Point x.
+
+            y (float): Point y.
+
+            radius (float): Search radius.
+
+        Returns:
+            tuple: Positions and distances arrays.
+        """
+        extent = self._get_search_extent(x, y, radius)
+        packed = len(self._keys)
+        if extent is None:
+            positions = numpy.arange(packed)
+        else:
+            cx_1, cx_2 = self._get_cells(numpy.array(extent[:2])).tolist()
+            cy_1, cy_2 = self._get_cells(numpy.array(extent[2:])).tolist()
+            if cx_2 - cx_1 >= MAX_COLUMNS:
+                positions = numpy.arange(packed)
+            else:
+                columns = numpy.arange(cx_1, cx_2 + 1, dtype=numpy.int64) * \
+                    CELL_KEY_FACTOR + CELL_KEY_OFFSET
+                starts = numpy.searchsorted(self._keys, columns + cy_1)
+                ends = numpy.searchsorted(self._keys, columns + cy_2,
+                    side='right')
+                ranges = [numpy.arange(start, end) for start, end in zip(
+                    starts.tolist(), ends.tolist()) if end > start]
+                positions = numpy.concatenate(ranges) if ranges else \
+                    numpy.zeros(0, dtype=numpy.int64)
+        positions = positions[self._alive[positions]]
+        xy = self._xy[positions]
+        if self._num_pending:
+            pending = numpy.nonzero(
+                self._pending_alive[:self._num_pending])[0]
+            positions = numpy.concatenate([positions, pending + packed])
+            xy = numpy.concatenate([xy, self._pending[pending]])
+        return positions, self._get_distances(xy, x, y)
+
+    def _get_distances(self, xy, x, y):
+        """Returns the distances of coordinates to a point."""
+        if not self.geodesic:
+            return numpy.hypot(xy[:, 0] - x, xy[:, 1] - y)
+        lon = numpy.radians(xy[:, 0])
+        lat = numpy.radians(xy[:, 1])
+        lon_0 = math.radians(x)
+        lat_0 = math.radians(y)
+        hav = numpy.sin((lat - lat_0) / 2) ** 2 + numpy.cos(lat) * \
+            math.cos(lat_0) * numpy.sin((lon - lon_0) / 2) ** 2
+        return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(
+            numpy.minimum(hav, 1.0)))
+
+    def _get_search_extent(self, x, y, radius):
+        """Returns the extent holding the points within a radius.
+
+        Returns:
+            list: Spatial extent. (xmin, xmax, ymin, ymax). None to search
+                everything: geodesic circles over a pole or the
+                antimeridian.
+        """
+        if not self.geodesic:
+            return [x - radius, x + radius, y - radius, y + radius]
+        angle = radius / EARTH_RADIUS
+        dlat = math.degrees(angle)
+        if angle >= math.pi / 2 or y - dlat <= -90 or y + dlat >= 90:
+            return None
+        # widest longitude span of a spherical cap
+        dlon = math.degrees(math.asin(min(math.sin(angle) /
+            math.cos(math.radians(y)), 1.0)))
+        if x - dlon < -180 or x + dlon > 180:
+            return None
+        return [x - dlon, x + dlon, y - dlat, y + dlat]
+
+    def _covers_all(self, x, y, radius):
+        """Returns True if a search holds all the points."""
+        extent = self._get_search_extent(x, y, radius)
+        bounds = self._bounds
+        return extent is None or bounds is None or (
+            extent[0] <= bounds[0] and extent[1] >= bounds[1] and
+            extent[2] <= bounds[2] and extent[3] >= bounds[3])
+
+    def _on_write(self, layer_uuid, action, features):
+        """Signal listener applying the layer's writes."""
+        if layer_uuid is not None and layer_uuid != self.layer_uuid:
+            return
+        if features is None or action == 'layer':
+            self.stale = True
+            return
+        with self._lock:
+            for feature in features:
+                if action == 'delete':
+                    if feature in self._ids:
+                        self._delete(feature)
+                elif feature.uuid is not None:
+                    self._add(feature)
+            self._maybe_build()
+
+
+def _get_xy(point):
+    """Returns the x and y of a Point geometry or coordinates."""
+    coordinates = getattr(point, 'coordinates', point)
+    return float(coordinates[0]), float(coordinates[1])
+
+def _get_cell_size(xy):
+    """Returns a cell size giving a few points per cell.
+
+    Args:
+        xy (numpy.ndarray): Coordinates array.
+
+    Returns:
+        float: Cell side.
+    """
+    if len(xy) < 2:
+        return 1.0
+    width = xy[:, 0].max() - xy[:, 0].min()
+    height = xy[:, 1].max() - xy[:, 1].min()
+    area = max(width, height) ** 2
+    size = math.sqrt(area * snowfloat.settings.POINT_GRID_POINTS_PER_CELL /
+        len(xy))
+    return size or 1.0
@@ -0,0 +1,416 @@
+"""In-memory R-tree spatial index of features."""
+
+import math
+import time
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+try:
+    import shapely.geometry
+    import shapely.geometry.base
+    import shapely.ops
+except ImportError: # pragma: no cover
+    shapely = None
+
+import snowfloat.columnar
+import snowfloat.errors
+import snowfloat.grid
+import snowfloat.settings
+
+PREDICATES = ('intersects', 'contains', 'within', 'disjoint', 'overlaps',
+              'touches', 'crosses', 'equals')
+
+DISTANCE_QUERIES = {'distance_lt': lambda d, v: d < v,
+                    'distance_lte': lambda d, v: d <= v,
+                    'distance_gt': lambda d, v: d > v,
+                    'distance_gte': lambda d, v: d >= v,
+                    'dwithin': lambda d, v: d <= v}
+
+class SpatialIndex(object):
+    """R-tree of features bounding boxes.
+
+    The tree is packed in bulk with the Sort-Tile-Recursive algorithm.
+    Features inserted afterwards are kept in a list scanned on each query
+    and deleted features are skipped, until enough changes trigger a
+    repack.
+
+    Queries take the query, geometry and distance arguments of
+    Layer.get_features: bounding boxes prefilter the candidates, then the
+    exact predicate is evaluated with shapely. Distances are in meters like
+    on the server, so distance queries require longitude and latitude
+    coordinates: see get_distance.
+
+    Built from an iterable of Feature objects or a FeatureBatch, whose
+    extents are computed on the coordinates arrays.
+
+    Attributes:
+        node_capacity (int): Maximum number of children per node.
+
+        geodesic (bool): Coordinates are longitudes and latitudes in
+            degrees.
+    """
+
+    def __init__(self, features=(), node_capacity=None, geodesic=False):
+        self.node_capacity = node_capacity or \
+            snowfloat.settings.SPATIAL_INDEX_NODE_CAPACITY
+        self.geodesic = geodesic
+        self._features = {}
+        self._ids = {}
+        self._extents = {}
+        self._next_id = 0
+        self._root = None
+        self._packed = 0
+        self._pending = []
+        self._deleted = set()
+        self._stats = {'queries': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                       'candidates': 0, 'results': 0}
+        if isinstance(features, snowfloat.columnar.FeatureBatch):
+            extents = get_batch_extents(features)
+            for i in xrange(len(features)):
+                self._add(features.get_feature(i), extents[i])
+        else:
+            for feature in features:
+                self._add(feature, _get_feature_extent(feature))
+        self._pack()
+
+    def __len__(self):
+        return len(self._features)
+
+    def insert(self, feature):
+        """Add a feature to the index, replacing the feature with the same
+        uuid.
+
+        Args:
+            feature (Feature): Feature object.
+        """
+        item_id = self._add(feature, _get_feature_extent(feature))
+        if item_id in self._extents:
+            self._pending.append(item_id)
+            self._maybe_pack()
+
+    def delete(self, uuid):
+        """Remove a feature from the index.
+
+        Args:
+            uuid (str): Feature's uuid.
+
+        Raises:
+            KeyError
+        """
+        self._delete(uuid)
+        self._maybe_pack()
+
+    def search(self, extent):
+        """Returns the features whose bounding box intersects an extent.
+
+        Args:
+            extent (list): Spatial extent. (xmin, xmax, ymin, ymax).
+
+        Returns:
+            list: List of Feature objects.
+        """
+        return [self._features[item_id] for item_id in self._search(extent)]
+
+    def query(self, query, geometry, distance=None):
+        """Returns the features matching a spatial query.
+
+        Args:
+            query (str): Predicate: intersects, contains, within, disjoint,
+                overlaps, touches, crosses or equals, applied as
+                feature_geometry.predicate(geometry). Or distance query:
+                distance_lt, distance_lte, distance_gt, distance_gte or
+                dwithin.
+
+            geometry (Geometry): Query geometry.
+
+        Kwargs:
+            distance (float): Distance in meters for distance queries.
+
+        Returns:
+            list: List of Feature objects, in insertion order.
+
+        Raises:
+            snowfloat.errors.Error, ValueError
+        """
+        if shapely is None: # pragma: no cover
+            raise snowfloat.errors.Error(
+                'shapely is required for spatial queries.')
+        start = time.time()
+        query_shape = to_shape(geometry)
+        extent = geometry.extent()
+        if query in PREDICATES:
+            if query == 'disjoint':
+                candidates = self._features.keys()
+            else:
+                candidates = self._search(extent)
+            matches = lambda shape: getattr(shape, query)(query_shape)
+        elif query in DISTANCE_QUERIES:
+            check_distance_query(query, distance, self.geodesic)
+            compare = DISTANCE_QUERIES[query]
+            search_extent = get_distance_extent(extent, distance)
+            if query in ('distance_gt', 'distance_gte') or \
+                    search_extent is None:
+                candidates = self._features.keys()
+            else:
+                candidates = self._search(search_extent)
+            matches = lambda shape: compare(get_distance(shape, query_shape),
+                distance)
+        else:
+            raise ValueError('Unknown spatial query %r.' % (query,))
+        res = []
+        for item_id in sorted(candidates):
+            feature = self._features[item_id]
+            if feature.geometry is not None and \
+                    matches(to_shape(feature.geometry)):
+                res.append(feature)
+        seconds = time.time() - start
+        self._stats['queries'] += 1
+        self._stats['seconds'] += seconds
+        self._stats['max_seconds'] = max(self._stats['max_seconds'], seconds)
+        self._stats['candidates'] += len(candidates)
+        self._stats['results'] += len(res)
+        return res
+
+    def stats(self):
+        """Returns the queries statistics.
+
+        Returns:
+            dict: queries, seconds, mean_seconds, max_seconds, candidates
+                and results counts.
+        """
+        stats = dict(self._stats)
+        stats['mean_seconds'] = \
+            stats['seconds'] / stats['queries'] if stats['queries'] else 0.0
+        return stats
+
+    def _add(self, feature, extent):
+        """Store a feature and its extent, replacing the feature with the
+        same uuid. Returns the feature id."""
+        if feature.uuid in self._ids:
+            self._delete(feature.uuid)
+        item_id = self._next_id
+        self._next_id += 1
+        self._features[item_id] = feature
+        if feature.uuid is not None:
+            self._ids[feature.uuid] = item_id
+        if extent:
+            self._extents[item_id] = extent
+        return item_id
+
+    def _delete(self, uuid):
+        """Remove a feature, masked in the tree until the next pack."""
+        item_id = self._ids.pop(uuid)
+        del self._features[item_id]
+        if self._extents.pop(item_id, None) is not None:
+            self._deleted.add(item_id)
+
+    def _maybe_pack(self):
+        """Repack the tree once the changes are a fraction of it."""
+        changes = len(self._pending) + len(self._deleted)
+        if changes > max(self.node_capacity, self._packed // 4):
+            self._pack()
+
+    def _pack(self):
+        """Pack the indexed extents in a tree with Sort-Tile-Recursive."""
+        nodes = [(extent, item_id)
+                 for item_id, extent in self._extents.iteritems()]
+        self._packed = len(nodes)
+        self._pending = []
+        self._deleted = set()
+        if not nodes:
+            self._root = None
+            return
+        leaf = True
+        while True:
+            nodes = [(_get_union([extent for extent, _ in group]),
+                      (leaf, group))
+                     for group in self._tile(nodes)]
+            leaf = False
+            if len(nodes) == 1:
+                break
+        self._root = nodes[0]
+
+    def _tile(self, nodes):
+        """Returns nodes grouped in parents with Sort-Tile-Recursive.
+
+        Args:
+            nodes (list): List of (extent, child) tuples.
+
+        Returns:
+            list: List of groups of at most node_capacity nodes.
+        """
+        capacity = self.node_capacity
+        num_groups = int(math.ceil(len(nodes) / float(capacity)))
+        num_slices = int(math.ceil(math.sqrt(num_groups)))
+        slice_size = num_slices * capacity
+        nodes.sort(key=lambda node: node[0][0] + node[0][1])
+        groups = []
+        for i in xrange(0, len(nodes), slice_size):
+            vertical = nodes[i:i + slice_size]
+            vertical.sort(key=lambda node: node[0][2] + node[0][3])
+            for j in xrange(0, len(vertical), capacity):
+                groups.append(vertical[j:j + capacity])
+        return groups
+
+    def _search(self, extent):
+        """Returns the ids of the features intersecting an extent."""
+        xmin, xmax, ymin, ymax = extent[:4]
+        res = []
+        if self._root is not None:
+            stack = [self._root]
+            while stack:
+                node_extent, (leaf, children) = stack.pop()
+                if node_extent[0] > xmax or node_extent[1] < xmin or \
+                        node_extent[2] > ymax or node_extent[3] < ymin:
+                    continue
+                if not leaf:
+                    stack.extend(children)
+                    continue
+                for child_extent, item_id in children:
+                    if child_extent[0] <= xmax and child_extent[1] >= xmin \
+                            and child_extent[2] <= ymax \
+                            and child_extent[3] >= ymin \
+                            and item_id not in self._deleted:
+                        res.append(item_id)
+        for item_id in self._pending:
+            if item_id in self._extents:
+                child_extent = self._extents[item_id]
+                if child_extent[0] <= xmax and child_extent[1] >= xmin \
+                        and child_extent[2] <= ymax \
+                        and child_extent[3] >= ymin:
+                    res.append(item_id)
+        return res
+
+
+def get_batch_extents(batch):
+    """Returns the extents of a FeatureBatch geometries.
+
+    Computed on the coordinates arrays, without building geometries.
+
+    Args:
+        batch (FeatureBatch): Features batch.
+
+    Returns:
+        list: Spatial extent list of each row. None for rows without
+            vertices.
+    """
+    vertices = batch.vertices
+    starts = batch.ring_offsets[batch.part_offsets[
+        batch.geometry_offsets]]
+    counts = numpy.diff(starts)
+    extents = [None] * len(batch)
+    rows = numpy.nonzero(counts)[0]
+    if len(rows):
+        xmin = numpy.minimum.reduceat(vertices[:, 0], starts[rows])
+        xmax = numpy.maximum.reduceat(vertices[:, 0], starts[rows])
+        ymin = numpy.minimum.reduceat(vertices[:, 1], starts[rows])
+        ymax = numpy.maximum.reduceat(vertices[:, 1], starts[rows])
+        for row, extent in zip(rows.tolist(), zip(xmin.tolist(),
+                xmax.tolist(), ymin.tolist(), ymax.tolist())):
+            extents[row] = list(extent)
+    for row in batch.collections:
+        extents[row] = batch.get_feature(row).geometry.extent()
+    return extents
+
+def check_distance_query(query, distance, geodesic):
+    """Raise ValueError if a distance query can not be evaluated locally.
+
+    Args:
+        query (str): Distance query.
+
+        distance (float): Distance in meters.
+
+        geodesic (bool): Coordinates are longitudes and latitudes.
+    """
+    if distance is None:
+        raise ValueError('%s query requires a distance.' % (query,))
+    if not geodesic:
+        raise ValueError('%s query distance is in meters: only evaluated '
+            'locally on longitudes and latitudes (SRID 4326).' % (query,))
+
+def get_distance(shape, other):
+    """Returns the distance in meters between two geometries of longitudes
+    and latitudes.
+
+    Haversine distance between the nearest points of the geometries, found
+    in degrees: exact between points, close to the geodesic distance
+    between other geometries.
+
+    Args:
+        shape (BaseGeometry): Shapely geometry.
+
+        other (BaseGeometry): Shapely geometry.
+
+    Returns:
+        float: Distance in meters. 0 if the geometries intersect.
+    """
+    if shape.intersects(other):
+        return 0.0
+    point, other_point = shapely.ops.nearest_points(shape, other)
+    lon = math.radians(point.x)
+    lat = math.radians(point.y)
+    other_lon = math.radians(other_point.x)
+    other_lat = math.radians(other_point.y)
+    hav = math.sin((other_lat - lat) / 2) ** 2 + math.cos(lat) * \
+        math.cos(other_lat) * math.sin((other_lon - lon) / 2) ** 2
+    return 2 * snowfloat.grid.EARTH_RADIUS * math.asin(
+        math.sqrt(min(hav, 1.0)))
+
+def get_distance_extent(extent, distance):
+    """Returns an extent of longitudes and latitudes grown by a distance.
+
+    Args:
+        extent (list): Spatial extent. (xmin, xmax, ymin, ymax).
+
+        distance (float): Distance in meters.
+
+    Returns:
+        list: Spatial extent holding the points within the distance. None
+            to search everything: over a pole or the antimeridian.
+    """
+    angle = distance / snowfloat.grid.EARTH_RADIUS
+    dlat = math.degrees(angle)
+    if angle >= math.pi / 2 or extent[2] - dlat <= -90 or \
+            extent[3] + dlat >= 90:
+        return None
+    # widest longitude span at the latitude nearest to a pole
+    ratio = math.sin(angle) / math.cos(math.radians(
+        max(abs(extent[2]), abs(extent[3]))))
+    if ratio >= 1:
+        return None
+    dlon = math.degrees(math.asin(ratio))
+    if extent[0] - dlon < -180 or extent[1] + dlon > 180:
+        return None
+    return [extent[0] - dlon, extent[1] + dlon, extent[2] - dlat,
+            extent[3] + dlat]
+
+def to_shape(geometry):
+    """Returns a shapely geometry.
+
+    Args:
+        geometry (Geometry): Geometry object.
+
+    Returns:
+        shapely.geometry.base.BaseGeometry: Shapely geometry.
+    """
+    if isinstance(geometry, shapely.geometry.base.BaseGeometry):
+        return geometry
+    return shapely.geometry.shape({
+        'type': geometry.geometry_type,
+        'geometries': [{'type': geom.geometry_type,
+                        'coordinates': geom.coordinates}
+                       for geom in geometry.geometries]})
+
+def _get_feature_extent(feature):
+    """Returns a feature's geometry extent. None without geometry."""
+    if feature.geometry is None:
+        return None
+    return feature.geometry.extent()
+
+def _get_union(extents):
+    """Returns the extent covering a list of extents."""
+    return [min([e[0] for e in extents]), max([e[1] for e in extents]),
+            min([e[2] for e in extents]), max([e[3] for e in extents])]
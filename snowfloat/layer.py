@@ -1,7 +1,30 @@
 """Layer of geometries."""
 
+import os
+
+import snowfloat.adaptive
+import snowfloat.arrow
+import snowfloat.cache
+import snowfloat.columnar
+import snowfloat.dataframe
+import snowfloat.errors
+import snowfloat.export
 import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.grid
+import snowfloat.index
+import snowfloat.membership
+import snowfloat.mirror
+import snowfloat.ordering
+import snowfloat.partition
 import snowfloat.request
+import snowfloat.schema
+import snowfloat.settings
+import snowfloat.signals
+import snowfloat.stats
+import snowfloat.store
+import snowfloat.tiles
+import snowfloat.writer
 
 class Layer(object):
 
@@ -26,19 +49,23 @@ class Layer(object):
 
         extent (list): Spatial extent list. (xmin, xmax, ymin, ymax).
     """
-    name = ''
-    uuid = None
-    uri = None
-    date_created = None
-    date_modified = None
-    num_features = 0
-    num_points = 0
-    fields = None
-    srid = None
-    dims = None
-    extent = None
+    __slots__ = ('name', 'uuid', 'uri', 'date_created', 'date_modified',
+                 'num_features', 'num_points', 'fields', 'srid', 'dims',
+                 'extent', '_validator')
 
     def __init__(self, **kwargs):
+        self.name = ''
+        self.uuid = None
+        self.uri = None
+        self.date_created = None
+        self.date_modified = None
+        self.num_features = 0
+        self.num_points = 0
+        self.fields = None
+        self.srid = None
+        self.dims = None
+        self.extent = None
+        self._validator = None
         for key, val in kwargs.items():
             getattr(self, key)
             setattr(self, key, val)
@@ -59,31 +86,95 @@ class Layer(object):
                self.uri, self.num_features, self.num_points, self.fields,
                self.srid, self.dims, self.extent)
 
-    def add_features(self, features):
+    def add_features(self, features, controller=None, spatial_order=None,
+            validate=False):
         """Add list of features to this layer.
 
         Args:
-            features (list): List of features to add. Maximum 1000 items.
+            features (list): List of features to add. Sent in batches
+                under the payload size limit.
+
+        Kwargs:
+            controller (AIMDController): Adapt the batch size and number of
+                requests in flight to the server load.
+
+            spatial_order (str): Sort the features along a space-filling
+                curve before batching: hilbert or zorder.
+
+            validate (bool): Validate and coerce the features against the
+                layer schema first. Only the valid features are sent.
 
         Returns:
-            list. List of Feature objects.
+            list. List of Feature objects, in the order they were sent.
 
         Raises:
-            snowfloat.errors.RequestError
+            snowfloat.errors.RequestError, snowfloat.errors.ValidationError
         """
         uri = '%s/features' % (self.uri,)
-        res = snowfloat.feature.add_features(uri, features)
+        errors = None
+        if validate:
+            features, errors = self.get_validator().validate_features(
+                features)
+        if spatial_order:
+            features = snowfloat.ordering.order_features(features,
+                curve=spatial_order)
+        if controller:
+            res = snowfloat.adaptive.add_features(uri, features, controller)
+        else:
+            res = snowfloat.feature.add_features(uri, features)
         
         self.num_features += len(features)
         self.num_points += \
             sum([feature.geometry.num_points() for feature in features])
 
+        self.clear_count_cache()
+
+        if errors:
+            raise snowfloat.errors.ValidationError(
+                '%d invalid features not added.' % (len(errors),), errors,
+                features=res)
+
         return res
 
-    def get_features(self, **kwargs):
+    def get_validator(self):
+        """Returns the validator compiled from this layer's schema.
+
+        Returns:
+            Validator. Features validator.
+        """
+        if self._validator is None:
+            self._validator = snowfloat.schema.Validator(fields=self.fields,
+                dims=self.dims, srid=self.srid)
+        return self._validator
+
+    def batch_writer(self, **kwargs):
+        """Returns a writer adding features to this layer in batches.
+
+        Kwargs:
+            max_features (int): Maximum number of features per batch.
+
+            max_bytes (int): Maximum serialized size of a batch in bytes.
+
+            max_age (float): Maximum number of seconds a feature is buffered.
+
+            max_workers (int): Maximum number of batches sent at the same time.
+
+        Returns:
+            BatchWriter. Writer to use as a context manager.
+        """
+        return snowfloat.writer.BatchWriter(self, **kwargs)
+
+    def get_features(self, as_columns=False, **kwargs):
         """Returns layer's features.
 
         Kwargs:
+            as_columns (bool): Return a columnar FeatureBatch instead of a
+                list of Feature objects.
+
+            include_fields (tuple): Names of the fields to return.
+
+            geometry_format (str): full (default), none, bbox or centroid.
+
             geometry_type (str): Geometries type.
             
             query (str): Distance or spatial query.
@@ -103,14 +194,470 @@ class Layer(object):
             query_slice (tuple): Tuple to limit entries returned.
 
         Returns:
-            list. List of Feature objects.
+            list. List of Feature objects or FeatureBatch. Served from the
+                query cache when one is enabled, except FeatureBatch.
         
         Raises:
             snowfloat.errors.RequestError
         """
+        if as_columns:
+            return snowfloat.columnar.get_feature_batch(self.uri,
+                fields=self.fields, **kwargs)
+        cache = snowfloat.cache.get_cache()
+        if cache is not None:
+            return cache.get_features(self.uri, **kwargs)
         return [res for res in snowfloat.feature.get_features(
             self.uri, **kwargs)]
 
+    def iter_features(self, **kwargs):
+        """Returns an iterator over layer's features.
+
+        Pages are requested as the features are consumed.
+
+        Kwargs:
+            page_size (int): Number of features per page.
+
+            prefetch (int): Number of pages fetched ahead in a background
+                thread.
+
+            limit (int): Maximum number of features returned.
+
+            lazy (bool): Decode the geometries on first access only.
+
+            Same as get_features.
+
+        Returns:
+            generator. Yields Feature objects.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return snowfloat.feature.get_features(self.uri, **kwargs)
+
+    def get_spatial_index(self, **kwargs):
+        """Returns an in-memory spatial index of layer's features.
+
+        Distance queries are answered in haversine meters for SRID 4326
+        layers, and rejected for other layers.
+
+        Kwargs:
+            Same as iter_features.
+
+        Returns:
+            SpatialIndex. Answers spatial queries locally.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return snowfloat.index.SpatialIndex(self.iter_features(**kwargs),
+            geodesic=self.srid == 4326)
+
+    def get_point_grid(self, cell_size=None, **kwargs):
+        """Returns a grid index of layer's point features.
+
+        The grid answers nearest neighbour and distance queries locally,
+        in haversine meters for SRID 4326 layers, and follows the features
+        written through the client.
+
+        Kwargs:
+            cell_size (float): Grid cell side in coordinates units.
+
+            Same as iter_features.
+
+        Returns:
+            PointGrid. Call close to stop following the writes.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return snowfloat.grid.PointGrid(self.iter_features(**kwargs),
+            cell_size=cell_size, geodesic=self.srid == 4326,
+            layer_uuid=self.uuid)
+
+    def get_stats(self, path=None, refresh=False, precision=None,
+            page_size=None, prefetch=0):
+        """Returns the statistics of all the layer's features.
+
+        Extent, counters, fields min, max and distinct estimates and
+        geometry types are computed in one pass over the features, then
+        follow the features written through the client.
+
+        Kwargs:
+            path (str): JSON file the statistics are read from if present,
+                and written to once computed. The file is read only while
+                the layer version is the one it was computed at: features
+                written since, even through the client, compute the
+                statistics again.
+
+            refresh (bool): Compute the statistics even if the file is
+                present.
+
+            precision (int): HyperLogLog precision of the distinct
+                estimates. A file of another precision is computed again.
+
+            page_size (int): Number of features per page.
+
+            prefetch (int): Number of pages fetched ahead in a background
+                thread.
+
+        Returns:
+            LayerStats. Call close to stop following the writes.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        if path and not refresh and os.path.exists(path):
+            stats = snowfloat.stats.load_stats(path, layer_uuid=self.uuid)
+            if not stats.stale and stats.precision == (precision or
+                    snowfloat.settings.STATS_HLL_PRECISION) and \
+                    stats.layer_version is not None and \
+                    stats.layer_version == \
+                    snowfloat.feature.get_layer_version(self.uri):
+                return stats
+            stats.close()
+        stats = snowfloat.stats.compute_stats(self.uri, layer_uuid=self.uuid,
+            precision=precision, page_size=page_size, prefetch=prefetch)
+        if path:
+            stats.save(path)
+        return stats
+
+    def get_membership_filter(self, key='uuid', path=None, refresh=False,
+            capacity=None, error_rate=None, page_size=None, prefetch=0):
+        """Returns a Bloom filter of layer's features uuids or field values.
+
+        Existence checks on the filter are answered locally for the keys
+        not in the layer, the server is queried on possible hits only. All
+        the layer's features are indexed.
+
+        Kwargs:
+            key (str): uuid or name of the field to index.
+
+            path (str): File the filter is read from if present, and
+                written to once built. The file is read only while the layer
+                version is the one it was built at: features written since,
+                even through the client, build the filter again.
+
+            refresh (bool): Build the filter even if the file is present.
+
+            capacity (int): Number of keys the filter is sized for. Default
+                to twice the number of features.
+
+            error_rate (float): False positives probability at capacity.
+
+            page_size (int): Number of features per page.
+
+            prefetch (int): Number of pages fetched ahead in a background
+                thread.
+
+        Returns:
+            MembershipFilter. Call close to stop following the writes.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        if path and not refresh and os.path.exists(path):
+            membership = snowfloat.membership.load_filter(path, uri=self.uri)
+            if not membership.stale and membership.key == key and \
+                    membership.layer_version is not None and \
+                    membership.layer_version == \
+                    snowfloat.feature.get_layer_version(self.uri):
+                return membership
+            membership.close()
+        membership = snowfloat.membership.build_filter(self.uri, key=key,
+            capacity=capacity or 2 * self.num_features,
+            error_rate=error_rate, page_size=page_size, prefetch=prefetch)
+        if path:
+            membership.save(path)
+        return membership
+
+    def mirror(self, path):
+        """Returns a local SQLite mirror of this layer.
+
+        Args:
+            path (str): SQLite database path.
+
+        Returns:
+            Mirror. Call its sync method to pull the changes.
+        """
+        return snowfloat.mirror.Mirror(self, path)
+
+    def tile_cache(self, zoom, **kwargs):
+        """Returns a cache of layer's features by map tiles.
+
+        Args:
+            zoom (int): Zoom level of the tiles.
+
+        Kwargs:
+            world (list): Extent tiled at zoom 0. Default to the SRID world
+                extent or the layer's extent.
+
+            max_tiles (int): Maximum number of tiles cached.
+
+            ttl (float): Number of seconds a tile is cached.
+
+            max_workers (int): Maximum number of tiles fetched at the same
+                time.
+
+        Returns:
+            TileCache. Call its get_features method with a viewport extent.
+
+        Raises:
+            ValueError
+        """
+        return snowfloat.tiles.TileCache(self, zoom, **kwargs)
+
+    def to_dataframe(self, geo=True, **kwargs):
+        """Returns layer's features in a data frame.
+
+        Columns are built from the decoded pages with dtypes taken from the
+        layer's fields definitions.
+
+        Kwargs:
+            geo (bool): Return a GeoDataFrame if geopandas is installed.
+
+            Same as get_features.
+
+        Returns:
+            pandas.DataFrame. Columns uuid, uri, date_created,
+                date_modified, one per field and geometry.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        return snowfloat.dataframe.to_dataframe(self.uri, fields=self.fields,
+            srid=self.srid, geo=geo, **kwargs)
+
+    def from_dataframe(self, frame, geometry='geometry', max_bytes=None):
+        """Add the rows of a data frame to this layer as features.
+
+        Rows are sent as GeoJSON without building Geometry objects. Date
+        columns are sent in the ISO format. To validate, order or adapt the
+        batches, pass snowfloat.dataframe.parse_dataframe(frame) to
+        add_features instead.
+
+        Args:
+            frame (pandas.DataFrame): Data frame. Columns other than the
+                geometry and the uuid, uri and dates attributes are fields.
+
+        Kwargs:
+            geometry (str): Geometry column name.
+
+            max_bytes (int): Maximum serialized size of a batch in bytes.
+
+        Returns:
+            list. UUIDs of the features added, in the rows order.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        features = snowfloat.dataframe.make_geojson_features(frame,
+            geometry=geometry)
+        uuids = snowfloat.feature.add_geojson_features(
+            '%s/features' % (self.uri,), features, max_bytes=max_bytes)
+        self.num_features += len(uuids)
+        self.num_points += sum([snowfloat.geometry.get_geojson_num_points(
+            feature['geometry']) for feature in features])
+        self.clear_count_cache()
+        return uuids
+
+    def export(self, path, format='geojsonseq', raw=False, compress=False,
+            **kwargs):
+        """Stream layer's features to a file.
+
+        Features are written with their fields and the uri and dates
+        attributes as properties. The file is only replaced once complete.
+
+        Args:
+            path (str): Output file path.
+
+        Kwargs:
+            format (str): geojsonseq (RFC 8142) or ndjson.
+
+            raw (bool): Also write the other properties received, like the
+                spatial operations results.
+
+            compress (bool): Write a gzip file.
+
+            Same as iter_features, except limit and lazy.
+
+        Returns:
+            dict. Export statistics: features, bytes, seconds and
+                features_per_sec.
+
+        Raises:
+            snowfloat.errors.RequestError, ValueError
+        """
+        # pylint: disable=W0622
+        return snowfloat.export.export_features(self.uri, path,
+            format=format, raw=raw, compress=compress, **kwargs)
+
+    def export_arrow(self, path, format='parquet', geometry_encoding='wkb',
+            row_group_size=None, **kwargs):
+        """Stream layer's features to a Parquet or Feather file.
+
+        Field columns are typed from the layer's fields definitions, and
+        the CRS is written from the layer's SRID.
+
+        Args:
+            path (str): Output file path.
+
+        Kwargs:
+            format (str): parquet or feather (Arrow IPC file).
+
+            geometry_encoding (str): wkb or geoarrow.
+
+            row_group_size (int): Number of features per row group.
+
+            compression (str): Parquet compression codec.
+
+            Same as iter_features, except limit and lazy.
+
+        Returns:
+            dict. Export statistics: features and row_groups.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error,
+                ValueError
+        """
+        # pylint: disable=W0622
+        return snowfloat.arrow.write_features(self.uri, path,
+            fields=self.fields, srid=self.srid, format=format,
+            geometry_encoding=geometry_encoding,
+            row_group_size=row_group_size, **kwargs)
+
+    def write_coordinate_store(self, path, **kwargs):
+        """Stream layer's geometries to a memory-mapped coordinate store.
+
+        Open the store with snowfloat.store.CoordinateStore(path).
+
+        Args:
+            path (str): Store directory.
+
+        Kwargs:
+            Same as iter_features, except limit, lazy, include_fields and
+            geometry_format.
+
+        Returns:
+            dict. Store statistics: features and vertices.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        return snowfloat.store.write_store(self.uri, path, **kwargs)
+
+    def iter_keyset(self, key='date_created', **kwargs):
+        """Returns an iterator over layer's features by keyset pagination.
+
+        Pages are requested with conditions on the last feature returned
+        rather than offsets: deep pages are as fast as the first ones and
+        stay consistent while the layer is written.
+
+        Kwargs:
+            key (str): uuid, feature attribute or field_<name> property to
+                order by, uuid breaking ties.
+
+            page_size (int): Number of features per page.
+
+            lazy (bool): Decode the geometries on first access only.
+
+            after (tuple): Key value and uuid of the feature to resume
+                after.
+
+            Same as get_features, except order_by and query_slice.
+
+        Returns:
+            generator. Yields Feature objects ordered by key and uuid.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return snowfloat.feature.get_features_keyset(self.uri, key=key,
+            **kwargs)
+
+    def scan(self, num_partitions=4, by='tiles', max_workers=None,
+            **kwargs):
+        """Returns an iterator over layer's features fetched in parallel.
+
+        The layer is split in disjoint partitions fetched concurrently.
+
+        Kwargs:
+            num_partitions (int): Number of partitions.
+
+            by (str): tiles to split the layer extent in spatial tiles,
+                the edge tiles stretching to the SRID world, plus the
+                features without geometry, or slices to split the features
+                ordered by order_by (uuid by default) in ranges.
+
+            max_workers (int): Maximum number of partitions fetched at the
+                same time.
+
+            Same as iter_features, except limit and query_slice, and
+            query and geometry by tiles.
+
+        Returns:
+            generator. Yields Feature objects, each once.
+
+        Raises:
+            snowfloat.errors.RequestError, ValueError
+        """
+        if by == 'tiles':
+            if not self.extent:
+                raise ValueError('Layer has no extent to split in tiles.')
+            if 'query' in kwargs or 'geometry' in kwargs:
+                raise ValueError('Tiles partitions are spatial queries: '
+                    'scan by slices with a query.')
+            partitions = snowfloat.partition.tile_partitions(self.extent,
+                num_partitions,
+                world=snowfloat.tiles.WORLD_EXTENTS.get(self.srid))
+        elif by == 'slices':
+            conditions = dict((key, val) for key, val in kwargs.iteritems()
+                if key not in ('page_size', 'prefetch', 'lazy'))
+            # not cached: the last range starts from the count
+            partitions = snowfloat.partition.slice_partitions(
+                snowfloat.feature.count_features(self.uri, **conditions),
+                num_partitions,
+                order_by=kwargs.pop('order_by', ('uuid',)))
+        else:
+            raise ValueError('Unknown partitioning %r.' % (by,))
+        return snowfloat.partition.scan(self.uri, partitions,
+            max_workers=max_workers, overlapping=by == 'tiles', **kwargs)
+
+    def count_features(self, **kwargs):
+        """Returns the number of layer's features matching conditions.
+
+        Counts are cached for settings.COUNT_CACHE_TTL seconds. The cache is
+        cleared when the layer is written through the client: see
+        snowfloat.cache.get_count.
+
+        Kwargs:
+            Same conditions as get_features.
+
+        Returns:
+            int. Number of features.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return snowfloat.cache.get_count(self.uri, **kwargs)
+
+    def exists(self, **kwargs):
+        """Returns whether any layer's feature matches conditions.
+
+        Kwargs:
+            Same conditions as get_features.
+
+        Returns:
+            bool. True if at least one feature matches.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        return self.count_features(**kwargs) > 0
+
+    def clear_count_cache(self):
+        """Forget the cached features counts of this layer."""
+        snowfloat.cache.clear_counts(self.uuid)
+
     def delete_features(self, **kwargs):
         """Deletes layer's features.
 
@@ -130,6 +677,8 @@ class Layer(object):
         
         self.num_features -= res['num_features']
         self.num_points -= res['num_points']
+        self.clear_count_cache()
+        snowfloat.signals.send(self.uuid, 'delete')
 
     def delete_feature(self, uuid):
         """Deletes a feature.
@@ -145,6 +694,8 @@ class Layer(object):
         
         self.num_features -= 1
         self.num_points -= res['num_points']
+        self.clear_count_cache()
+        snowfloat.signals.send(self.uuid, 'delete', [uuid])
 
     def update(self, **kwargs):
         """Update layer's attributes.
@@ -161,6 +712,8 @@ class Layer(object):
         # if success: update self attributes
         for key, value in kwargs.items():
             setattr(self, key, value)
+        self._validator = None
+        snowfloat.signals.send(self.uuid, 'layer')
 
     def delete(self):
         """Deletes this layer.
@@ -169,6 +722,7 @@ class Layer(object):
             snowfloat.errors.RequestError
         """
         snowfloat.request.delete(self.uri)
+        snowfloat.signals.send(self.uuid, 'layer')
 
 
 def format_layers(layers):
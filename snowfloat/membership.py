@@ -0,0 +1,320 @@
+"""Probabilistic index of the keys of layer's features."""
+
+import hashlib
+import json
+import math
+import struct
+import threading
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.pool
+import snowfloat.settings
+import snowfloat.signals
+
+VERSION = 2
+
+class MembershipFilter(object):
+    """Bloom filter of layer's features uuids or field values.
+
+    Each key sets num_hashes bits out of num_bits, about 1.2 bytes per key
+    at a 1% error rate. A key whose bits are all set may be in the layer,
+    with a probability of error close to error_rate until capacity keys are
+    added. A key with a bit unset is not in the layer.
+
+    Given a layer URI, the filter follows the features added through the
+    client, and existence checks query the server on possible hits only.
+    Keys can not be removed: deleted keys and keys replaced by updates
+    remain possible hits, which the server answers. A batch of features
+    which failed part way sets the stale attribute: some keys may be
+    missing. Thread-safe.
+
+    Attributes:
+        key (str): uuid or name of the field indexed.
+
+        capacity (int): Number of keys the filter is sized for.
+
+        error_rate (float): False positives probability at capacity.
+
+        num_bits (int): Number of bits.
+
+        num_hashes (int): Number of bits set by each key.
+
+        uri (str): Layer URI the filter follows the writes of.
+
+        stale (bool): True once keys may be missing.
+
+        layer_version (list): Number of features and last modification
+            date of the layer when the filter was built. See
+            snowfloat.feature.get_layer_version.
+    """
+
+    def __init__(self, capacity=None, error_rate=None, key='uuid', uri=None):
+        self.capacity = max(capacity or 0,
+            snowfloat.settings.MEMBERSHIP_FILTER_MIN_CAPACITY)
+        self.error_rate = error_rate or \
+            snowfloat.settings.MEMBERSHIP_FILTER_ERROR_RATE
+        if not 0 < self.error_rate < 1:
+            raise ValueError('Error rate %r not between 0 and 1.'
+                % (self.error_rate,))
+        self.key = key
+        self.num_bits = int(math.ceil(-self.capacity *
+            math.log(self.error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(
+            float(self.num_bits) / self.capacity * math.log(2))))
+        self.uri = uri
+        self.stale = False
+        self.layer_version = None
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+        self._stats = {'keys': 0, 'negatives': 0, 'possible_hits': 0,
+                       'false_positives': 0}
+        if uri is not None:
+            self.layer_uuid = snowfloat.signals.get_layer_uuid(uri)
+            snowfloat.signals.connect(self._on_write)
+        else:
+            self.layer_uuid = None
+
+    def __contains__(self, value):
+        positions = self._get_positions(value)
+        with self._lock:
+            return all(self._bits[i >> 3] & (1 << (i & 7))
+                       for i in positions)
+
+    def add(self, value):
+        """Add a key.
+
+        Args:
+            value: uuid or field value.
+        """
+        positions = self._get_positions(value)
+        with self._lock:
+            self._add(positions)
+
+    def exists(self, value):
+        """Returns True if a feature has this key in the layer.
+
+        Args:
+            value: uuid or field value.
+
+        Returns:
+            bool: Answered locally when the key is not in the filter.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        return bool(self.get_existing([value]))
+
+    def get_existing(self, values):
+        """Returns the keys of features in the layer.
+
+        Keys in the filter are checked on the server, at most
+        settings.MEMBERSHIP_FILTER_MAX_WORKERS at the same time.
+
+        Args:
+            values (list): uuids or field values.
+
+        Returns:
+            list: Values of the features in the layer, in the order given.
+
+        Raises:
+            snowfloat.errors.RequestError, snowfloat.errors.Error
+        """
+        if self.uri is None:
+            raise snowfloat.errors.Error('No layer URI to check keys with.')
+        candidates = [value for value in values if value in self]
+        with self._lock:
+            self._stats['negatives'] += len(values) - len(candidates)
+            self._stats['possible_hits'] += len(candidates)
+        if not candidates:
+            return []
+        condition = 'uuid_exact' if self.key == 'uuid' else \
+            'field_%s_exact' % (self.key,)
+
+        def count(value):
+            """Returns the number of features with this key."""
+            return snowfloat.feature.count_features(self.uri,
+                **{condition: value})
+
+        pool = snowfloat.pool.WorkerPool(min(len(candidates),
+            snowfloat.settings.MEMBERSHIP_FILTER_MAX_WORKERS))
+        try:
+            existing = [value for value, num in
+                        zip(candidates, pool.map(count, candidates)) if num]
+        finally:
+            pool.shutdown(wait=False)
+        with self._lock:
+            self._stats['false_positives'] += len(candidates) - len(existing)
+        return existing
+
+    def stats(self):
+        """Returns the filter statistics.
+
+        Returns:
+            dict: keys in the filter, negatives answered locally,
+                possible_hits checked on the server and false_positives
+                among them.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def save(self, path):
+        """Write the filter to a file.
+
+        Args:
+            path (str): File path.
+        """
+        with self._lock:
+            header = json.dumps({'version': VERSION,
+                                 'layer_uuid': self.layer_uuid,
+                                 'key': self.key,
+                                 'capacity': self.capacity,
+                                 'error_rate': self.error_rate,
+                                 'keys': self._stats['keys'],
+                                 'stale': self.stale,
+                                 'layer_version': self.layer_version})
+            bits = bytes(self._bits)
+        with open(path, 'wb') as filter_file:
+            filter_file.write(header + '\n')
+            filter_file.write(bits)
+
+    def close(self):
+        """Stop following the layer's writes."""
+        snowfloat.signals.disconnect(self._on_write)
+
+    def _get_positions(self, value):
+        """Returns the bits of a key, by double hashing."""
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif not isinstance(value, str):
+            value = json.dumps(value)
+        hash1, hash2 = struct.unpack('>QQ', hashlib.md5(value).digest())
+        hash2 |= 1
+        return [(hash1 + i * hash2) % self.num_bits
+                for i in xrange(self.num_hashes)]
+
+    def _add(self, positions):
+        """Set bits. Called with the lock held."""
+        for i in positions:
+            self._bits[i >> 3] |= 1 << (i & 7)
+        self._stats['keys'] += 1
+
+    def _get_key(self, feature):
+        """Returns the key of a Feature object. None if unset."""
+        if self.key == 'uuid':
+            return feature.uuid
+        return (feature.fields or {}).get(self.key)
+
+    def _on_write(self, layer_uuid, action, features):
+        """Signal listener applying the layer's added and updated keys."""
+        if layer_uuid is not None and layer_uuid != self.layer_uuid:
+            return
+        if action == 'add' and features is None:
+            self.stale = True
+            return
+        if action in ('add', 'update'):
+            # a field value replaced by an update stays a possible hit
+            for feature in features:
+                value = self._get_key(feature)
+                if value is not None and (action == 'add' or
+                        value not in self):
+                    self.add(value)
+
+
+def build_filter(uri, key='uuid', capacity=None, error_rate=None,
+        page_size=None, prefetch=0):
+    """Build a filter from a stream of layer's features keys.
+
+    Pages are requested without geometries and with the key field only.
+    All the layer's features are indexed: a key missing from the filter is
+    answered as not in the layer.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        key (str): uuid or name of the field to index.
+
+        capacity (int): Number of keys the filter is sized for.
+
+        error_rate (float): False positives probability at capacity.
+
+        page_size (int): Number of features per page.
+
+        prefetch (int): Number of pages fetched ahead in a background
+            thread.
+
+    Returns:
+        MembershipFilter: Filter following the layer's writes.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    membership = MembershipFilter(capacity=capacity, error_rate=error_rate,
+        key=key, uri=uri)
+    include_fields = () if key == 'uuid' else (key,)
+    try:
+        # taken first: writes during the pass make the version older
+        membership.layer_version = snowfloat.feature.get_layer_version(uri)
+        pages = snowfloat.feature.get_pages(uri, page_size=page_size,
+            prefetch=prefetch, include_fields=include_fields,
+            geometry_format='none')
+        try:
+            for page in pages:
+                for feature in page:
+                    if key == 'uuid':
+                        value = feature['id']
+                    else:
+                        value = (feature.get('properties') or {}).get(
+                            'field_%s' % (key,))
+                    if value is not None:
+                        membership.add(value)
+        finally:
+            pages.close()
+    except:
+        membership.close()
+        raise
+    return membership
+
+def load_filter(path, uri=None):
+    """Read a filter written by MembershipFilter.save.
+
+    Args:
+        path (str): File path.
+
+    Kwargs:
+        uri (str): Layer URI the filter follows the writes of.
+
+    Returns:
+        MembershipFilter: Filter.
+
+    Raises:
+        snowfloat.errors.Error
+    """
+    try:
+        with open(path, 'rb') as filter_file:
+            header = json.loads(filter_file.readline())
+            bits = bytearray(filter_file.read())
+    except (IOError, ValueError), e:
+        raise snowfloat.errors.Error('Can not read membership filter %s: '
+            '%s.' % (path, e))
+    if header.get('version') != VERSION:
+        raise snowfloat.errors.Error('Unknown membership filter version %r.'
+            % (header.get('version'),))
+    if uri is not None and header['layer_uuid'] not in (None,
+            snowfloat.signals.get_layer_uuid(uri)):
+        raise snowfloat.errors.Error('Membership filter of layer %s, not '
+            '%s.' % (header['layer_uuid'],
+                     snowfloat.signals.get_layer_uuid(uri)))
+    membership = MembershipFilter(capacity=header['capacity'],
+        error_rate=header['error_rate'], key=header['key'], uri=uri)
+    # pylint: disable=W0212
+    if len(bits) != len(membership._bits):
+        membership.close()
+        raise snowfloat.errors.Error('Truncated membership filter %s.'
+            % (path,))
+    membership._bits = bits
+    membership._stats['keys'] = header['keys']
+    membership.stale = header['stale']
+    membership.layer_version = header.get('layer_version')
+    return membership
@@ -0,0 +1,327 @@
+"""Local SQLite mirror of a layer."""
+
+import json
+import sqlite3
+import threading
+import time
+
+import snowfloat.feature
+import snowfloat.filters
+import snowfloat.geometry
+import snowfloat.wkb
+
+COLUMN_TYPES = {'string': 'TEXT', 'integer': 'INTEGER', 'real': 'REAL',
+                'float': 'REAL', 'boolean': 'INTEGER'}
+
+class Mirror(object):
+    """Copy of a layer's features in a SQLite database.
+
+    Geometries are stored as WKB with their bounding box in an R*Tree index
+    and the layer's fields as columns, added to an existing database when
+    the layer gets new fields. The copy is kept up to date by pulling the
+    features modified since the last sync, paged by date_modified and uuid
+    keyset, and deleting the features no longer on the server. Thread-safe.
+
+    Attributes:
+        layer (Layer): Mirrored layer.
+
+        path (str): SQLite database path.
+    """
+
+    def __init__(self, layer, path):
+        self.layer = layer
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._fields = dict((field['name'], field.get('type'))
+                            for field in layer.fields or [])
+        self._create()
+
+    def sync(self, page_size=None, detect_deletes=True):
+        """Pull the features added or modified since the last sync.
+
+        The first sync copies the whole layer.
+
+        Kwargs:
+            page_size (int): Number of features per page.
+
+            detect_deletes (bool): Delete the local features not on the
+                server anymore. Requires a scan of all the features uuids.
+
+        Returns:
+            dict: Sync statistics: added, updated, deleted and seconds.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        start = time.time()
+        stats = {'added': 0, 'updated': 0, 'deleted': 0}
+        has_features = self.count() > 0
+        pages = snowfloat.feature.get_pages_keyset(self.layer.uri,
+            key='date_modified', page_size=page_size,
+            after=self._get_meta('last'))
+        try:
+            for page in pages:
+                with self._lock:
+                    with self._conn:
+                        for feature in page:
+                            if self._upsert(feature):
+                                stats['updated'] += 1
+                            else:
+                                stats['added'] += 1
+                        # pages are ordered by date_modified and uuid
+                        self._set_meta('last', [
+                            page[-1]['properties']['date_modified'],
+                            page[-1]['id']])
+        finally:
+            pages.close()
+
+        if detect_deletes and has_features:
+            stats['deleted'] = self._delete_missing(page_size)
+
+        stats['seconds'] = time.time() - start
+        return stats
+
+    def count(self):
+        """Returns the number of local features.
+
+        Returns:
+            int: Number of features.
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM features').fetchone()[0]
+
+    def get_feature(self, uuid):
+        """Returns a local feature.
+
+        Args:
+            uuid (str): Feature's uuid.
+
+        Returns:
+            Feature: Feature object. None if not found.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT %s FROM features WHERE uuid = ?'
+                % (self._select_columns('features'),), (uuid,)).fetchone()
+        if row is None:
+            return None
+        return self._parse_row(row)
+
+    def get_features(self, extent=None, limit=None, **kwargs):
+        """Returns local features.
+
+        Kwargs:
+            extent (list): Spatial extent (xmin, xmax, ymin, ymax). Only
+                the features whose bounding box intersects it are returned.
+
+            limit (int): Maximum number of features returned.
+
+            Same conditions as Layer.get_features, evaluated locally.
+
+        Returns:
+            list: List of Feature objects.
+
+        Raises:
+            ValueError
+        """
+        if kwargs:
+            features = snowfloat.filters.Filter(
+                geodesic=self.layer.srid == 4326, **kwargs).apply(
+                self.get_features(extent=extent))
+            return features[:limit] if limit is not None else features
+        sql = 'SELECT %s FROM features' % (self._select_columns('features'),)
+        params = []
+        if extent is not None:
+            sql += ' JOIN features_index ON features.id = features_index.id' \
+                ' WHERE features_index.xmax >= ? AND features_index.xmin <= ?' \
+                ' AND features_index.ymax >= ? AND features_index.ymin <= ?'
+            params.extend([extent[0], extent[1], extent[2], extent[3]])
+        sql += ' ORDER BY features.id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._parse_row(row) for row in rows]
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create(self):
+        """Create the tables if they do not exist, and the columns of the
+        fields added to the layer since."""
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS features ('
+                'id INTEGER PRIMARY KEY, uuid TEXT UNIQUE NOT NULL, uri TEXT, '
+                'date_created, date_modified, geometry BLOB, fields TEXT)')
+            self._conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS '
+                'features_index USING rtree(id, xmin, xmax, ymin, ymax)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                'key TEXT PRIMARY KEY, value TEXT)')
+            existing = set(row[1] for row in self._conn.execute(
+                'PRAGMA table_info(features)'))
+            added = [name for name in sorted(self._fields)
+                     if 'field_%s' % (name,) not in existing]
+            for name in added:
+                self._conn.execute('ALTER TABLE features ADD COLUMN %s %s'
+                    % (_quote('field_%s' % (name,)),
+                       COLUMN_TYPES.get(self._fields[name], '')))
+            if added and existing:
+                self._move_fields(added)
+
+    def _move_fields(self, names):
+        """Move the values of new fields from the fields JSON column to
+        their columns. Called in a transaction.
+
+        Args:
+            names (list): Names of the fields added.
+        """
+        rows = self._conn.execute('SELECT id, fields FROM features '
+            'WHERE fields IS NOT NULL').fetchall()
+        for row_id, fields in rows:
+            fields = json.loads(fields)
+            values = [fields.pop(name, None) for name in names]
+            self._conn.execute('UPDATE features SET fields = ?, %s '
+                'WHERE id = ?' % (', '.join('%s = ?' % (
+                    _quote('field_%s' % (name,)),) for name in names),),
+                [json.dumps(fields) if fields else None] + values +
+                [row_id])
+
+    def _select_columns(self, table):
+        """Returns the features columns to select."""
+        names = ['uuid', 'uri', 'date_created', 'date_modified', 'geometry',
+                 'fields'] + ['field_%s' % (name,)
+                              for name in sorted(self._fields)]
+        return ', '.join('%s.%s' % (table, _quote(name)) for name in names)
+
+    def _upsert(self, feature):
+        """Insert or update a GeoJSON feature. Called with the lock held.
+
+        Args:
+            feature (dict): GeoJSON feature dictionary.
+
+        Returns:
+            bool: True if the feature was updated.
+        """
+        properties = feature['properties']
+        other_fields = {}
+        values = {}
+        for key, val in properties.iteritems():
+            if not key.startswith('field_'):
+                continue
+            if key[6:] in self._fields:
+                values[key] = val
+            else:
+                other_fields[key[6:]] = val
+        for name in self._fields:
+            values.setdefault('field_%s' % (name,), None)
+        geojson = feature['geometry']
+        values.update({
+            'uri': properties.get('uri'),
+            'date_created': properties.get('date_created'),
+            'date_modified': properties.get('date_modified'),
+            'geometry': sqlite3.Binary(snowfloat.wkb.dumps(geojson))
+                        if geojson else None,
+            'fields': json.dumps(other_fields) if other_fields else None})
+        names = sorted(values)
+        row = self._conn.execute('SELECT id FROM features WHERE uuid = ?',
+            (feature['id'],)).fetchone()
+        if row:
+            row_id = row[0]
+            self._conn.execute('UPDATE features SET %s WHERE id = ?'
+                % (', '.join('%s = ?' % (_quote(name),) for name in names),),
+                [values[name] for name in names] + [row_id])
+            self._conn.execute('DELETE FROM features_index WHERE id = ?',
+                (row_id,))
+        else:
+            cursor = self._conn.execute(
+                'INSERT INTO features (uuid, %s) VALUES (?%s)'
+                % (', '.join(_quote(name) for name in names),
+                   ', ?' * len(names)),
+                [feature['id']] + [values[name] for name in names])
+            row_id = cursor.lastrowid
+        extent = snowfloat.geometry.get_geojson_extent(geojson)
+        if extent:
+            self._conn.execute('INSERT INTO features_index VALUES '
+                '(?, ?, ?, ?, ?)', [row_id] + list(extent))
+        return row is not None
+
+    def _delete_missing(self, page_size):
+        """Delete the local features not on the server anymore.
+
+        Args:
+            page_size (int): Number of features per page.
+
+        Returns:
+            int: Number of features deleted.
+        """
+        remote = set()
+        for page in snowfloat.feature.get_pages_keyset(self.layer.uri,
+                key='uuid', page_size=page_size, include_fields=(),
+                geometry_format='none'):
+            remote.update(feature['id'] for feature in page)
+        with self._lock:
+            with self._conn:
+                rows = self._conn.execute(
+                    'SELECT id, uuid FROM features').fetchall()
+                row_ids = [(row_id,) for row_id, uuid in rows
+                           if uuid not in remote]
+                self._conn.executemany('DELETE FROM features WHERE id = ?',
+                    row_ids)
+                self._conn.executemany(
+                    'DELETE FROM features_index WHERE id = ?', row_ids)
+        return len(row_ids)
+
+    def _get_meta(self, key):
+        """Returns a JSON-decoded metadata value. None if not set."""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _set_meta(self, key, value):
+        """Set a metadata value. Called with the lock held."""
+        self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+            (key, json.dumps(value)))
+
+    def _parse_row(self, row):
+        """Returns a Feature object from a features row.
+
+        Args:
+            row (tuple): Selected columns values.
+
+        Returns:
+            Feature: Feature object, its geometry decoded on first access.
+        """
+        uuid, uri, date_created, date_modified, geometry, fields = row[:6]
+        fields = json.loads(fields) if fields else {}
+        for name, val in zip(sorted(self._fields), row[6:]):
+            if val is None:
+                continue
+            if self._fields[name] == 'boolean':
+                val = bool(val)
+            fields[name] = val
+        return snowfloat.feature.Feature(
+            snowfloat.wkb.loads(str(geometry)) if geometry else None,
+            fields=fields,
+            uuid=uuid,
+            uri=uri,
+            date_created=date_created,
+            date_modified=date_modified,
+            layer_uuid=self.layer.uuid)
+
+
+def _quote(name):
+    """Returns a quoted SQL identifier."""
+    return '"%s"' % (name.replace('"', '""'),)
@@ -0,0 +1,301 @@
+"""Spatial ordering of features along space-filling curves.
+
+Features close in space get close keys so batches of ordered features
+cover small areas.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import tempfile
+
+import snowfloat.feature
+import snowfloat.settings
+
+CURVES = ('hilbert', 'zorder')
+
+def hilbert_key(x, y, order):
+    """Returns the Hilbert curve distance of a grid cell.
+
+    Args:
+        x (int): Cell column in [0, 2 ** order).
+
+        y (int): Cell row in [0, 2 ** order).
+
+        order (int): Curve order.
+
+    Returns:
+        int: Distance along the curve.
+    """
+    side = 1 << order
+    key = 0
+    step = side >> 1
+    while step:
+        rx = 1 if x & step else 0
+        ry = 1 if y & step else 0
+        key += step * step * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        if not ry:
+            if rx:
+                x = side - 1 - x
+                y = side - 1 - y
+            x, y = y, x
+        step >>= 1
+    return key
+
+def zorder_key(x, y, order):
+    """Returns the Z-order (Morton) curve distance of a grid cell.
+
+    Args:
+        x (int): Cell column in [0, 2 ** order).
+
+        y (int): Cell row in [0, 2 ** order).
+
+        order (int): Curve order.
+
+    Returns:
+        int: Distance along the curve.
+    """
+    key = 0
+    for i in xrange(order):
+        key |= ((x >> i) & 1) << (2 * i)
+        key |= ((y >> i) & 1) << (2 * i + 1)
+    return key
+
+def get_key_func(extent, curve='hilbert', order=16):
+    """Returns a function computing a feature curve key.
+
+    The key is the curve distance of the grid cell holding the centroid of
+    the feature's extent.
+
+    Args:
+        extent (list): Grid spatial extent. (xmin, xmax, ymin, ymax).
+
+    Kwargs:
+        curve (str): Space-filling curve: hilbert or zorder.
+
+        order (int): Curve order. The grid has 2 ** order cells per side.
+
+    Returns:
+        function: Takes a Feature object and returns its key.
+
+    Raises:
+        ValueError
+    """
+    if curve not in CURVES:
+        raise ValueError('Unknown curve %r.' % (curve,))
+    curve_key = hilbert_key if curve == 'hilbert' else zorder_key
+    xmin, xmax, ymin, ymax = extent
+    cells = (1 << order) - 1
+    x_scale = cells / float(xmax - xmin or 1)
+    y_scale = cells / float(ymax - ymin or 1)
+
+    def key_func(feature):
+        """Returns the feature curve key."""
+        if feature.geometry is None:
+            return 0
+        feature_extent = feature.geometry.extent()
+        if not feature_extent:
+            return 0
+        x = (feature_extent[0] + feature_extent[1]) / 2.0
+        y = (feature_extent[2] + feature_extent[3]) / 2.0
+        x = min(max(int((x - xmin) * x_scale), 0), cells)
+        y = min(max(int((y - ymin) * y_scale), 0), cells)
+        return curve_key(x, y, order)
+
+    return key_func
+
+def order_features(features, extent=None, curve='hilbert', order=16):
+    """Returns a list of features sorted along a space-filling curve.
+
+    Only (key, index) pairs are sorted, so the Feature objects returned are
+    the ones given, whatever their number.
+
+    Args:
+        features (list): List of Feature objects.
+
+    Kwargs:
+        extent (list): Spatial extent to order in. (xmin, xmax, ymin, ymax).
+            Default to the features extent.
+
+        curve (str): Space-filling curve: hilbert or zorder.
+
+        order (int): Curve order.
+
+    Returns:
+        list: List of Feature objects in curve order.
+
+    Raises:
+        ValueError
+    """
+    if extent is None:
+        extent = _get_features_extent(features)
+    key_func = get_key_func(extent, curve=curve, order=order)
+    keys = sorted((key_func(feature), i) for i, feature in enumerate(features))
+    return [features[i] for _, i in keys]
+
+def sort_features(features, extent=None, curve='hilbert', order=16,
+        max_in_memory=None):
+    """Sort a stream of features along a space-filling curve.
+
+    Inputs larger than max_in_memory features are sorted in runs spilled to
+    temporary files and merged. The features yielded are then copies read
+    back from the runs, not the objects given: use order_features to sort
+    features to send.
+
+    Args:
+        features: Iterable of Feature objects.
+
+    Kwargs:
+        extent (list): Spatial extent to order in. (xmin, xmax, ymin, ymax).
+            Required unless features is a list.
+
+        curve (str): Space-filling curve: hilbert or zorder.
+
+        order (int): Curve order.
+
+        max_in_memory (int): Maximum number of features held in memory.
+
+    Returns:
+        generator. Yields Feature objects in curve order.
+
+    Raises:
+        ValueError
+    """
+    if extent is None:
+        if not isinstance(features, (list, tuple)):
+            raise ValueError('extent is required to sort a stream.')
+        extent = _get_features_extent(features)
+    if not max_in_memory:
+        max_in_memory = snowfloat.settings.ORDERING_MAX_IN_MEMORY
+    key_func = get_key_func(extent, curve=curve, order=order)
+    counter = itertools.count()
+    iterator = iter(features)
+
+    run = _sorted_run(iterator, key_func, counter, max_in_memory)
+    if len(run) < max_in_memory:
+        for _, _, feature in run:
+            yield feature
+        return
+
+    run_files = []
+    try:
+        while run:
+            run_files.append(_write_run(run))
+            run = _sorted_run(iterator, key_func, counter, max_in_memory)
+        runs = [_read_run(run_file) for run_file in run_files]
+        for _, _, feature in heapq.merge(*runs):
+            yield feature
+    finally:
+        for run_file in run_files:
+            run_file.close()
+            os.remove(run_file.name)
+
+def _get_features_extent(features):
+    """Returns the spatial extent of a list of features.
+
+    Args:
+        features (list): List of Feature objects.
+
+    Returns:
+        list: Spatial extent list. (xmin, xmax, ymin, ymax).
+    """
+    extents = [f.geometry.extent() for f in features
+               if f.geometry is not None]
+    extents = [e for e in extents if e] or [[0, 0, 0, 0]]
+    return [min([e[0] for e in extents]), max([e[1] for e in extents]),
+            min([e[2] for e in extents]), max([e[3] for e in extents])]
+
+def _sorted_run(iterator, key_func, counter, size):
+    """Returns a sorted run of (key, sequence, feature) tuples.
+
+    Args:
+        iterator: Feature objects iterator.
+
+        key_func (function): Feature key function.
+
+        counter: Sequence counter keeping the sort stable.
+
+        size (int): Maximum number of features in the run.
+
+    Returns:
+        list: Sorted run.
+    """
+    run = [(key_func(feature), next(counter), feature)
+           for feature in itertools.islice(iterator, size)]
+    run.sort(key=lambda item: item[:2])
+    return run
+
+def _write_run(run):
+    """Write a sorted run to a temporary file.
+
+    Args:
+        run (list): Sorted run.
+
+    Returns:
+        file: Temporary file holding one JSON feature per line.
+    """
+    run_file = tempfile.NamedTemporaryFile(delete=False,
+        prefix='snowfloat_run_')
+    for key, seq, feature in run:
+        run_file.write(json.dumps([key, seq, _dump_feature(feature)]))
+        run_file.write('\n')
+    run_file.flush()
+    run_file.seek(0)
+    return run_file
+
+def _read_run(run_file):
+    """Read a sorted run from a temporary file.
+
+    Args:
+        run_file (file): Temporary file.
+
+    Returns:
+        generator. Yields (key, sequence, feature) tuples.
+    """
+    for line in run_file:
+        key, seq, data = json.loads(line)
+        yield key, seq, _load_feature(data)
+
+def _dump_feature(feature):
+    """Returns a feature as a JSON-serializable dictionary.
+
+    Args:
+        feature (Feature): Feature object.
+
+    Returns:
+        dict: Feature dictionary.
+    """
+    data = {'fields': feature.fields,
+            'uuid': feature.uuid,
+            'uri': feature.uri,
+            'date_created': feature.date_created,
+            'date_modified': feature.date_modified,
+            'layer_uuid': feature.layer_uuid,
+            'spatial': feature.spatial,
+            'geometry': None}
+    if feature.geometry is not None:
+        data['geometry'] = snowfloat.feature.format_feature(
+            feature)['geometry']
+    if hasattr(data['spatial'], 'geometry_type'):
+        # read back as a geometry on first access
+        data['spatial'] = snowfloat.feature.format_feature(
+            snowfloat.feature.Feature(data['spatial']))['geometry']
+    return data
+
+def _load_feature(data):
+    """Returns a Feature object from a feature dictionary.
+
+    Args:
+        data (dict): Feature dictionary.
+
+    Returns:
+        Feature: Feature object.
+    """
+    geometry = data.pop('geometry')
+    if geometry:
+        geometry = snowfloat.feature.get_geometry_from_geojson(geometry)
+    fields = data.pop('fields')
+    return snowfloat.feature.Feature(geometry, fields=fields,
+        **dict((str(key), val) for key, val in data.iteritems()))
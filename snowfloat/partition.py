@@ -0,0 +1,171 @@
+"""Parallel scans of a layer split in disjoint partitions."""
+
+import math
+import Queue
+import threading
+
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.pool
+import snowfloat.settings
+
+# coordinate bounding the edge tiles when no world extent is given
+UNBOUNDED = 1e15
+
+def tile_partitions(extent, num_partitions, world=None):
+    """Returns spatial tiles partitions covering an extent.
+
+    The outer edges of the edge tiles are pushed to the world bounds, so
+    features outside an outdated extent are still part of a tile. Features
+    crossing tiles boundaries are part of several partitions. Features
+    without geometry are part of a last partition.
+
+    Args:
+        extent (list): Spatial extent list. (xmin, xmax, ymin, ymax).
+
+        num_partitions (int): Number of tiles.
+
+    Kwargs:
+        world (list): Extent the edge tiles stretch to. Unbounded by
+            default.
+
+    Returns:
+        list: List of query conditions dictionaries, one per tile and one
+            for features without geometry.
+    """
+    xmin, xmax, ymin, ymax = extent
+    if world is None:
+        world = [-UNBOUNDED, UNBOUNDED, -UNBOUNDED, UNBOUNDED]
+    rows = max([i for i in xrange(1, int(math.sqrt(num_partitions)) + 1)
+                if num_partitions % i == 0])
+    cols = num_partitions // rows
+    width = (xmax - xmin) / float(cols)
+    height = (ymax - ymin) / float(rows)
+    partitions = []
+    for row in xrange(rows):
+        y_1 = min(world[2], ymin) if row == 0 else ymin + row * height
+        y_2 = max(world[3], ymax) if row == rows - 1 else \
+            ymin + (row + 1) * height
+        for col in xrange(cols):
+            x_1 = min(world[0], xmin) if col == 0 else xmin + col * width
+            x_2 = max(world[1], xmax) if col == cols - 1 else \
+                xmin + (col + 1) * width
+            partitions.append({
+                'query': 'intersects',
+                'geometry': snowfloat.geometry.Polygon([[
+                    [x_1, y_1], [x_2, y_1], [x_2, y_2], [x_1, y_2],
+                    [x_1, y_1]]])})
+    partitions.append({'geometry_isnull': True})
+    return partitions
+
+def slice_partitions(total, num_partitions, order_by=('uuid',)):
+    """Returns slice ranges partitions of an ordered result.
+
+    The last range is open-ended, so features added after the count are
+    still part of it.
+
+    Args:
+        total (int): Number of features to split.
+
+        num_partitions (int): Maximum number of ranges.
+
+    Kwargs:
+        order_by (tuple): Stable order the ranges are taken in.
+
+    Returns:
+        list: List of query conditions dictionaries, one per range.
+    """
+    bounds = [total * i // num_partitions
+              for i in xrange(num_partitions + 1)]
+    slices = [(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+              if end > start]
+    slices[-1:] = [(slices[-1][0] if slices else 0,)]
+    return [{'query_slice': query_slice, 'order_by': order_by}
+            for query_slice in slices]
+
+def scan(uri, partitions, max_workers=None, lazy=False, overlapping=True,
+        **kwargs):
+    """GET the features of several partitions concurrently.
+
+    Each partition is paged through by a worker thread. Features are
+    yielded in no particular order. When partitions overlap, features
+    already seen in another partition are skipped, which keeps the uuids
+    seen in memory.
+
+    Args:
+        uri (str): Layer URI.
+
+        partitions (list): List of query conditions dictionaries.
+
+    Kwargs:
+        max_workers (int): Maximum number of partitions fetched at the same
+            time.
+
+        lazy (bool): Decode the geometries on first access only.
+
+        overlapping (bool): Whether a feature can be part of several
+            partitions.
+
+        Same as snowfloat.feature.get_pages, applied to every partition.
+
+    Returns:
+        generator. Yields Feature objects.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    max_workers = max_workers or snowfloat.settings.PARTITION_MAX_WORKERS
+    queue = Queue.Queue(2 * max_workers)
+    stop = threading.Event()
+
+    def put(item):
+        """Put an item in the queue unless the consumer stopped."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def fetch(conditions):
+        """Put a partition pages in the queue until done or stopped."""
+        if stop.is_set():
+            return
+        params = dict(kwargs)
+        params.update(conditions)
+        pages = snowfloat.feature.get_pages(uri, **params)
+        try:
+            for page in pages:
+                if not put((page, None)):
+                    return
+        # pylint: disable=W0703
+        except Exception, exception:
+            put((None, exception))
+            return
+        finally:
+            pages.close()
+        put((None, None))
+
+    pool = snowfloat.pool.WorkerPool(max_workers)
+    for conditions in partitions:
+        pool.submit(fetch, conditions)
+    seen = set()
+    remaining = len(partitions)
+    try:
+        while remaining:
+            page, exception = queue.get()
+            if exception:
+                raise exception
+            if page is None:
+                remaining -= 1
+                continue
+            if overlapping:
+                page = [feature for feature in page
+                        if feature['id'] not in seen]
+                seen.update(feature['id'] for feature in page)
+            for feature in snowfloat.feature.parse_features(page, lazy=lazy):
+                yield feature
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)
@@ -0,0 +1,201 @@
+"""Worker threads pool and futures."""
+
+import Queue
+import threading
+
+import snowfloat.errors
+
+class Future(object):
+    """Result of a call running in a worker thread.
+
+    Callers wait on the future to get the call return value or the
+    exception it raised.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """Returns True if the call completed."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Returns the call return value.
+
+        Kwargs:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            Call return value.
+
+        Raises:
+            snowfloat.errors.TimeoutError, exception raised by the call.
+        """
+        self._wait(timeout)
+        if self._exception:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns the exception raised by the call or None.
+
+        Kwargs:
+            timeout (float): Maximum number of seconds to wait.
+
+        Raises:
+            snowfloat.errors.TimeoutError
+        """
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, func):
+        """Call func with this future when the call completes.
+
+        Args:
+            func (function): Callback.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(func)
+                return
+        func(self)
+
+    def set_result(self, result):
+        """Set the call return value.
+
+        Args:
+            result: Call return value.
+        """
+        self._result = result
+        self._set_done()
+
+    def set_exception(self, exception):
+        """Set the exception raised by the call.
+
+        Args:
+            exception (Exception): Exception raised.
+        """
+        self._exception = exception
+        self._set_done()
+
+    def _set_done(self):
+        """Mark the future as done and run the callbacks."""
+        with self._lock:
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for func in callbacks:
+            func(self)
+
+    def _wait(self, timeout):
+        """Wait for the call to complete.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Raises:
+            snowfloat.errors.TimeoutError
+        """
+        if not self._event.wait(timeout):
+            raise snowfloat.errors.TimeoutError(
+                'Call did not complete in %s seconds.' % (timeout,))
+
+
+class WorkerPool(object):
+    """Pool of worker threads running calls submitted.
+
+    Attributes:
+        max_workers (int): Maximum number of calls running at the same time.
+
+        max_queued (int): Maximum number of calls waiting for a worker.
+            Submitting blocks when reached. 0 means no limit.
+    """
+
+    def __init__(self, max_workers, max_queued=0):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._queue = Queue.Queue(max_queued)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, func, *args, **kwargs):
+        """Submit a call to run in a worker thread.
+
+        Args:
+            func (function): Function to call.
+
+        Returns:
+            Future: Call future.
+
+        Raises:
+            snowfloat.errors.Error
+        """
+        with self._lock:
+            if self._shutdown:
+                raise snowfloat.errors.Error('Pool is shut down.')
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def map(self, func, iterable):
+        """Call func on each item and yield the results in order.
+
+        Args:
+            func (function): Function to call.
+
+            iterable: Items to pass to the function.
+
+        Returns:
+            generator: Yields return values.
+        """
+        futures = [self.submit(func, item) for item in iterable]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the calls submitted are done.
+
+        Kwargs:
+            wait (bool): Wait for the workers to stop.
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = self._threads[:]
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def _run(self):
+        """Worker thread loop."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+            # pylint: disable=W0703
+            except Exception, exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
@@ -5,6 +5,8 @@ import email.utils
 import hashlib
 import hmac
 import json
+import Queue
+import threading
 import time
 import urllib
 
@@ -15,6 +17,8 @@ import snowfloat.errors
 import snowfloat.geometry
 import snowfloat.settings
 
+GEOMETRY_FORMATS = ('full', 'none', 'bbox', 'centroid')
+
 def get(uri, params=None, headers=None):
     """GET from server.
 
@@ -46,7 +50,62 @@ def get(uri, params=None, headers=None):
                 continue
         break
 
-def post(uri, data, headers=None, format_func=None, serialize=True):
+def prefetch(pages, depth):
+    """Fetch pages ahead of the consumer in a background thread.
+
+    The background thread stops once the consumer stops iterating.
+
+    Args:
+        pages (generator): Pages generator.
+
+        depth (int): Maximum number of pages fetched ahead.
+
+    Returns:
+        generator: Yields pages.
+    """
+    queue = Queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(item):
+        """Put an item in the queue unless the consumer stopped."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def run():
+        """Put pages in the queue until done or stopped."""
+        try:
+            for page in pages:
+                if not put((page, None)):
+                    return
+        # pylint: disable=W0703
+        except Exception, exception:
+            put((None, exception))
+            return
+        finally:
+            pages.close()
+        put((None, None))
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            page, exception = queue.get()
+            if exception:
+                raise exception
+            if page is None:
+                break
+            yield page
+    finally:
+        stop.set()
+
+def post(uri, data, headers=None, format_func=None, serialize=True,
+        retries=None):
     """POST to server.
 
     Args:
@@ -61,6 +120,8 @@ def post(uri, data, headers=None, format_func=None, serialize=True):
 
         serialize (bool): JSON-serialize the data to post or not.
 
+        retries (int): Number of attempts. Default to settings.HTTP_RETRIES.
+
     Returns:
         str: Server response.
     """
@@ -69,7 +130,8 @@ def post(uri, data, headers=None, format_func=None, serialize=True):
         data_to_post = format_func(data_to_post)
     if serialize:
         data_to_post = json.dumps(data_to_post)
-    return send(requests.post, uri, data=data_to_post, headers=headers)
+    return send(requests.post, uri, data=data_to_post, headers=headers,
+        retries=retries)
 
 def put(uri, data, headers=None):
     """PUT to server.
@@ -106,7 +168,7 @@ def delete(uri, params=None, headers=None):
         request_params = {}
     return send(requests.delete, uri, params=request_params, headers=headers)
 
-def send(method, uri, params=None, data=None, headers=None):
+def send(method, uri, params=None, data=None, headers=None, retries=None):
     """Send request to server.
 
     Args:
@@ -121,6 +183,9 @@ def send(method, uri, params=None, data=None, headers=None):
 
         headers (dict): Request headers.
 
+        retries (int): Number of attempts on 429, 5xx responses and
+            timeouts. Default to settings.HTTP_RETRIES.
+
     Returns:
         str: Server response.
     """
@@ -140,7 +205,7 @@ def send(method, uri, params=None, data=None, headers=None):
     url = _format_url(uri)
 
     message = None
-    retries = snowfloat.settings.HTTP_RETRIES
+    retries = retries or snowfloat.settings.HTTP_RETRIES
     timeout = snowfloat.settings.HTTP_TIMEOUT
     while retries:
         try:
@@ -157,8 +222,9 @@ def send(method, uri, params=None, data=None, headers=None):
                 timeout *= 2
             res = None
 
-        time.sleep(snowfloat.settings.HTTP_RETRY_INTERVAL)
         retries -= 1
+        if retries:
+            time.sleep(snowfloat.settings.HTTP_RETRY_INTERVAL)
 
     raise_request_error(res, message)
 
@@ -314,6 +380,10 @@ def format_params(kwargs, exclude=None):
     Returns:
 
         dict: Dictionary of formatted parameters.
+
+    Raises:
+
+        ValueError
     """    
     if not exclude:
         exclude = ()
@@ -336,6 +406,12 @@ def format_params(kwargs, exclude=None):
             if len(val) == 2:
                 params['slice_end'] = val[1]
             params['slice_start'] = val[0]
+        elif key == 'include_fields':
+            params['fields'] = ','.join('field_%s' % (name,) for name in val)
+        elif key == 'geometry_format':
+            if val not in GEOMETRY_FORMATS:
+                raise ValueError('Unknown geometry format %r.' % (val,))
+            params[key] = val
         elif (not key.startswith('spatial_')
                 and not key in exclude):
             key = key.replace('layer_', 'layer__')
@@ -14,13 +14,14 @@ class Result(object):
 
         date_modified (str): Modification date in ISO format.
     """
-    uuid = None
-    uri = None
-    date_created = None
-    date_modified = None
-    tag = None
+    __slots__ = ('uuid', 'uri', 'date_created', 'date_modified', 'tag')
 
     def __init__(self, **kwargs):
+        self.uuid = None
+        self.uri = None
+        self.date_created = None
+        self.date_modified = None
+        self.tag = None
         for key, val in kwargs.items():
             getattr(self, key)
             setattr(self, key, val)
@@ -0,0 +1,198 @@
+"""Client-side validation of features against a layer schema."""
+
+import snowfloat.errors
+
+GEOMETRY_TYPES = ('Point', 'LineString', 'Polygon', 'MultiPoint',
+                  'MultiLineString', 'MultiPolygon', 'GeometryCollection')
+
+class Validator(object):
+    """Features validator compiled from a layer schema.
+
+    Field values are coerced to the field type in place when possible.
+
+    Attributes:
+        fields (list): List of fields definitions.
+
+        dims (int): Spatial reference system number of dimensions.
+
+        srid (int): Spatial reference system SRID code.
+    """
+
+    def __init__(self, fields=None, dims=None, srid=None):
+        self.fields = fields or []
+        self.dims = dims
+        self.srid = srid
+        self._checks = {}
+        self._required = []
+        for field in self.fields:
+            self._checks[field['name']] = _compile_field(field)
+            if field.get('required'):
+                self._required.append(field['name'])
+
+    def validate(self, feature):
+        """Validate and coerce a feature.
+
+        Args:
+            feature (Feature): Feature object.
+
+        Returns:
+            list: List of error messages. Empty if the feature is valid.
+        """
+        messages = []
+        fields = feature.fields
+        for name in self._required:
+            if fields.get(name) is None:
+                messages.append('Field %s is required.' % (name,))
+        if self._checks:
+            for name, val in fields.items():
+                try:
+                    check = self._checks[name]
+                except KeyError:
+                    messages.append('Field %s is not defined.' % (name,))
+                    continue
+                if val is None:
+                    continue
+                try:
+                    fields[name] = check(val)
+                except ValueError, exception:
+                    messages.append('Field %s: %s' % (name, exception))
+        if feature.geometry is not None:
+            messages.extend(self._validate_geometry(feature.geometry))
+        return messages
+
+    def validate_features(self, features):
+        """Validate and coerce features.
+
+        Args:
+            features (list): List of Feature objects.
+
+        Returns:
+            tuple: List of valid features and list of (index, feature,
+                messages) tuples for the invalid ones.
+        """
+        valid = []
+        errors = []
+        for index, feature in enumerate(features):
+            messages = self.validate(feature)
+            if messages:
+                errors.append((index, feature, messages))
+            else:
+                valid.append(feature)
+        return valid, errors
+
+    def check(self, features):
+        """Validate and coerce features, raising on invalid ones.
+
+        Args:
+            features (list): List of Feature objects.
+
+        Raises:
+            snowfloat.errors.ValidationError
+        """
+        _, errors = self.validate_features(features)
+        if errors:
+            raise snowfloat.errors.ValidationError(
+                '%d invalid features.' % (len(errors),), errors)
+
+    def _validate_geometry(self, geometry):
+        """Validate a geometry type, dimensions and coordinates range.
+
+        Args:
+            geometry (Geometry): Geometry object.
+
+        Returns:
+            list: List of error messages.
+        """
+        if geometry.geometry_type not in GEOMETRY_TYPES:
+            return ['Invalid geometry type %s.' % (geometry.geometry_type,)]
+        if geometry.geometry_type == 'GeometryCollection':
+            messages = []
+            for geom in geometry.geometries:
+                messages.extend(self._validate_geometry(geom))
+            return messages
+        messages = []
+        if self.dims:
+            coords = geometry.coordinates
+            while coords and isinstance(coords[0], (list, tuple)):
+                coords = coords[0]
+            if coords and len(coords) != self.dims:
+                messages.append('Geometry has %d dimensions, expected %d.'
+                    % (len(coords), self.dims))
+        if self.srid == 4326:
+            extent = geometry.extent()
+            if extent and (extent[0] < -180 or extent[1] > 180
+                    or extent[2] < -90 or extent[3] > 90):
+                messages.append('Geometry coordinates out of range for '
+                    'SRID 4326.')
+        return messages
+
+
+def _compile_field(field):
+    """Returns a function checking and coercing a field value.
+
+    Args:
+        field (dict): Field definition.
+
+    Returns:
+        function: Takes a value and returns the coerced value.
+
+    Raises:
+        ValueError
+    """
+    field_type = field.get('type')
+    size = field.get('size')
+
+    if field_type == 'string':
+        def check(val):
+            """Check a string value."""
+            if isinstance(val, bool) or not isinstance(val,
+                    (basestring, int, long, float)):
+                raise ValueError('%r is not a string.' % (val,))
+            if not isinstance(val, basestring):
+                val = unicode(val)
+            if size and len(val) > size:
+                raise ValueError('length %d greater than %d.'
+                    % (len(val), size))
+            return val
+    elif field_type == 'integer':
+        def check(val):
+            """Check an integer value."""
+            if isinstance(val, bool):
+                raise ValueError('%r is not an integer.' % (val,))
+            if isinstance(val, (int, long)):
+                return val
+            if isinstance(val, float) and val.is_integer():
+                return int(val)
+            if isinstance(val, basestring):
+                try:
+                    return int(val)
+                except ValueError:
+                    pass
+            raise ValueError('%r is not an integer.' % (val,))
+    elif field_type in ('real', 'float'):
+        def check(val):
+            """Check a real value."""
+            if isinstance(val, bool):
+                raise ValueError('%r is not a real.' % (val,))
+            if isinstance(val, (int, long, float)):
+                return val
+            if isinstance(val, basestring):
+                try:
+                    return float(val)
+                except ValueError:
+                    pass
+            raise ValueError('%r is not a real.' % (val,))
+    elif field_type == 'boolean':
+        def check(val):
+            """Check a boolean value."""
+            if isinstance(val, bool):
+                return val
+            if val in (0, 1):
+                return bool(val)
+            raise ValueError('%r is not a boolean.' % (val,))
+    else:
+        def check(val):
+            """Values of other types are sent as is."""
+            return val
+
+    return check
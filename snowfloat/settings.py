@@ -6,6 +6,49 @@ HTTP_TIMEOUT = 10
 HTTP_RETRIES = 3
 HTTP_RETRY_INTERVAL = 5
 
+BATCH_MAX_FEATURES = 1000
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+BATCH_MAX_AGE = 5
+BATCH_MAX_WORKERS = 2
+
+ADAPTIVE_BATCH_SIZE = 100
+ADAPTIVE_MAX_BATCH_SIZE = 1000
+ADAPTIVE_BATCH_STEP = 50
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_TARGET_LATENCY = 5
+ADAPTIVE_DECREASE_FACTOR = 0.5
+ADAPTIVE_MAX_RETRIES = 5
+ADAPTIVE_BACKOFF = 0.5
+ADAPTIVE_MAX_BACKOFF = 30
+
+ORDERING_MAX_IN_MEMORY = 100000
+
+COUNT_CACHE_TTL = 60
+COUNT_CACHE_MAX_ENTRIES = 128
+
+PARTITION_MAX_WORKERS = 4
+
+KEYSET_PAGE_SIZE = 1000
+
+ARROW_ROW_GROUP_SIZE = 65536
+
+SPATIAL_INDEX_NODE_CAPACITY = 16
+
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+TILE_CACHE_MAX_TILES = 1024
+TILE_CACHE_TTL = 300
+TILE_CACHE_MAX_WORKERS = 4
+
+POINT_GRID_POINTS_PER_CELL = 4
+
+STATS_HLL_PRECISION = 12
+
+MEMBERSHIP_FILTER_MIN_CAPACITY = 1024
+MEMBERSHIP_FILTER_ERROR_RATE = 0.01
+MEMBERSHIP_FILTER_MAX_WORKERS = 4
+
 HOST = 'api.snowfloat.com:443'
 API_KEY_ID = ''
 API_SECRET_KEY = ''
@@ -0,0 +1,59 @@
+"""Notifications of the writes made through the client."""
+
+import threading
+
+ACTIONS = ('add', 'update', 'delete', 'layer')
+
+_listeners = []
+_lock = threading.Lock()
+
+def connect(listener):
+    """Register a function called after each write.
+
+    Args:
+        listener (function): Called with the layer uuid, the action (add,
+            update, delete or layer) and the features. Layer uuid is None
+            when all layers were written.
+    """
+    with _lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+def disconnect(listener):
+    """Unregister a listener.
+
+    Args:
+        listener (function): Function registered with connect.
+    """
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+def send(layer_uuid, action, features=None):
+    """Notify the listeners of a write.
+
+    Args:
+        layer_uuid (str): Layer's UUID. None for all layers.
+
+        action (str): add, update, delete or layer.
+
+    Kwargs:
+        features (list): Feature objects added or updated, or uuids of the
+            features deleted. None when unknown: features deleted by
+            conditions or a batch which failed part way.
+    """
+    with _lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(layer_uuid, action, features)
+
+def get_layer_uuid(uri):
+    """Returns the layer's UUID of a layer or feature URI.
+
+    Args:
+        uri (str): URI like /geo/1/layers/<uuid>/features.
+
+    Returns:
+        str: Layer's UUID.
+    """
+    return uri.split('/')[4]
@@ -0,0 +1,343 @@
+"""Statistics of layer's features computed in one pass."""
+
+import base64
+import hashlib
+import json
+import math
+import struct
+import threading
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.settings
+import snowfloat.signals
+
+VERSION = 1
+
+class HyperLogLog(object):
+    """Estimator of the number of distinct values.
+
+    Values are hashed in 2 ** precision registers keeping the longest run
+    of leading zeros seen, so the memory used does not depend on the
+    number of values. The standard error is 1.04 / sqrt(2 ** precision).
+
+    Attributes:
+        precision (int): Number of hash bits selecting the register, 4 to
+            16.
+    """
+
+    def __init__(self, precision=None, registers=None):
+        self.precision = precision or snowfloat.settings.STATS_HLL_PRECISION
+        if not 4 <= self.precision <= 16:
+            raise ValueError('HyperLogLog precision %r not in 4..16.'
+                % (self.precision,))
+        size = 1 << self.precision
+        if registers is None:
+            registers = bytearray(size)
+        elif len(registers) != size:
+            raise ValueError('%d registers for precision %d.'
+                % (len(registers), self.precision))
+        self._registers = registers
+
+    def add(self, value):
+        """Count a value.
+
+        Args:
+            value: JSON serializable value.
+        """
+        key = json.dumps(value, sort_keys=True)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        hashed = struct.unpack('>Q', hashlib.sha1(key).digest()[:8])[0]
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self):
+        """Returns the estimated number of distinct values.
+
+        Returns:
+            int: Estimate, exact in most cases below a few hundred values.
+        """
+        size = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(
+            [2.0 ** -rank for rank in self._registers])
+        zeros = self._registers.count('\x00')
+        if estimate <= 2.5 * size and zeros:
+            # linear counting is more accurate on few values
+            estimate = size * math.log(float(size) / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        """Count the values of another estimator.
+
+        Args:
+            other (HyperLogLog): Estimator of the same precision.
+        """
+        if other.precision != self.precision:
+            raise ValueError('Can not merge precisions %d and %d.'
+                % (self.precision, other.precision))
+        # pylint: disable=W0212
+        self._registers = bytearray(max(ranks) for ranks in
+                                    zip(self._registers, other._registers))
+
+    def to_json(self):
+        """Returns a JSON serializable dictionary of the estimator."""
+        return {'precision': self.precision,
+                'registers': base64.b64encode(bytes(self._registers))}
+
+
+class LayerStats(object):
+    """Extent, counters, fields ranges and geometry types of a layer.
+
+    Features are counted like the server counts them: the points of a
+    polygon are the points of its exterior ring.
+
+    The statistics cover all the layer's features. Given a layer uuid, they
+    follow the features added, updated and deleted through the client. The values replaced by updates and the
+    features deleted are not known: num_features stays exact, but once
+    exact is unset num_points and geometry_types are estimates, and the
+    extent, ranges and distinct estimates are upper bounds. Writes the
+    statistics can not follow, like deletes by conditions, set their stale
+    attribute. Thread-safe.
+
+    Attributes:
+        layer_uuid (str): Layer's UUID the statistics follow the writes of.
+
+        num_features (int): Number of features.
+
+        num_points (int): Number of points.
+
+        extent (list): Spatial extent list. (xmin, xmax, ymin, ymax). None
+            without coordinates.
+
+        geometry_types (dict): Number of features by geometry type.
+
+        fields (dict): Statistics by field name: count of non null values,
+            min, max and distinct estimate.
+
+        exact (bool): False once features were updated or deleted.
+
+        stale (bool): True once the layer was written in a way the
+            statistics could not follow.
+
+        layer_version (list): Number of features and last modification
+            date of the layer when the statistics were computed. See
+            snowfloat.feature.get_layer_version.
+
+        precision (int): HyperLogLog precision of the distinct estimates.
+    """
+
+    def __init__(self, layer_uuid=None, precision=None):
+        self.layer_uuid = layer_uuid
+        self.num_features = 0
+        self.num_points = 0
+        self.extent = None
+        self.geometry_types = {}
+        self.exact = True
+        self.stale = False
+        self.layer_version = None
+        self.precision = precision or snowfloat.settings.STATS_HLL_PRECISION
+        self._fields = {}
+        self._lock = threading.Lock()
+        if layer_uuid is not None:
+            snowfloat.signals.connect(self._on_write)
+
+    @property
+    def fields(self):
+        """Returns the statistics by field name."""
+        with self._lock:
+            return dict((name, {'count': field['count'],
+                                'min': field['min'],
+                                'max': field['max'],
+                                'distinct': field['distinct'].count()})
+                        for name, field in self._fields.iteritems())
+
+    def add_geojson(self, feature):
+        """Count a feature.
+
+        Args:
+            feature (dict): GeoJSON feature dictionary.
+        """
+        with self._lock:
+            self._add(feature, True)
+
+    def save(self, path):
+        """Write the statistics to a JSON file.
+
+        Args:
+            path (str): File path.
+        """
+        with self._lock:
+            data = {'version': VERSION,
+                    'layer_uuid': self.layer_uuid,
+                    'num_features': self.num_features,
+                    'num_points': self.num_points,
+                    'extent': self.extent,
+                    'geometry_types': self.geometry_types,
+                    'exact': self.exact,
+                    'stale': self.stale,
+                    'layer_version': self.layer_version,
+                    'precision': self.precision,
+                    'fields': dict(
+                        (name, {'count': field['count'],
+                                'min': field['min'],
+                                'max': field['max'],
+                                'distinct': field['distinct'].to_json()})
+                        for name, field in self._fields.iteritems())}
+        with open(path, 'w') as stats_file:
+            json.dump(data, stats_file)
+
+    def close(self):
+        """Stop following the layer's writes."""
+        snowfloat.signals.disconnect(self._on_write)
+
+    def _add(self, feature, count):
+        """Count a GeoJSON feature, or only widen the ranges if count is
+        False. Called with the lock held."""
+        geometry = feature.get('geometry')
+        if count:
+            self.num_features += 1
+            self.num_points += \
+                snowfloat.geometry.get_geojson_num_points(geometry)
+            geometry_type = geometry['type'] if geometry else None
+            self.geometry_types[geometry_type] = \
+                self.geometry_types.get(geometry_type, 0) + 1
+        extent = snowfloat.geometry.get_geojson_extent(geometry)
+        if extent:
+            if self.extent is None:
+                self.extent = extent
+            else:
+                self.extent = [min(self.extent[0], extent[0]),
+                               max(self.extent[1], extent[1]),
+                               min(self.extent[2], extent[2]),
+                               max(self.extent[3], extent[3])]
+        for key, val in (feature.get('properties') or {}).iteritems():
+            if not key.startswith('field_') or val is None:
+                continue
+            name = key[6:]
+            field = self._fields.get(name)
+            if field is None:
+                field = self._fields[name] = {
+                    'count': 0, 'min': val, 'max': val,
+                    'distinct': HyperLogLog(self.precision)}
+            if count:
+                field['count'] += 1
+            if val < field['min']:
+                field['min'] = val
+            if val > field['max']:
+                field['max'] = val
+            field['distinct'].add(val)
+
+    def _on_write(self, layer_uuid, action, features):
+        """Signal listener applying the layer's writes."""
+        if layer_uuid is not None and layer_uuid != self.layer_uuid:
+            return
+        with self._lock:
+            if features is None or action == 'layer':
+                self.stale = True
+                return
+            if action == 'add':
+                for feature in features:
+                    self._add(snowfloat.feature.format_feature(feature), True)
+            elif action == 'update':
+                self.exact = False
+                for feature in features:
+                    self._add(snowfloat.feature.format_feature(feature),
+                              False)
+            elif action == 'delete':
+                # the deleted features points and geometry types are unknown
+                self.exact = False
+                self.num_features -= len(features)
+
+
+def compute_stats(uri, layer_uuid=None, precision=None, page_size=None,
+        prefetch=0):
+    """Compute the statistics of a stream of all the layer's features.
+
+    Args:
+        uri (str): Layer URI.
+
+    Kwargs:
+        layer_uuid (str): Layer's UUID the statistics follow the writes of.
+
+        precision (int): HyperLogLog precision of the distinct estimates.
+
+        page_size (int): Number of features per page.
+
+        prefetch (int): Number of pages fetched ahead in a background
+            thread.
+
+    Returns:
+        LayerStats: Layer's statistics.
+
+    Raises:
+        snowfloat.errors.RequestError
+    """
+    stats = LayerStats(layer_uuid=layer_uuid, precision=precision)
+    try:
+        # taken first: writes during the pass make the version older
+        stats.layer_version = snowfloat.feature.get_layer_version(uri)
+        pages = snowfloat.feature.get_pages(uri, page_size=page_size,
+            prefetch=prefetch)
+        try:
+            for page in pages:
+                for feature in page:
+                    stats.add_geojson(feature)
+        finally:
+            pages.close()
+    except:
+        stats.close()
+        raise
+    return stats
+
+def load_stats(path, layer_uuid=None):
+    """Read statistics written by LayerStats.save.
+
+    Args:
+        path (str): File path.
+
+    Kwargs:
+        layer_uuid (str): Layer's UUID the statistics follow the writes of.
+
+    Returns:
+        LayerStats: Layer's statistics.
+
+    Raises:
+        snowfloat.errors.Error
+    """
+    try:
+        with open(path) as stats_file:
+            data = json.load(stats_file)
+    except (IOError, ValueError), e:
+        raise snowfloat.errors.Error('Can not read statistics %s: %s.'
+            % (path, e))
+    if data.get('version') != VERSION:
+        raise snowfloat.errors.Error('Unknown statistics version %r.'
+            % (data.get('version'),))
+    if layer_uuid is not None and data['layer_uuid'] not in (None,
+            layer_uuid):
+        raise snowfloat.errors.Error('Statistics of layer %s, not %s.'
+            % (data['layer_uuid'], layer_uuid))
+    stats = LayerStats(layer_uuid=layer_uuid, precision=data['precision'])
+    stats.num_features = data['num_features']
+    stats.num_points = data['num_points']
+    stats.extent = data['extent']
+    # JSON keys are strings: the null geometry type is read back as 'null'
+    stats.geometry_types = dict(
+        (None if key == 'null' else key, val)
+        for key, val in data['geometry_types'].iteritems())
+    stats.exact = data['exact']
+    stats.stale = data['stale']
+    stats.layer_version = data.get('layer_version')
+    # pylint: disable=W0212
+    for name, field in data['fields'].iteritems():
+        stats._fields[name] = {
+            'count': field['count'], 'min': field['min'], 'max': field['max'],
+            'distinct': HyperLogLog(field['distinct']['precision'],
+                bytearray(base64.b64decode(field['distinct']['registers'])))}
+    return stats
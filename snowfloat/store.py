@@ -0,0 +1,236 @@
+"""Memory-mapped on-disk store of layer's geometries coordinates."""
+
+import json
+import os
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+import snowfloat.columnar
+import snowfloat.errors
+import snowfloat.feature
+
+VERSION = 1
+
+# file name and dtype of each array
+ARRAYS = {'coordinates': ('coordinates.f64', '<f8'),
+          'geometry_types': ('geometry_types.i8', 'i1'),
+          'geometry_offsets': ('geometry_offsets.i64', '<i8'),
+          'part_offsets': ('part_offsets.i64', '<i8'),
+          'ring_offsets': ('ring_offsets.i64', '<i8'),
+          'uuid_index': ('uuid_index.i64', '<i8')}
+
+UUIDS_FILE = 'uuids.bin'
+COLLECTIONS_FILE = 'collections.json'
+META_FILE = 'meta.json'
+
+class CoordinateStore(object):
+    """Geometries coordinates read from memory-mapped files.
+
+    The files hold the columnar layout of FeatureBatch: a flat float64
+    vertices file and int64 offsets files splitting it in rings, parts and
+    geometries. They are mapped read-only, so processes opening the same
+    store share one copy in the page cache and geometries are only read
+    from disk when accessed.
+
+    Attributes:
+        path (str): Store directory.
+
+        dims (int): Number of dimensions of each vertex.
+
+        batch (FeatureBatch): Columns view over the mapped files, without
+            URIs, dates and fields.
+    """
+
+    def __init__(self, path):
+        if numpy is None: # pragma: no cover
+            raise snowfloat.errors.Error(
+                'numpy is required for coordinate stores.')
+        self.path = path
+        try:
+            with open(os.path.join(path, META_FILE)) as meta_file:
+                meta = json.load(meta_file)
+        except IOError:
+            raise snowfloat.errors.Error('No coordinate store in %s.'
+                % (path,))
+        if meta['version'] != VERSION:
+            raise snowfloat.errors.Error('Unknown coordinate store version '
+                '%r.' % (meta['version'],))
+        self.dims = meta['dims']
+        arrays = dict((name, self._map(file_name, dtype))
+                      for name, (file_name, dtype) in ARRAYS.iteritems())
+        self._uuids = self._map(UUIDS_FILE, 'S%d' % (meta['uuid_width'],))
+        self._uuid_index = arrays.pop('uuid_index')
+        with open(os.path.join(path, COLLECTIONS_FILE)) as collections_file:
+            collections = dict((int(row), geojson) for row, geojson in
+                               json.load(collections_file).iteritems())
+        num = len(arrays['geometry_types'])
+        empty = numpy.empty(num, dtype=object)
+        self.batch = snowfloat.columnar.FeatureBatch(uuids=self._uuids,
+            uris=empty, date_created=empty, date_modified=empty,
+            dims=self.dims, fields={}, collections=collections, **arrays)
+
+    def __len__(self):
+        return len(self._uuids)
+
+    def get_row(self, uuid):
+        """Returns the row of a feature.
+
+        Args:
+            uuid (str): Feature's uuid.
+
+        Returns:
+            int: Feature row. None if not found.
+        """
+        key = uuid.encode('utf-8') if isinstance(uuid, unicode) else uuid
+        low, high = 0, len(self._uuid_index)
+        while low < high:
+            middle = (low + high) // 2
+            if self._uuids[self._uuid_index[middle]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._uuid_index) and \
+                self._uuids[self._uuid_index[low]] == key:
+            return int(self._uuid_index[low])
+        return None
+
+    def get_uuid(self, row):
+        """Returns the uuid of a row.
+
+        Args:
+            row (int): Feature row.
+
+        Returns:
+            str: Feature's uuid.
+        """
+        return self._uuids[row]
+
+    def get_vertices(self, row):
+        """Returns a view of a geometry vertices, without copy.
+
+        Args:
+            row (int): Feature row.
+
+        Returns:
+            numpy.ndarray: (number of vertices, dims) array, read-only.
+                Empty for geometry collections.
+        """
+        batch = self.batch
+        start = batch.ring_offsets[batch.part_offsets[
+            batch.geometry_offsets[row]]]
+        end = batch.ring_offsets[batch.part_offsets[
+            batch.geometry_offsets[row + 1]]]
+        return batch.vertices[start:end]
+
+    def get_geometry(self, row):
+        """Returns a Geometry object read from the store.
+
+        Args:
+            row (int): Feature row.
+
+        Returns:
+            Geometry: Geometry object. None without geometry.
+        """
+        geojson = self.batch.get_geojson(row)
+        if geojson is None:
+            return None
+        return snowfloat.feature.get_geometry_from_geojson(geojson)
+
+    def _map(self, file_name, dtype):
+        """Returns a read-only memory map of a file. Empty files are not
+        mapped."""
+        file_path = os.path.join(self.path, file_name)
+        if not os.path.getsize(file_path):
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(file_path, dtype=dtype, mode='r')
+
+
+def write_store(uri, path, **kwargs):
+    """Write a coordinate store from a stream of layer's features.
+
+    Pages are appended to the files as they are received. The metadata file
+    is written last: a store is only opened once complete.
+
+    Args:
+        uri (str): Layer URI.
+
+        path (str): Store directory, created if missing.
+
+    Kwargs:
+        Same as snowfloat.feature.get_pages, except include_fields and
+        geometry_format.
+
+    Returns:
+        dict: Store statistics: features and vertices.
+
+    Raises:
+        snowfloat.errors.RequestError, snowfloat.errors.Error
+    """
+    if numpy is None: # pragma: no cover
+        raise snowfloat.errors.Error(
+            'numpy is required for coordinate stores.')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    elif os.path.exists(os.path.join(path, META_FILE)):
+        # the store is incomplete until rewritten
+        os.remove(os.path.join(path, META_FILE))
+    files = dict((name, open(os.path.join(path, file_name), 'wb'))
+                 for name, (file_name, _) in ARRAYS.iteritems()
+                 if name != 'uuid_index')
+    uuids = []
+    collections = {}
+    dims = None
+    # number of geometries, parts, rings and vertices written
+    counts = [0, 0, 0, 0]
+    try:
+        for name in ('geometry_offsets', 'part_offsets', 'ring_offsets'):
+            numpy.zeros(1, dtype='<i8').tofile(files[name])
+        pages = snowfloat.feature.get_pages(uri, include_fields=(), **kwargs)
+        try:
+            for page in pages:
+                batch = snowfloat.columnar.parse_feature_batch([page])
+                if len(batch.coordinates):
+                    if dims is None:
+                        dims = batch.dims
+                    elif batch.dims != dims:
+                        raise snowfloat.errors.Error(
+                            'Mixed coordinates dimensions %d and %d.'
+                            % (dims, batch.dims))
+                for row, geojson in batch.collections.iteritems():
+                    collections[counts[0] + row] = geojson
+                uuids.extend(uuid.encode('utf-8')
+                             if isinstance(uuid, unicode) else uuid
+                             for uuid in batch.uuids.tolist())
+                batch.coordinates.astype('<f8').tofile(files['coordinates'])
+                batch.geometry_types.astype('i1').tofile(
+                    files['geometry_types'])
+                for i, name in enumerate(('geometry_offsets',
+                        'part_offsets', 'ring_offsets')):
+                    offsets = getattr(batch, name)
+                    (offsets[1:] + counts[i + 1]).astype('<i8').tofile(
+                        files[name])
+                counts[0] += len(batch)
+                counts[1] += len(batch.part_offsets) - 1
+                counts[2] += len(batch.ring_offsets) - 1
+                counts[3] += len(batch.vertices)
+        finally:
+            pages.close()
+    finally:
+        for data_file in files.itervalues():
+            data_file.close()
+
+    uuid_width = max([len(uuid) for uuid in uuids] or [1])
+    uuids = numpy.array(uuids, dtype='S%d' % (uuid_width,))
+    uuids.tofile(os.path.join(path, UUIDS_FILE))
+    numpy.argsort(uuids, kind='mergesort').astype('<i8').tofile(
+        os.path.join(path, ARRAYS['uuid_index'][0]))
+    with open(os.path.join(path, COLLECTIONS_FILE), 'w') as collections_file:
+        json.dump(collections, collections_file)
+    with open(os.path.join(path, META_FILE), 'w') as meta_file:
+        json.dump({'version': VERSION, 'dims': dims or 2,
+                   'features': counts[0], 'vertices': counts[3],
+                   'uuid_width': uuid_width}, meta_file)
+    return {'features': counts[0], 'vertices': counts[3]}
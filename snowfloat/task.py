@@ -28,18 +28,20 @@ class Task(object):
 
         date_modified (str): Modification date in ISO format.
     """
-    uuid = None
-    uri = None
-    operation = None
-    task_filter = {}
-    spatial = {}
-    state = None
-    extras = {}
-    reason = None
-    date_created = None
-    date_modified = None
+    __slots__ = ('uuid', 'uri', 'operation', 'task_filter', 'spatial',
+                 'state', 'extras', 'reason', 'date_created', 'date_modified')
 
     def __init__(self, **kwargs):
+        self.uuid = None
+        self.uri = None
+        self.operation = None
+        self.task_filter = {}
+        self.spatial = {}
+        self.state = None
+        self.extras = {}
+        self.reason = None
+        self.date_created = None
+        self.date_modified = None
         for key, val in kwargs.items():
             getattr(self, key)
             setattr(self, key, val)
@@ -0,0 +1,288 @@
+"""Cache of layer's features by map tiles."""
+
+import collections
+import json
+import math
+import threading
+import time
+
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.pool
+import snowfloat.settings
+import snowfloat.signals
+
+WEB_MERCATOR_BOUND = 20037508.342789244
+
+# extent tiled at zoom 0 by spatial reference system
+WORLD_EXTENTS = {
+    4326: [-180.0, 180.0, -90.0, 90.0],
+    3857: [-WEB_MERCATOR_BOUND, WEB_MERCATOR_BOUND,
+           -WEB_MERCATOR_BOUND, WEB_MERCATOR_BOUND],
+    900913: [-WEB_MERCATOR_BOUND, WEB_MERCATOR_BOUND,
+             -WEB_MERCATOR_BOUND, WEB_MERCATOR_BOUND]}
+
+class TileCache(object):
+    """Layer's features cached by XYZ tiles.
+
+    Viewports are split in the tiles of a fixed zoom level covering them.
+    Tiles not cached are fetched concurrently with an intersects query on
+    the tile polygon, then kept until they expire or are the least recently
+    used when the cache is full. Tiles of the layer are dropped when it is
+    written through the client. Thread-safe.
+
+    Attributes:
+        layer (Layer): Layer cached.
+
+        zoom (int): Zoom level of the tiles.
+
+        world (list): Extent tiled at zoom 0. (xmin, xmax, ymin, ymax).
+
+        max_tiles (int): Maximum number of tiles cached.
+
+        ttl (float): Number of seconds a tile is cached.
+
+        max_workers (int): Maximum number of tiles fetched at the same time.
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, layer, zoom, world=None, max_tiles=None, ttl=None,
+            max_workers=None):
+        self.layer = layer
+        self.zoom = zoom
+        self.world = world or WORLD_EXTENTS.get(layer.srid) or layer.extent
+        if not self.world:
+            raise ValueError('No extent to tile for SRID %r.' % (layer.srid,))
+        self.max_tiles = max_tiles or snowfloat.settings.TILE_CACHE_MAX_TILES
+        self.ttl = ttl or snowfloat.settings.TILE_CACHE_TTL
+        self.max_workers = max_workers or \
+            snowfloat.settings.TILE_CACHE_MAX_WORKERS
+        self._tiles = collections.OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                       'expirations': 0}
+        snowfloat.signals.connect(self._on_write)
+
+    def get_features(self, extent, lazy=False, **kwargs):
+        """Returns the features in a viewport.
+
+        Args:
+            extent (list): Viewport extent. (xmin, xmax, ymin, ymax).
+
+        Kwargs:
+            lazy (bool): Decode the geometries on first access only.
+
+            page_size (int): Number of features per page fetched.
+
+            prefetch (int): Number of pages fetched ahead.
+
+            Same conditions as get_pages, except query, geometry, distance,
+            query_slice, include_fields and geometry_format. Part of the
+            tiles cache keys.
+
+        Returns:
+            list: List of Feature objects whose bounding box intersects the
+                viewport, each once.
+
+        Raises:
+            snowfloat.errors.RequestError, ValueError
+        """
+        for key in ('include_fields', 'geometry_format'):
+            if key in kwargs:
+                raise ValueError('%s is not supported by the tile cache.'
+                    % (key,))
+        conditions = dict((key, val) for key, val in kwargs.iteritems()
+                          if key not in ('page_size', 'prefetch'))
+        conditions = json.dumps(
+            snowfloat.feature.format_query_params(conditions), sort_keys=True)
+        tiles = get_tiles(extent, self.zoom, self.world)
+        found = {}
+        now = time.time()
+        with self._lock:
+            generation = self._generation
+            for tile in tiles:
+                key = (conditions, tile)
+                entry = self._tiles.pop(key, None)
+                if entry is not None and entry[0] <= now:
+                    self._stats['expirations'] += 1
+                    entry = None
+                if entry is None:
+                    self._stats['misses'] += 1
+                    continue
+                self._stats['hits'] += 1
+                self._tiles[key] = entry
+                found[tile] = entry[1]
+        missing = [tile for tile in tiles if tile not in found]
+        if missing:
+            fetched = self._fetch(missing, kwargs)
+            found.update(fetched)
+            self._store(conditions, fetched, generation)
+
+        seen = set()
+        res = []
+        for tile in tiles:
+            for uuid, feature_extent, data in found[tile]:
+                if uuid in seen or feature_extent[0] > extent[1] or \
+                        feature_extent[1] < extent[0] or \
+                        feature_extent[2] > extent[3] or \
+                        feature_extent[3] < extent[2]:
+                    continue
+                seen.add(uuid)
+                res.append(data)
+        return snowfloat.feature.parse_features(
+            json.loads('[%s]' % (','.join(res),)), lazy=lazy)
+
+    def clear(self):
+        """Drop all the tiles."""
+        with self._lock:
+            self._tiles.clear()
+            # tiles being fetched can not be stored anymore
+            self._generation += 1
+
+    def stats(self):
+        """Returns the cache statistics.
+
+        Returns:
+            dict: hits, misses, hit_rate, tiles, evictions and expirations.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tiles'] = len(self._tiles)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / float(lookups) if lookups else 0.0
+        return stats
+
+    def close(self):
+        """Drop the tiles and stop listening to the writes."""
+        snowfloat.signals.disconnect(self._on_write)
+        self.clear()
+
+    def _fetch(self, tiles, kwargs):
+        """GET the features of tiles concurrently.
+
+        Args:
+            tiles (list): List of (zoom, x, y) tiles.
+
+            kwargs (dict): Query conditions.
+
+        Returns:
+            list: List of (tile, features) tuples. Features are lists of
+                (uuid, extent, JSON feature) tuples.
+
+        Raises:
+            snowfloat.errors.RequestError
+        """
+        def fetch(tile):
+            """Returns the features intersecting a tile."""
+            params = dict(kwargs)
+            params.update({'query': 'intersects',
+                           'geometry': get_tile_polygon(tile, self.world)})
+            res = []
+            for page in snowfloat.feature.get_pages(self.layer.uri,
+                    **params):
+                for feature in page:
+                    feature_extent = snowfloat.geometry.get_geojson_extent(
+                        feature['geometry'])
+                    if feature_extent:
+                        res.append((feature['id'], feature_extent,
+                            json.dumps(feature, separators=(',', ':'))))
+            return res
+
+        pool = snowfloat.pool.WorkerPool(min(self.max_workers, len(tiles)))
+        try:
+            return zip(tiles, pool.map(fetch, tiles))
+        finally:
+            pool.shutdown(wait=False)
+
+    def _store(self, conditions, tiles, generation):
+        """Cache tiles unless the layer was written since they were fetched.
+
+        Args:
+            conditions (str): Query conditions in canonical JSON.
+
+            tiles (list): List of (tile, features) tuples, the last ones
+                being evicted last.
+
+            generation (int): Writes count when the fetch started.
+        """
+        expires = time.time() + self.ttl
+        with self._lock:
+            if self._generation != generation:
+                return
+            for tile, features in tiles:
+                self._tiles[(conditions, tile)] = (expires, features)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _on_write(self, layer_uuid, action, features):
+        """Signal listener dropping the tiles when the layer is written."""
+        # pylint: disable=W0613
+        if layer_uuid is None or layer_uuid == self.layer.uuid:
+            self.clear()
+
+
+def get_tiles(extent, zoom, world):
+    """Returns the tiles covering an extent.
+
+    Args:
+        extent (list): Spatial extent. (xmin, xmax, ymin, ymax).
+
+        zoom (int): Zoom level. The world is split in 2^zoom by 2^zoom
+            tiles.
+
+        world (list): Extent tiled at zoom 0.
+
+    Returns:
+        list: List of (zoom, x, y) tiles, y counted from the top, row by
+            row.
+    """
+    num_tiles = 2 ** zoom
+    width = (world[1] - world[0]) / float(num_tiles)
+    height = (world[3] - world[2]) / float(num_tiles)
+
+    def index(val, origin, size):
+        """Returns the tile index of a coordinate, within the world."""
+        return min(max(int(math.floor((val - origin) / size)), 0),
+                   num_tiles - 1)
+
+    x_1 = index(extent[0], world[0], width)
+    x_2 = index(extent[1], world[0], width)
+    y_1 = index(world[3] - extent[3], 0, height)
+    y_2 = index(world[3] - extent[2], 0, height)
+    return [(zoom, x, y) for y in xrange(y_1, y_2 + 1)
+            for x in xrange(x_1, x_2 + 1)]
+
+def get_tile_extent(tile, world):
+    """Returns the extent of a tile.
+
+    Args:
+        tile (tuple): (zoom, x, y) tile.
+
+        world (list): Extent tiled at zoom 0.
+
+    Returns:
+        list: Spatial extent. (xmin, xmax, ymin, ymax).
+    """
+    zoom, x, y = tile
+    num_tiles = 2 ** zoom
+    width = (world[1] - world[0]) / float(num_tiles)
+    height = (world[3] - world[2]) / float(num_tiles)
+    return [world[0] + x * width, world[0] + (x + 1) * width,
+            world[3] - (y + 1) * height, world[3] - y * height]
+
+def get_tile_polygon(tile, world):
+    """Returns the polygon of a tile.
+
+    Args:
+        tile (tuple): (zoom, x, y) tile.
+
+        world (list): Extent tiled at zoom 0.
+
+    Returns:
+        Polygon: Tile polygon.
+    """
+    xmin, xmax, ymin, ymax = get_tile_extent(tile, world)
+    return snowfloat.geometry.Polygon([[[xmin, ymin], [xmax, ymin],
+        [xmax, ymax], [xmin, ymax], [xmin, ymin]]])
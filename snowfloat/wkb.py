@@ -0,0 +1,214 @@
+"""Well-known binary (WKB) encoding of GeoJSON geometries."""
+
+import struct
+
+WKB_TYPES = {'Point': 1, 'LineString': 2, 'Polygon': 3, 'MultiPoint': 4,
+             'MultiLineString': 5, 'MultiPolygon': 6,
+             'GeometryCollection': 7}
+
+GEOMETRY_TYPES = dict((val, key) for key, val in WKB_TYPES.iteritems())
+
+def dumps(geojson):
+    """Returns the ISO WKB encoding of a GeoJSON geometry.
+
+    Little-endian. Geometries with 3 dimensions coordinates get Z types.
+
+    Args:
+        geojson (dict): GeoJSON geometry dictionary.
+
+    Returns:
+        str: WKB bytes.
+
+    Raises:
+        ValueError
+    """
+    chunks = []
+    _dump(geojson, chunks)
+    return ''.join(chunks)
+
+def loads(data):
+    """Returns the GeoJSON geometry of WKB bytes.
+
+    Reads ISO and extended WKB, in both byte orders.
+
+    Args:
+        data (str): WKB bytes.
+
+    Returns:
+        dict: GeoJSON geometry dictionary.
+
+    Raises:
+        ValueError
+    """
+    geojson, _ = _load(data, 0)
+    return geojson
+
+def _load(data, offset):
+    """Returns a geometry read from WKB bytes at an offset.
+
+    Args:
+        data (str): WKB bytes.
+
+        offset (int): Geometry offset.
+
+    Returns:
+        tuple: GeoJSON geometry dictionary and the offset following it.
+
+    Raises:
+        ValueError
+    """
+    try:
+        order = '<' if struct.unpack_from('B', data, offset)[0] else '>'
+        wkb_type = struct.unpack_from(order + 'I', data, offset + 1)[0]
+    except struct.error:
+        raise ValueError('Truncated WKB.')
+    offset += 5
+    dims = 2
+    if wkb_type & 0x20000000:
+        # extended WKB SRID
+        offset += 4
+    if wkb_type & 0x80000000:
+        # extended WKB Z flag
+        dims = 3
+    wkb_type &= 0xffff
+    if wkb_type >= 1000:
+        # ISO Z, M and ZM types
+        dims = (2, 3, 3, 4)[wkb_type // 1000 % 4]
+        wkb_type %= 1000
+    try:
+        geometry_type = GEOMETRY_TYPES[wkb_type & 0xff]
+    except KeyError:
+        raise ValueError('Unknown WKB type %d.' % (wkb_type,))
+    try:
+        if geometry_type == 'Point':
+            coordinates = list(struct.unpack_from(order + '%dd' % (dims,),
+                data, offset))
+            return ({'type': geometry_type, 'coordinates': coordinates},
+                    offset + 8 * dims)
+        if geometry_type == 'LineString':
+            coordinates, offset = _unpack_points(data, offset, order, dims)
+            return {'type': geometry_type,
+                    'coordinates': coordinates}, offset
+        count = struct.unpack_from(order + 'I', data, offset)[0]
+    except struct.error:
+        raise ValueError('Truncated WKB.')
+    offset += 4
+    if geometry_type == 'Polygon':
+        rings = []
+        for _ in xrange(count):
+            ring, offset = _unpack_points(data, offset, order, dims)
+            rings.append(ring)
+        return {'type': geometry_type, 'coordinates': rings}, offset
+    parts = []
+    for _ in xrange(count):
+        part, offset = _load(data, offset)
+        parts.append(part)
+    if geometry_type == 'GeometryCollection':
+        return {'type': geometry_type, 'geometries': parts}, offset
+    return {'type': geometry_type,
+            'coordinates': [part['coordinates'] for part in parts]}, offset
+
+def _unpack_points(data, offset, order, dims):
+    """Returns vertices read from WKB bytes.
+
+    Args:
+        data (str): WKB bytes.
+
+        offset (int): Offset of the number of vertices.
+
+        order (str): Byte order struct prefix.
+
+        dims (int): Number of dimensions.
+
+    Returns:
+        tuple: List of vertices and the offset following them.
+
+    Raises:
+        ValueError
+    """
+    try:
+        count = struct.unpack_from(order + 'I', data, offset)[0]
+        values = struct.unpack_from(order + '%dd' % (count * dims,), data,
+            offset + 4)
+    except struct.error:
+        raise ValueError('Truncated WKB.')
+    points = [list(values[i:i + dims]) for i in xrange(0, len(values), dims)]
+    return points, offset + 4 + 8 * len(values)
+
+def _dump(geojson, chunks):
+    """Append the WKB encoding of a geometry to a list of chunks.
+
+    Args:
+        geojson (dict): GeoJSON geometry dictionary.
+
+        chunks (list): List of byte strings.
+
+    Raises:
+        ValueError
+    """
+    geometry_type = geojson['type']
+    try:
+        wkb_type = WKB_TYPES[geometry_type]
+    except KeyError:
+        raise ValueError('Unknown geometry type %r.' % (geometry_type,))
+    if geometry_type == 'GeometryCollection':
+        geometries = geojson['geometries']
+        chunks.append(struct.pack('<BII', 1, wkb_type, len(geometries)))
+        for geometry in geometries:
+            _dump(geometry, chunks)
+        return
+    coordinates = geojson['coordinates']
+    dims = _get_dims(coordinates)
+    if dims == 3:
+        wkb_type += 1000
+    if geometry_type == 'Point':
+        chunks.append(struct.pack('<BI', 1, wkb_type))
+        chunks.append(_pack_points([coordinates], dims, count=False))
+    elif geometry_type == 'LineString':
+        chunks.append(struct.pack('<BI', 1, wkb_type))
+        chunks.append(_pack_points(coordinates, dims))
+    elif geometry_type == 'Polygon':
+        chunks.append(struct.pack('<BII', 1, wkb_type, len(coordinates)))
+        for ring in coordinates:
+            chunks.append(_pack_points(ring, dims))
+    else:
+        part_type = {'MultiPoint': 'Point', 'MultiLineString': 'LineString',
+                     'MultiPolygon': 'Polygon'}[geometry_type]
+        chunks.append(struct.pack('<BII', 1, wkb_type, len(coordinates)))
+        for part in coordinates:
+            _dump({'type': part_type, 'coordinates': part}, chunks)
+
+def _pack_points(points, dims, count=True):
+    """Returns packed vertices.
+
+    Args:
+        points (list): List of vertices.
+
+        dims (int): Number of dimensions.
+
+    Kwargs:
+        count (bool): Prefix the vertices with their number.
+
+    Returns:
+        str: Packed vertices.
+    """
+    values = [float(val) for point in points for val in point[:dims]]
+    data = struct.pack('<%dd' % (len(values),), *values)
+    if count:
+        return struct.pack('<I', len(points)) + data
+    return data
+
+def _get_dims(coordinates):
+    """Returns the number of dimensions of GeoJSON coordinates.
+
+    Args:
+        coordinates (list): GeoJSON coordinates.
+
+    Returns:
+        int: 2 or 3.
+    """
+    while coordinates and isinstance(coordinates[0], (list, tuple)):
+        coordinates = coordinates[0]
+    if coordinates and len(coordinates) >= 3:
+        return 3
+    return 2
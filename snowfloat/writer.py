@@ -0,0 +1,180 @@
+"""Write-behind batching of features added to a layer."""
+
+import threading
+import time
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.pool
+import snowfloat.settings
+
+class BatchWriter(object):
+    """Buffer features and add them to a layer in batches.
+
+    A batch is sent from a worker thread when the number of features, their
+    serialized size or the age of the oldest buffered feature reaches its
+    limit. Thread-safe.
+
+    Attributes:
+        layer (Layer): Layer to add the features to.
+
+        max_features (int): Maximum number of features per batch.
+
+        max_bytes (int): Maximum serialized size of a batch in bytes.
+
+        max_age (float): Maximum number of seconds a feature is buffered.
+
+        max_workers (int): Maximum number of batches sent at the same time.
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, layer, max_features=None, max_bytes=None,
+            max_age=None, max_workers=None):
+        self.layer = layer
+        self.max_features = max_features or \
+            snowfloat.settings.BATCH_MAX_FEATURES
+        self.max_bytes = max_bytes or snowfloat.settings.BATCH_MAX_BYTES
+        self.max_age = max_age or snowfloat.settings.BATCH_MAX_AGE
+        self.max_workers = max_workers or snowfloat.settings.BATCH_MAX_WORKERS
+        self._uri = '%s/features' % (layer.uri,)
+        self._cond = threading.Condition()
+        self._layer_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._features = []
+        self._futures = []
+        self._bytes = 0
+        self._first_time = None
+        self._pending = []
+        self._closed = False
+        self._pool = snowfloat.pool.WorkerPool(self.max_workers,
+            max_queued=self.max_workers)
+        self._timer = threading.Thread(target=self._run_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def add(self, feature):
+        """Buffer a feature to add to the layer.
+
+        Args:
+            feature (Feature): Feature to add.
+
+        Returns:
+            Future: Resolves to the feature's uuid once added.
+
+        Raises:
+            snowfloat.errors.Error
+        """
+        size = snowfloat.feature.estimate_feature_size(feature)
+        future = snowfloat.pool.Future()
+        with self._cond:
+            if self._closed:
+                raise snowfloat.errors.Error('Writer is closed.')
+            if self._features and self._bytes + size > self.max_bytes:
+                self._submit()
+            self._features.append(feature)
+            self._futures.append(future)
+            self._bytes += size
+            if self._first_time is None:
+                self._first_time = time.time()
+                self._cond.notify_all()
+            if len(self._features) >= self.max_features or \
+                    self._bytes >= self.max_bytes:
+                self._submit()
+        return future
+
+    def flush(self, wait=True):
+        """Send the buffered features.
+
+        Kwargs:
+            wait (bool): Wait for all the batches to be sent.
+        """
+        with self._cond:
+            self._submit()
+        with self._pending_lock:
+            pending = self._pending[:]
+        if wait:
+            for future in pending:
+                future.exception()
+
+    def close(self):
+        """Send the buffered features and stop the worker threads."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+        self._timer.join()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _submit(self):
+        """Submit the buffered features to a worker.
+
+        Called with the condition lock held.
+        """
+        if not self._features:
+            return
+        features = self._features
+        futures = self._futures
+        self._features = []
+        self._futures = []
+        self._bytes = 0
+        self._first_time = None
+        future = self._pool.submit(self._send, features, futures)
+        with self._pending_lock:
+            self._pending.append(future)
+        future.add_done_callback(self._remove_pending)
+
+    def _remove_pending(self, future):
+        """Forget a batch future once done.
+
+        Args:
+            future (Future): Batch future.
+        """
+        with self._pending_lock:
+            self._pending.remove(future)
+
+    def _send(self, features, futures):
+        """POST a batch of features and resolve their futures.
+
+        Args:
+            features (list): List of Feature objects.
+
+            futures (list): List of Future objects, one per feature.
+        """
+        try:
+            snowfloat.feature.add_features(self._uri, features,
+                max_bytes=self.max_bytes)
+        # pylint: disable=W0703
+        except Exception, exception:
+            for future in futures:
+                future.set_exception(exception)
+            return
+
+        with self._layer_lock:
+            self.layer.num_features += len(features)
+            self.layer.num_points += \
+                sum([feature.geometry.num_points() for feature in features])
+            self.layer.clear_count_cache()
+
+        for feature, future in zip(features, futures):
+            future.set_result(feature.uuid)
+
+    def _run_timer(self):
+        """Send the buffered features once the oldest is too old."""
+        with self._cond:
+            while not self._closed:
+                if self._first_time is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._first_time + self.max_age - time.time()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    self._submit()
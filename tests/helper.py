@@ -5,6 +5,7 @@ import unittest
 
 from mock import Mock, call
 
+import snowfloat.cache
 import snowfloat.client
 import snowfloat.errors
 import snowfloat.geometry
@@ -20,9 +21,11 @@ class Tests(unittest.TestCase):
     def setUp(self):
         snowfloat.settings.HOST = 'api.snowfloat.com:443'
         snowfloat.settings.HTTP_RETRY_INTERVAL = 0.1
+        snowfloat.settings.ADAPTIVE_BACKOFF = 0.01
         snowfloat.settings.API_KEY_ID = 'IY3487E2J6ZHFOW5A7P5'
         snowfloat.settings.API_SECRET_KEY = \
             'K0VUz+NlxVaf9AoPDcbNcVqF4RfXM4eet7RsyS19'
+        snowfloat.cache.clear_counts()
         self.client = snowfloat.client.Client()
 
         self.features = []
@@ -851,3 +854,123 @@ def get_request_body_headers(content_type='application/json'):
                'n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg='}
 
 
+
+def add_features_side_effect(layer_uuid='test_layer_1', status_codes=None):
+    """Requests post mock side effect echoing the features posted.
+
+    Kwargs:
+        layer_uuid (str): Layer UUID used to build the features URI.
+
+        status_codes (list): Status codes to return first, one per call.
+    """
+    status_codes = list(status_codes or [])
+    counter = [0]
+    def side_effect(*args, **kwargs):
+        """Return a response with one stored feature per feature posted."""
+        mock = Mock()
+        if status_codes:
+            mock.status_code = status_codes.pop(0)
+            mock.json.return_value = {'code': None, 'message': 'error',
+                                      'more': None}
+            return mock
+        features = json.loads(kwargs['data'])['features']
+        for feature in features:
+            counter[0] += 1
+            uuid = 'test_feature_%d' % (counter[0],)
+            feature['id'] = uuid
+            feature['properties']['uri'] = \
+                '/geo/1/layers/%s/features/%s' % (layer_uuid, uuid)
+            feature['properties']['date_created'] = counter[0]
+            feature['properties']['date_modified'] = counter[0]
+        mock.status_code = 200
+        mock.json.return_value = {'type': 'FeatureCollection',
+                                  'features': features}
+        return mock
+    return side_effect
+
+def get_features_pages(num_pages, page_size, layer_uuid='test_layer_1'):
+    """Returns requests get mocks, one per page of point features.
+
+    Args:
+        num_pages (int): Number of pages.
+
+        page_size (int): Number of features per page.
+
+    Kwargs:
+        layer_uuid (str): Layer UUID used to build the features URI.
+    """
+    mocks = []
+    for page in range(num_pages):
+        features = []
+        for i in range(page * page_size, (page + 1) * page_size):
+            uuid = 'test_feature_%d' % (i,)
+            features.append({
+                'type': 'Feature',
+                'id': uuid,
+                'geometry': {'type': 'Point', 'coordinates': [i, i + 1]},
+                'properties': {
+                    'uri': '/geo/1/layers/%s/features/%s' % (layer_uuid,
+                        uuid),
+                    'field_ts': i,
+                    'field_tag': 'test_tag_%d' % (i,),
+                    'date_created': i,
+                    'date_modified': i,
+                    'spatial': None}})
+        next_page_uri = None
+        if page < num_pages - 1:
+            next_page_uri = '/geo/1/layers/%s/features?page=%d' \
+                '&page_size=%d' % (layer_uuid, page + 1, page_size)
+        mock = Mock()
+        mock.status_code = 200
+        mock.json.return_value = {
+            'next_page_uri': next_page_uri,
+            'total': num_pages * page_size,
+            'geo': {'type': 'FeatureCollection', 'features': features}}
+        mocks.append(mock)
+    return mocks
+
+def get_layer_version_mock(num_features):
+    """Returns a requests get mock of the last modified feature of a layer,
+    as requested by snowfloat.feature.get_layer_version.
+
+    Args:
+        num_features (int): Number of features, the last modified one has
+            date_modified num_features - 1.
+    """
+    features = []
+    if num_features:
+        uuid = 'test_feature_%d' % (num_features - 1,)
+        features.append({
+            'type': 'Feature',
+            'id': uuid,
+            'geometry': None,
+            'properties': {'date_modified': num_features - 1}})
+    mock = Mock()
+    mock.status_code = 200
+    mock.json.return_value = {
+        'next_page_uri': None,
+        'total': num_features,
+        'geo': {'type': 'FeatureCollection', 'features': features}}
+    return mock
+
+def format_features_page(features, layer_uuid='test_layer_1'):
+    """Returns a page of GeoJSON features as returned by the server.
+
+    Args:
+        features (list): Feature objects.
+
+    Kwargs:
+        layer_uuid (str): Layer UUID used to build the features URI.
+    """
+    page = []
+    for i, feature in enumerate(features):
+        uuid = 'test_feature_%d' % (i,)
+        geojson = snowfloat.feature.format_feature(feature)
+        geojson['id'] = uuid
+        geojson['properties'].update({
+            'uri': '/geo/1/layers/%s/features/%s' % (layer_uuid, uuid),
+            'date_created': i,
+            'date_modified': i,
+            'spatial': None})
+        page.append(geojson)
+    return page
@@ -0,0 +1,196 @@
+"""Adaptive bulk writes tests."""
+
+import json
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.adaptive
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.settings
+
+class AIMDControllerTests(tests.helper.Tests):
+    """AIMD controller tests."""
+
+    def test_increase(self):
+        """Additive increase on fast requests."""
+        controller = snowfloat.adaptive.AIMDController(batch_size=10,
+            max_batch_size=100, batch_step=10, max_concurrency=3,
+            target_latency=1)
+        controller.success(10, 0.5)
+        self.assertEqual(controller.batch_size, 20)
+        self.assertEqual(controller.concurrency, 2)
+        controller.success(20, 0.5)
+        self.assertEqual(controller.concurrency, 2)
+        for _ in range(10):
+            controller.success(20, 0.5)
+        self.assertEqual(controller.batch_size, 100)
+        self.assertEqual(controller.concurrency, 3)
+        metrics = controller.metrics()
+        self.assertEqual(metrics['requests'], 12)
+        self.assertEqual(metrics['features'], 230)
+        self.assertAlmostEqual(metrics['latency'], 0.5)
+
+    def test_decrease(self):
+        """Multiplicative decrease on slow and failed requests."""
+        controller = snowfloat.adaptive.AIMDController(batch_size=80,
+            concurrency=8, max_concurrency=8, target_latency=1)
+        controller.success(80, 2)
+        self.assertEqual(controller.batch_size, 40)
+        self.assertEqual(controller.concurrency, 4)
+        error = snowfloat.errors.RequestError(413, None, None, None)
+        self.assertTrue(controller.failure(error))
+        self.assertEqual(controller.batch_size, 20)
+        self.assertEqual(controller.concurrency, 4)
+        error = snowfloat.errors.RequestError(429, None, None, None)
+        self.assertTrue(controller.failure(error))
+        self.assertEqual(controller.batch_size, 20)
+        self.assertEqual(controller.concurrency, 2)
+        error = snowfloat.errors.RequestError(503, None, None, None)
+        self.assertTrue(controller.failure(error))
+        error = snowfloat.errors.RequestError(None, None, 'timeout', None)
+        self.assertTrue(controller.failure(error))
+        self.assertEqual(controller.batch_size, 5)
+        self.assertEqual(controller.concurrency, 1)
+        error = snowfloat.errors.RequestError(400, None, None, None)
+        self.assertFalse(controller.failure(error))
+        metrics = controller.metrics()
+        self.assertEqual(metrics['slow'], 1)
+        self.assertEqual(metrics['too_large'], 1)
+        self.assertEqual(metrics['throttled'], 1)
+        self.assertEqual(metrics['server_errors'], 1)
+        self.assertEqual(metrics['timeouts'], 1)
+
+
+class AdaptiveAddFeaturesTests(tests.helper.Tests):
+    """Adaptive add features tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        tests.helper.Tests.setUp(self)
+        self.points = [snowfloat.feature.Feature(
+                           snowfloat.geometry.Point([i, i]), fields={'ts': i})
+                       for i in range(20)]
+
+    @patch.object(requests, 'post')
+    def test_add_features(self, post_mock):
+        """Batches grow while requests succeed."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        controller = snowfloat.adaptive.AIMDController(batch_size=2,
+            batch_step=2, max_concurrency=1)
+        self.layer.add_features(self.points, controller=controller)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertListEqual(posted, [2, 4, 6, 8])
+        self.assertEqual(len(set(f.uuid for f in self.points)), 20)
+        self.assertEqual(self.layer.num_features, 20)
+        self.assertEqual(controller.metrics()['batch_size'], 10)
+
+    @patch.object(requests, 'post')
+    def test_add_features_413(self, post_mock):
+        """Batch rejected as too large is retried smaller."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[413])
+        controller = snowfloat.adaptive.AIMDController(batch_size=20,
+            batch_step=1, max_concurrency=4)
+        self.client.add_features('test_layer_1', self.points,
+            controller=controller)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertEqual(posted[0], 20)
+        self.assertEqual(sum(posted[1:]), 20)
+        self.assertTrue(all(f.uuid for f in self.points))
+        self.assertEqual(controller.metrics()['too_large'], 1)
+
+    @patch.object(requests, 'post')
+    def test_add_features_error(self, post_mock):
+        """Errors not related to the server load are raised."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[400])
+        controller = snowfloat.adaptive.AIMDController(batch_size=20)
+        self.assertRaises(snowfloat.errors.RequestError,
+            self.layer.add_features, self.points, controller=controller)
+
+    @patch.object(requests, 'post')
+    def test_add_features_429(self, post_mock):
+        """Throttled batch is sent again once, after a backoff."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[429])
+        controller = snowfloat.adaptive.AIMDController(batch_size=20,
+            concurrency=2, max_concurrency=2)
+        self.layer.add_features(self.points, controller=controller)
+        # no request retries behind the controller
+        self.assertEqual(post_mock.call_count, 2)
+        self.assertTrue(all(f.uuid for f in self.points))
+        self.assertEqual(controller.metrics()['throttled'], 1)
+
+    @patch.object(requests, 'post')
+    def test_add_features_5xx(self, post_mock):
+        """Batches failing on server errors are sent again smaller."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[503, 500])
+        controller = snowfloat.adaptive.AIMDController(batch_size=20,
+            batch_step=1, max_concurrency=1)
+        self.layer.add_features(self.points, controller=controller)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertEqual(posted[:3], [20, 10, 5])
+        self.assertEqual(sum(posted[2:]), 20)
+        self.assertTrue(all(f.uuid for f in self.points))
+        self.assertEqual(controller.metrics()['server_errors'], 2)
+
+    @patch.object(requests, 'post')
+    def test_add_features_max_retries(self, post_mock):
+        """Server errors are raised after the maximum number of attempts."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[503] * 10)
+        controller = snowfloat.adaptive.AIMDController(batch_size=1,
+            max_concurrency=1)
+        self.assertRaises(snowfloat.errors.RequestError,
+            self.layer.add_features, self.points[:1], controller=controller)
+        self.assertEqual(post_mock.call_count,
+            snowfloat.settings.ADAPTIVE_MAX_RETRIES + 1)
+
+    @patch.object(requests, 'post')
+    def test_add_features_max_bytes(self, post_mock):
+        """Batches are packed under the payload size limit."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        controller = snowfloat.adaptive.AIMDController(batch_size=20,
+            max_concurrency=1)
+        max_bytes = 5 * snowfloat.feature.estimate_feature_size(
+            self.points[0])
+        snowfloat.adaptive.add_features('/geo/1/layers/test_layer_1/features',
+            self.points, controller, max_bytes=max_bytes)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertEqual(posted, [5, 5, 5, 5])
+
+    @patch.object(requests, 'post')
+    def test_add_features_unexpected_error(self, post_mock):
+        """Errors other than request errors in a worker are raised."""
+        post_mock.__name__ = 'post'
+        mock = Mock()
+        mock.status_code = 200
+        mock.json.side_effect = ValueError('No JSON object could be decoded')
+        post_mock.return_value = mock
+        controller = snowfloat.adaptive.AIMDController(batch_size=5,
+            max_concurrency=2)
+        self.assertRaises(ValueError, self.layer.add_features, self.points,
+            controller=controller)
+        self.assertFalse(any(f.uuid for f in self.points))
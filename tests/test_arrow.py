@@ -0,0 +1,170 @@
+"""Arrow export tests."""
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+from mock import Mock, patch
+import pyarrow
+import pyarrow.parquet
+import requests
+
+import tests.helper
+
+import snowfloat.arrow
+import snowfloat.errors
+import snowfloat.layer
+import snowfloat.wkb
+
+class ArrowTests(tests.helper.Tests):
+    """Arrow export tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            fields=[{'name': 'ts', 'type': 'real'},
+                    {'name': 'tag', 'type': 'string', 'size': 256}])
+        self.directory = tempfile.mkdtemp()
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    def test_wkb(self):
+        """Encode geometries in WKB."""
+        self.assertEqual(
+            snowfloat.wkb.dumps({'type': 'Point', 'coordinates': [1, 2]}),
+            struct.pack('<BIdd', 1, 1, 1.0, 2.0))
+        self.assertEqual(
+            snowfloat.wkb.dumps({'type': 'LineString',
+                                 'coordinates': [[1, 2, 3], [4, 5, 6]]}),
+            struct.pack('<BII6d', 1, 1002, 2, 1, 2, 3, 4, 5, 6))
+        self.assertEqual(
+            snowfloat.wkb.dumps({'type': 'MultiPolygon', 'coordinates': [
+                [[[0, 0], [1, 0], [0, 1], [0, 0]]]]}),
+            struct.pack('<BII', 1, 6, 1) +
+            struct.pack('<BIII8d', 1, 3, 1, 4, 0, 0, 1, 0, 0, 1, 0, 0))
+        self.assertRaises(ValueError, snowfloat.wkb.dumps,
+            {'type': 'test', 'coordinates': []})
+
+    def test_wkb_loads(self):
+        """Decode ISO and extended WKB."""
+        geojson = {'type': 'GeometryCollection', 'geometries': [
+            {'type': 'Point', 'coordinates': [1.0, 2.0, 3.0]},
+            {'type': 'MultiLineString', 'coordinates': [
+                [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]]}]}
+        self.assertDictEqual(
+            snowfloat.wkb.loads(snowfloat.wkb.dumps(geojson)), geojson)
+        # big-endian extended WKB point Z with SRID
+        self.assertDictEqual(snowfloat.wkb.loads(
+            struct.pack('>BII3d', 0, 0xa0000001, 4326, 1, 2, 3)),
+            {'type': 'Point', 'coordinates': [1.0, 2.0, 3.0]})
+        self.assertRaises(ValueError, snowfloat.wkb.loads,
+            struct.pack('<BI', 1, 2))
+
+    @patch.object(requests, 'get')
+    def test_export_parquet(self, get_mock):
+        """Export features to Parquet in row groups."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        path = os.path.join(self.directory, 'layer.parquet')
+        stats = self.layer.export_arrow(path, row_group_size=4)
+        self.assertDictEqual(stats, {'features': 6, 'row_groups': 2})
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        table = parquet_file.read()
+        self.assertEqual(table.schema.field('ts').type,
+            pyarrow.float64())
+        self.assertDictEqual(json.loads(table.schema.metadata['geo']),
+            {'version': '1.1.0', 'primary_column': 'geometry',
+             'columns': {'geometry': {'encoding': 'WKB',
+                                      'geometry_types': [], 'crs': None}}})
+        self.assertListEqual(table.column('ts').to_pylist(),
+            [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(table.column('geometry').to_pylist()[5],
+            struct.pack('<BIdd', 1, 1, 5.0, 6.0))
+        self.assertEqual(table.column('uuid').to_pylist()[0],
+            'test_feature_0')
+
+    @patch.object(requests, 'get')
+    def test_export_feather_geoarrow(self, get_mock):
+        """Export features to an Arrow file with GeoArrow geometries."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        self.layer.fields = None
+        path = os.path.join(self.directory, 'layer.arrow')
+        stats = self.layer.export_arrow(path, format='feather',
+            geometry_encoding='geoarrow')
+        self.assertDictEqual(stats, {'features': 4, 'row_groups': 1})
+        table = pyarrow.RecordBatchFileReader(pyarrow.OSFile(path)
+            ).read_all()
+        self.assertEqual(table.schema.field('ts').type,
+            pyarrow.int64())
+        self.assertListEqual(table.column('geometry').to_pylist(),
+            [{'x': i, 'y': i + 1} for i in range(4)])
+        metadata = json.loads(table.schema.metadata['geo'])
+        self.assertEqual(metadata['columns']['geometry']['encoding'],
+            'point')
+
+    @patch.object(requests, 'get')
+    def test_export_schema(self, get_mock):
+        """Type the columns from the fields definitions, write the CRS and
+        keep no partial file."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 0)
+        self.layer.srid = 4326
+        path = os.path.join(self.directory, 'layer.parquet')
+        self.layer.export_arrow(path)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.field('ts').type, pyarrow.float64())
+        self.assertEqual(table.schema.field('tag').type, pyarrow.string())
+        self.assertFalse('crs' in json.loads(
+            table.schema.metadata['geo'])['columns']['geometry'])
+
+        self.layer.srid = 3857
+        projjson = {'type': 'ProjectedCRS', 'name': 'WGS 84 / Pseudo-Mercator',
+                    'id': {'authority': 'EPSG', 'code': 3857}}
+        pyproj = Mock()
+        pyproj.CRS.from_epsg.return_value.to_json_dict.return_value = \
+            projjson
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        with patch.object(snowfloat.arrow, 'pyproj', pyproj):
+            self.layer.export_arrow(path)
+        pyproj.CRS.from_epsg.assert_called_with(3857)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 2)
+        self.assertDictEqual(json.loads(table.schema.metadata['geo'])[
+            'columns']['geometry']['crs'], projjson)
+
+        # the previous file is kept when the export fails
+        mock = Mock()
+        mock.status_code = 500
+        mock.json.return_value = {'code': 1, 'message': 'test', 'more': None}
+        get_mock.side_effect = None
+        get_mock.return_value = mock
+        self.assertRaises(snowfloat.errors.RequestError,
+            self.layer.export_arrow, path)
+        self.assertEqual(pyarrow.parquet.read_table(path).num_rows, 2)
+        self.assertListEqual(os.listdir(self.directory), ['layer.parquet'])
+
+    def test_geoarrow_polygons(self):
+        """Nest polygons coordinates in lists."""
+        ring = [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 0.0]]
+        features = [{'id': 'test_feature_%d' % (i,),
+                     'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                     'properties': {}} for i in range(2)]
+        batch = snowfloat.arrow.make_record_batch(features, [],
+            geometry_encoding='geoarrow')
+        ring = [{'x': x, 'y': y} for x, y in ring]
+        self.assertListEqual(batch.column(4).to_pylist(), [[ring], [ring]])
+        features[1]['geometry'] = {'type': 'Point', 'coordinates': [0, 0]}
+        self.assertRaises(snowfloat.errors.Error,
+            snowfloat.arrow.make_record_batch, features, [],
+            geometry_encoding='geoarrow')
@@ -0,0 +1,123 @@
+"""Query cache tests."""
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.cache
+import snowfloat.geometry
+import snowfloat.layer
+
+class QueryCacheTests(tests.helper.Tests):
+    """Query cache tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.cache = snowfloat.cache.enable()
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        snowfloat.cache.disable()
+        tests.helper.Tests.tearDown(self)
+
+    @patch.object(requests, 'get')
+    def test_get_features(self, get_mock):
+        """Serve identical queries from the cache."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        geometry = snowfloat.geometry.Point(coordinates=[1, 2])
+        features = self.layer.get_features(query='distance_lte',
+            geometry=geometry, distance=10, field_ts_gte=1,
+            order_by=('field_ts',))
+        self.assertEqual([feature.uuid for feature in features],
+            ['test_feature_%d' % (i,) for i in range(4)])
+        self.assertEqual(get_mock.call_count, 2)
+
+        # same conditions, different page size
+        features = self.layer.get_features(order_by=['field_ts'],
+            field_ts_gte=1, distance=10, geometry=geometry,
+            query='distance_lte', page_size=10)
+        self.assertEqual(get_mock.call_count, 2)
+        self.assertEqual([feature.uuid for feature in features],
+            ['test_feature_%d' % (i,) for i in range(4)])
+        self.assertEqual(features[1].geometry.coordinates, [1, 2])
+        self.assertEqual(features[1].fields,
+            {'ts': 1, 'tag': 'test_tag_1'})
+        self.assertEqual(features[1].layer_uuid, 'test_layer_1')
+
+        # hits return new objects
+        features[1].fields['ts'] = 5
+        features = self.layer.get_features(order_by=['field_ts'],
+            field_ts_gte=1, distance=10, geometry=geometry,
+            query='distance_lte')
+        self.assertEqual(features[1].fields['ts'], 1)
+
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        features = self.client.get_features('test_layer_1', field_ts_gte=2,
+            limit=1)
+        self.assertEqual(len(features), 1)
+        self.assertEqual(get_mock.call_count, 3)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']),
+            (2, 2, 2))
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+        self.assertGreater(stats['bytes'], 0)
+
+    @patch.object(requests, 'get')
+    @patch.object(requests, 'delete')
+    @patch.object(requests, 'post')
+    def test_invalidate(self, post_mock, delete_mock, get_mock):
+        """Drop the layer results on writes."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2) + \
+            tests.helper.get_features_pages(1, 2, layer_uuid='test_layer_2')
+        self.layer.get_features()
+        self.client.get_features('test_layer_2')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1})
+        self.layer.delete_feature('test_feature_1')
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['invalidations']), (1, 1))
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        self.layer.get_features()
+        self.assertEqual(get_mock.call_count, 3)
+
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        self.layer.add_features(self.features[:1])
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+        self.client.delete_layers()
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    @patch.object(requests, 'get')
+    def test_evict(self, get_mock):
+        """Evict the least recently used results."""
+        snowfloat.cache.disable()
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 1) * 4
+        self.cache = snowfloat.cache.enable(max_entries=2)
+        self.layer.get_features(field_ts_gte=1)
+        self.layer.get_features(field_ts_gte=2)
+        self.layer.get_features(field_ts_gte=1)
+        self.layer.get_features(field_ts_gte=3)
+        self.assertEqual(get_mock.call_count, 3)
+        self.layer.get_features(field_ts_gte=1)
+        self.assertEqual(get_mock.call_count, 3)
+        self.layer.get_features(field_ts_gte=2)
+        self.assertEqual(get_mock.call_count, 4)
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+        cache = snowfloat.cache.QueryCache(max_bytes=1)
+        get_mock.side_effect = tests.helper.get_features_pages(1, 1)
+        self.assertEqual(len(cache.get_features(self.layer.uri)), 1)
+        self.assertEqual(cache.stats()['entries'], 0)
+        cache.close()
@@ -248,6 +248,13 @@ class ClientTests(tests.helper.Tests):
         self.get_features_test(get_mock, self.client.get_features,
             'test_layer_1')
 
+    @patch.object(requests, 'get')
+    def test_iter_features(self, get_mock):
+        """Iterate over layer features."""
+        self.get_features_test(get_mock,
+            lambda **kwargs: list(self.client.iter_features('test_layer_1',
+                **kwargs)))
+
     @patch.object(requests, 'post')
     def test_add_features(self, post_mock):
         """Add layer features."""
@@ -0,0 +1,164 @@
+"""Columnar feature batches tests."""
+
+from mock import patch
+import numpy
+import requests
+
+import tests.helper
+
+import snowfloat.columnar
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.layer
+import snowfloat.wkb
+
+class FeatureBatchTests(tests.helper.Tests):
+    """Columnar feature batches tests."""
+
+    def test_parse_feature_batch(self):
+        """Build a batch from pages of all geometry types."""
+        page = tests.helper.format_features_page(self.features)
+        page.append({'type': 'Feature', 'id': 'test_feature_7',
+                     'geometry': None,
+                     'properties': {
+                        'uri': '/geo/1/layers/test_layer_1/features/'
+                            'test_feature_7',
+                        'date_created': '2013-06-08T22:12:05.123Z',
+                        'date_modified': None,
+                        'field_ratio': 0.5}})
+        batch = snowfloat.columnar.parse_feature_batch([page[:4], page[4:]])
+        self.assertEqual(len(batch), 8)
+        self.assertEqual(batch.dims, 3)
+        self.assertEqual(batch.coordinates.dtype, numpy.float64)
+        self.assertEqual(batch.vertices.shape, (25, 3))
+        self.assertListEqual(batch.geometry_types.tolist(),
+            [1, 3, 6, 2, 4, 5, 7, 0])
+        self.assertListEqual(batch.geometry_offsets.tolist(),
+            [0, 1, 2, 4, 5, 6, 8, 8, 8])
+        self.assertEqual(batch.fields['ts'].dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(batch.fields['ts'][7]))
+        self.assertListEqual(batch.fields['tag'].tolist()[:2],
+            ['test_tag_1', 'test_tag_2'])
+        self.assertEqual(batch.date_created.dtype,
+            numpy.dtype('datetime64[us]'))
+        self.assertEqual(batch.date_created[7],
+            numpy.datetime64('2013-06-08T22:12:05.123'))
+        self.assertTrue(numpy.isnat(batch.date_modified[7]))
+        self.assertEqual(batch.get_feature(7).date_created,
+            '2013-06-08T22:12:05.123000')
+        self.assertIsNone(batch.get_feature(7).date_modified)
+        for i, feature in enumerate(self.features):
+            self.assertEqual(batch.get_geojson(i),
+                snowfloat.feature.format_feature(feature)['geometry'])
+        self.assertIsNone(batch.get_geojson(7))
+        feature = batch.get_feature(1)
+        self.assertEqual(feature.uuid, 'test_feature_1')
+        self.assertEqual(feature.layer_uuid, 'test_layer_1')
+        self.assertEqual(feature.fields['ts'], 11)
+        self.assertEqual(feature.geometry.geometry_type, 'Polygon')
+        self.assertEqual(repr(batch),
+            "FeatureBatch(features=8, vertices=25, "
+            "fields=['ratio', 'tag', 'ts'])")
+
+    def test_to_wkb(self):
+        """Encode the geometries in WKB from the offset arrays."""
+        page = tests.helper.format_features_page(self.features)
+        page.append({'type': 'Feature', 'id': 'test_feature_7',
+                     'geometry': None, 'properties': {}})
+        page.append({'type': 'Feature', 'id': 'test_feature_8',
+                     'geometry': {'type': 'Point',
+                                  'coordinates': [1.5, 2.5, 3.5]},
+                     'properties': {}})
+        batch = snowfloat.columnar.parse_feature_batch([page])
+        wkbs = batch.to_wkb()
+        self.assertEqual(len(wkbs), 9)
+        for feature, wkb in zip(page, wkbs):
+            if feature['geometry']:
+                self.assertEqual(wkb,
+                    snowfloat.wkb.dumps(feature['geometry']))
+            else:
+                self.assertIsNone(wkb)
+
+    def test_mixed_dims(self):
+        """Vertices must have the same number of dimensions."""
+        page = tests.helper.format_features_page(self.features[:1])
+        page[0]['geometry']['coordinates'] = [1, 2]
+        page.extend(tests.helper.format_features_page(self.features[:1]))
+        self.assertRaises(snowfloat.errors.Error,
+            snowfloat.columnar.parse_feature_batch, [page])
+
+    def test_make_column(self):
+        """Columns types."""
+        self.assertEqual(snowfloat.columnar.make_column([1, 2]).dtype,
+            numpy.int64)
+        self.assertEqual(snowfloat.columnar.make_column([1, 2.5]).dtype,
+            numpy.float64)
+        self.assertEqual(snowfloat.columnar.make_column([True]).dtype,
+            numpy.bool_)
+        self.assertEqual(snowfloat.columnar.make_column([True, None]).dtype,
+            object)
+        self.assertEqual(snowfloat.columnar.make_column([2 ** 70]).dtype,
+            object)
+        self.assertEqual(len(snowfloat.columnar.make_column([])), 0)
+        batch = snowfloat.columnar.parse_feature_batch([])
+        self.assertEqual(len(batch.coordinates), 0)
+
+    def test_field_types(self):
+        """Columns dtypes given by the fields definitions."""
+        self.assertEqual(snowfloat.columnar.make_column([1, 2],
+            'real').dtype, numpy.float64)
+        self.assertEqual(snowfloat.columnar.make_column([1.0, None],
+            'integer').dtype, numpy.float64)
+        self.assertEqual(snowfloat.columnar.make_column([1, 2],
+            'string').dtype, object)
+        self.assertEqual(snowfloat.columnar.make_column(['a'],
+            'integer').dtype, object)
+        page = tests.helper.format_features_page(self.features[:2])
+        page[0]['properties']['field_ts'] = None
+        batch = snowfloat.columnar.parse_feature_batch([page],
+            fields=[{'name': 'ts', 'type': 'real'},
+                    {'name': 'tag', 'type': 'string'},
+                    {'name': 'valid', 'type': 'boolean'}])
+        self.assertEqual(batch.fields['ts'].dtype, numpy.float64)
+        self.assertEqual(batch.fields['tag'].dtype, object)
+        self.assertEqual(batch.fields['valid'].tolist(), [None, None])
+
+    def test_date_column(self):
+        """Dates columns of ISO dates and timestamps."""
+        column = snowfloat.columnar.make_date_column(
+            ['2013-01-02', '2013-01-02T10:00:00+00:00', 0, None])
+        self.assertListEqual(column.astype(str).tolist()[:3],
+            ['2013-01-02T00:00:00.000000', '2013-01-02T10:00:00.000000',
+             '1970-01-01T00:00:00.000000'])
+        self.assertTrue(numpy.isnat(column[3]))
+        self.assertEqual(snowfloat.columnar.make_date_column(
+            ['test']).dtype, object)
+
+    @patch.object(requests, 'get')
+    def test_get_features_as_columns(self, get_mock):
+        """Get layer features as columns."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 3)
+        layer = snowfloat.layer.Layer(uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        batch = layer.get_features(as_columns=True, page_size=3)
+        self.assertListEqual(batch.fields['ts'].tolist(), range(6))
+        self.assertListEqual(batch.vertices[:, 0].tolist(), range(6))
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        batch = self.client.get_features('test_layer_1', as_columns=True)
+        self.assertListEqual(batch.uuids.tolist(),
+            ['test_feature_0', 'test_feature_1'])
+
+        # no more pages once the limit is reached
+        get_mock.reset_mock()
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        batch = layer.get_features(as_columns=True, limit=3, lazy=True)
+        self.assertListEqual(batch.uuids.tolist(),
+            ['test_feature_0', 'test_feature_1', 'test_feature_2'])
+        self.assertEqual(get_mock.call_count, 2)
+        get_mock.reset_mock()
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        batch = self.client.get_features('test_layer_1', as_columns=True,
+            limit=1)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(get_mock.call_count, 1)
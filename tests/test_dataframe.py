@@ -0,0 +1,106 @@
+"""Data frames tests."""
+
+import json
+
+from mock import patch
+import pandas
+import requests
+
+import tests.helper
+
+import snowfloat.columnar
+import snowfloat.dataframe
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.stats
+
+class DataFrameTests(tests.helper.Tests):
+    """Data frames tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            fields=[{'name': 'ts', 'type': 'real'},
+                    {'name': 'tag', 'type': 'string', 'size': 256}])
+        tests.helper.Tests.setUp(self)
+
+    @patch.object(requests, 'get')
+    def test_to_dataframe(self, get_mock):
+        """Build a data frame from pages of features."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        frame = self.layer.to_dataframe(geo=False)
+        self.assertListEqual(list(frame.columns), ['uuid', 'uri',
+            'date_created', 'date_modified', 'tag', 'ts', 'geometry'])
+        self.assertEqual(str(frame['ts'].dtype), 'float64')
+        self.assertListEqual(frame['ts'].tolist(), [0.0, 1.0, 2.0, 3.0])
+        self.assertListEqual(frame['uuid'].tolist(),
+            ['test_feature_%d' % (i,) for i in range(4)])
+        self.assertDictEqual(frame['geometry'][3],
+            {'type': 'Point', 'coordinates': [3.0, 4.0]})
+
+    def test_make_series(self):
+        """Missing integers get the nullable integer dtype."""
+        column = snowfloat.columnar.make_column([1, None, 3])
+        series = snowfloat.dataframe.make_series(column, 'integer')
+        self.assertEqual(str(series.dtype), 'Int64')
+        self.assertEqual(series[2], 3)
+        self.assertTrue(series.isnull()[1])
+        column = snowfloat.columnar.make_column([1, 2])
+        self.assertEqual(str(snowfloat.dataframe.make_series(
+            column, 'string').dtype), 'object')
+
+    @patch.object(requests, 'post')
+    def test_from_dataframe(self, post_mock):
+        """Add the rows of a data frame as features."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        frame = pandas.DataFrame({
+            'ts': [1, None],
+            'tag': ['a', 'b'],
+            'day': pandas.to_datetime(['2013-01-02 10:00', None]),
+            'geometry': [{'type': 'Point', 'coordinates': [1, 2]},
+                         snowfloat.geometry.Point([3, 4])]})
+        stats = snowfloat.stats.LayerStats(layer_uuid='test_layer_1')
+        try:
+            uuids = self.layer.from_dataframe(frame)
+        finally:
+            stats.close()
+        self.assertListEqual(uuids, ['test_feature_1', 'test_feature_2'])
+        features = json.loads(post_mock.call_args[1]['data'])['features']
+        self.assertDictEqual(features[0]['properties'],
+            {'field_ts': 1.0, 'field_tag': 'a',
+             'field_day': '2013-01-02T10:00:00.000000'})
+        self.assertDictEqual(features[1]['properties'], {'field_tag': 'b'})
+        self.assertDictEqual(features[1]['geometry'],
+            {'type': 'Point', 'coordinates': [3, 4]})
+        self.assertEqual(self.layer.num_features, 2)
+        self.assertEqual(self.layer.num_points, 2)
+        # the listeners follow the rows added
+        self.assertFalse(stats.stale)
+        self.assertEqual(stats.num_features, 2)
+        self.assertEqual(stats.extent, [1, 3, 2, 4])
+        self.assertEqual(stats.fields['tag']['max'], 'b')
+
+    @patch.object(requests, 'post')
+    def test_from_dataframe_batches(self, post_mock):
+        """Pack the rows on their serialized size and split on 413."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[413])
+        frame = pandas.DataFrame({
+            'ts': range(6),
+            'geometry': [{'type': 'Point', 'coordinates': [i, i]}
+                         for i in range(6)]})
+        size = len(json.dumps(snowfloat.dataframe.make_geojson_features(
+            frame)[0]))
+        uuids = self.layer.from_dataframe(frame, max_bytes=4 * size)
+        self.assertListEqual(uuids,
+            ['test_feature_%d' % (i,) for i in range(1, 7)])
+        # 3 rows rejected, sent again in 2 halves, then the last 3 rows
+        self.assertListEqual([len(json.loads(call[1]['data'])['features'])
+                              for call in post_mock.call_args_list],
+            [3, 1, 2, 3])
@@ -0,0 +1,96 @@
+"""Export tests."""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.layer
+
+class ExportTests(tests.helper.Tests):
+    """Export tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.directory = tempfile.mkdtemp()
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    @patch.object(requests, 'get')
+    def test_export_geojsonseq(self, get_mock):
+        """Export features to a GeoJSON text sequence."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        path = os.path.join(self.directory, 'layer.geojsons')
+        stats = self.layer.export(path, page_size=2)
+        self.assertEqual(stats['features'], 4)
+        self.assertEqual(stats['bytes'], os.path.getsize(path))
+        self.assertTrue(stats['features_per_sec'] > 0)
+        lines = open(path).read().split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertTrue(all(line[0] == '\x1e' for line in lines[:-1]))
+        feature = json.loads(lines[3][1:])
+        self.assertEqual(feature['id'], 'test_feature_3')
+        self.assertEqual(feature['properties']['ts'], 3)
+        self.assertFalse('spatial' in feature['properties'])
+
+        # same properties, plus the others received
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        self.layer.export(path, raw=True)
+        feature = json.loads(open(path).read().split('\n')[1][1:])
+        self.assertEqual(feature['properties']['ts'], 1)
+        self.assertTrue('spatial' in feature['properties'])
+
+    @patch.object(requests, 'get')
+    def test_export_error(self, get_mock):
+        """Keep the previous file when a request fails."""
+        get_mock.__name__ = 'get'
+        mock = Mock()
+        mock.status_code = 500
+        mock.json.return_value = {'code': 1, 'message': 'test', 'more': None}
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)[:1] + \
+            [mock] * 10
+        path = os.path.join(self.directory, 'layer.ndjson.gz')
+        with open(path, 'w') as previous:
+            previous.write('previous')
+        self.assertRaises(snowfloat.errors.RequestError, self.layer.export,
+            path, format='ndjson', compress=True)
+        self.assertEqual(os.listdir(self.directory), ['layer.ndjson.gz'])
+        self.assertEqual(open(path).read(), 'previous')
+
+    @patch.object(requests, 'get')
+    def test_export_ndjson(self, get_mock):
+        """Export features to a gzip NDJSON file."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        path = os.path.join(self.directory, 'layer.ndjson.gz')
+        stats = self.layer.export(path, format='ndjson', compress=True)
+        self.assertEqual(stats['features'], 4)
+        lines = gzip.open(path).read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertDictEqual(json.loads(lines[1]), {
+            'type': 'Feature',
+            'id': 'test_feature_1',
+            'geometry': {'type': 'Point', 'coordinates': [1, 2]},
+            'properties': {
+                'ts': 1,
+                'tag': 'test_tag_1',
+                'uri': '/geo/1/layers/test_layer_1/features/test_feature_1',
+                'date_created': 1,
+                'date_modified': 1}})
+        self.assertRaises(ValueError, self.layer.export, path,
+            format='test')
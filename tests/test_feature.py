@@ -1,12 +1,15 @@
 """Features tests."""
 
 import json
+import time
 
-from mock import patch
+from mock import Mock, patch
 import requests
 
 import tests.helper
 
+import snowfloat.errors
+import snowfloat.feature
 import snowfloat.geometry
 
 class FeaturesTests(tests.helper.Tests):
@@ -50,3 +53,254 @@ class FeaturesTests(tests.helper.Tests):
             self.feature.delete)
 
 
+    @patch.object(requests, 'post')
+    def test_add_features_batches(self, post_mock):
+        """Add features in batches under the payload size limit."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        uri = '/geo/1/layers/test_layer_1/features'
+        snowfloat.feature.add_features(uri, self.features, max_bytes=1000)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertListEqual(posted, [2, 2, 2, 1])
+        self.assertListEqual([f.uuid for f in self.features],
+            ['test_feature_%d' % (i,) for i in range(1, 8)])
+
+    @patch.object(requests, 'post')
+    def test_add_features_413(self, post_mock):
+        """Split a batch in half when the server rejects it as too large."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[413, 413])
+        uri = '/geo/1/layers/test_layer_1/features'
+        snowfloat.feature.add_features(uri, self.features)
+        posted = [len(json.loads(c[1]['data'])['features'])
+                  for c in post_mock.call_args_list]
+        self.assertListEqual(posted, [7, 3, 1, 2, 4])
+        self.assertTrue(all(f.uuid for f in self.features))
+
+    @patch.object(requests, 'post')
+    def test_add_features_413_single(self, post_mock):
+        """A single feature too large is reported."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[413])
+        uri = '/geo/1/layers/test_layer_1/features'
+        self.assertRaises(snowfloat.errors.RequestError,
+            snowfloat.feature.add_features, uri, self.features[:1])
+
+    def test_estimate_feature_size(self):
+        """Estimated size is close to the serialized size."""
+        for feature in self.features:
+            size = len(json.dumps(snowfloat.feature.format_feature(feature)))
+            estimate = snowfloat.feature.estimate_feature_size(feature)
+            self.assertTrue(size <= estimate <= 4 * size)
+
+    @patch.object(requests, 'get')
+    def test_get_features_page_size(self, get_mock):
+        """Get features with a page size."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', page_size=2, field_ts_gte=0)
+        self.assertListEqual([f.fields['ts'] for f in features],
+            range(6))
+        self.assertEqual(get_mock.call_count, 3)
+        self.assertDictEqual(get_mock.call_args_list[0][1]['params'],
+            {'page_size': 2, 'field_ts__gte': 0})
+
+    @patch.object(requests, 'get')
+    def test_get_features_limit(self, get_mock):
+        """Stop requesting pages once the limit is reached."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', limit=4)
+        self.assertListEqual([f.uuid for f in features],
+            ['test_feature_%d' % (i,) for i in range(4)])
+        self.assertEqual(get_mock.call_count, 2)
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', limit=3)
+        self.assertEqual(len(list(features)), 3)
+
+    @patch.object(requests, 'get')
+    def test_get_features_prefetch(self, get_mock):
+        """Prefetch pages in a background thread."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', prefetch=2)
+        self.assertListEqual([f.fields['ts'] for f in features],
+            range(6))
+
+    @patch.object(requests, 'get')
+    def test_get_features_prefetch_close(self, get_mock):
+        """Stop prefetching pages once the consumer stops."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(10, 1)
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', prefetch=1)
+        self.assertEqual(next(features).uuid, 'test_feature_0')
+        features.close()
+        time.sleep(0.3)
+        self.assertTrue(get_mock.call_count < 10)
+
+    @patch.object(requests, 'get')
+    def test_get_features_prefetch_error(self, get_mock):
+        """Prefetch errors are raised to the consumer."""
+        get_mock.__name__ = 'get'
+        mocks = tests.helper.get_features_pages(2, 1)
+        mocks[1].status_code = 404
+        mocks[1].json.return_value = {'code': 1, 'message': 'test',
+                                      'more': None}
+        get_mock.side_effect = mocks
+        features = snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', prefetch=1)
+        self.assertEqual(next(features).uuid, 'test_feature_0')
+        self.assertRaises(snowfloat.errors.RequestError, next, features)
+
+    @patch.object(requests, 'get')
+    def test_get_features_lazy(self, get_mock):
+        """Decode geometries on first access."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        features = list(snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', lazy=True))
+        self.assertDictEqual(features[0]._geometry,
+            {'type': 'Point', 'coordinates': [0, 1]})
+        self.assertEqual(features[0].fields['ts'], 0)
+        geometry = features[0].geometry
+        self.assertTrue(isinstance(geometry, snowfloat.geometry.Point))
+        self.assertIs(features[0].geometry, geometry)
+        feature = snowfloat.feature.Feature(None,
+            spatial={'type': 'Point', 'coordinates': [1, 2]})
+        self.assertListEqual(feature.spatial.coordinates, [1, 2])
+
+    @patch.object(requests, 'get')
+    def test_get_features_projection(self, get_mock):
+        """Request and apply fields and geometry projections."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 2)
+        features = list(snowfloat.feature.get_features(
+            '/geo/1/layers/test_layer_1', include_fields=('ts',),
+            geometry_format='none'))
+        self.assertDictEqual(get_mock.call_args[1]['params'],
+            {'fields': 'field_ts', 'geometry_format': 'none'})
+        self.assertDictEqual(features[1].fields, {'ts': 1})
+        self.assertIsNone(features[1].geometry)
+
+    @patch.object(requests, 'get')
+    def test_get_features_keyset(self, get_mock):
+        """Page through features with conditions on the last key."""
+        get_mock.__name__ = 'get'
+        # date_created values shared by several features
+        features = tests.helper.get_features_pages(1, 7)[0].json()[
+            'geo']['features']
+        for i, feature in enumerate(features):
+            feature['properties']['date_created'] = i // 3
+
+        def get_page(*args, **kwargs):
+            """Returns the features matching the keyset conditions."""
+            # pylint: disable=W0613
+            params = kwargs['params']
+            key = params['order_by'].split(',')[0]
+            if key == 'uuid':
+                key = [name[:-7] for name in params
+                       if name.endswith('__exact')] or ['uuid']
+                key = key[0]
+            value = lambda f: f['id'] if key == 'uuid' else \
+                f['properties'][key]
+            page = [f for f in features
+                if value(f) == params.get('%s__exact' % (key,), value(f))
+                and f['id'] > params.get('uuid__gt', '')
+                and (key == 'uuid' or
+                     value(f) > params.get('%s__gt' % (key,), -1))]
+            page = page[params['slice_start']:params['slice_end']]
+            mock = Mock()
+            mock.status_code = 200
+            mock.json.return_value = {'next_page_uri': 'test', 'total': 7,
+                'geo': {'type': 'FeatureCollection', 'features': page}}
+            return mock
+
+        get_mock.side_effect = get_page
+        res = list(snowfloat.feature.get_features_keyset(
+            '/geo/1/layers/test_layer_1', page_size=2, field_ts_gte=0))
+        self.assertListEqual([f.uuid for f in res],
+            ['test_feature_%d' % (i,) for i in range(7)])
+        self.assertEqual(get_mock.call_count, 5)
+        params = [call[1]['params'] for call in get_mock.call_args_list]
+        self.assertDictEqual(params[0], {'order_by': 'date_created,uuid',
+            'slice_start': 0, 'slice_end': 2, 'page_size': 2,
+            'field_ts__gte': 0})
+        self.assertDictEqual(params[1], {'order_by': 'uuid',
+            'date_created__exact': 0, 'uuid__gt': 'test_feature_1',
+            'slice_start': 0, 'slice_end': 2, 'page_size': 2,
+            'field_ts__gte': 0})
+        self.assertEqual(params[2]['date_created__gt'], 0)
+
+        # the key field is added to the fields requested
+        get_mock.reset_mock()
+        for i, feature in enumerate(features):
+            feature['properties']['field_ts'] = i // 3
+        res = list(snowfloat.feature.get_features_keyset(
+            '/geo/1/layers/test_layer_1', key='field_ts', page_size=2,
+            include_fields=('tag',)))
+        self.assertEqual(len(res), 7)
+        self.assertEqual(get_mock.call_args_list[0][1]['params']['fields'],
+            'field_tag,field_ts')
+
+        # uuids are unique: one condition per page
+        get_mock.reset_mock()
+        res = list(snowfloat.feature.get_features_keyset(
+            '/geo/1/layers/test_layer_1', key='uuid', page_size=3))
+        self.assertListEqual([f.uuid for f in res],
+            ['test_feature_%d' % (i,) for i in range(7)])
+        self.assertEqual(get_mock.call_count, 3)
+        params = [call[1]['params'] for call in get_mock.call_args_list]
+        self.assertDictEqual(params[0], {'order_by': 'uuid',
+            'slice_start': 0, 'slice_end': 3, 'page_size': 3})
+        self.assertEqual(params[2]['uuid__gt'], 'test_feature_5')
+
+    def test_project_features(self):
+        """Compute bounding boxes and centroids from the coordinates."""
+        coordinates = [[[0, 0], [4, 0], [4, 2], [0, 2], [0, 0]]]
+        features = [{'type': 'Feature', 'id': 'test_feature_1',
+                     'geometry': {'type': 'Polygon',
+                                  'coordinates': coordinates},
+                     'properties': {'field_ts': 1, 'field_tag': 'a'}}]
+        res = snowfloat.feature.project_features(features,
+            geometry_format='bbox')
+        self.assertDictEqual(res[0]['geometry'],
+            {'type': 'Polygon', 'coordinates': coordinates})
+        self.assertDictEqual(res[0]['properties'],
+            {'field_ts': 1, 'field_tag': 'a'})
+        res = snowfloat.feature.project_features(features, include_fields=(),
+            geometry_format='centroid')
+        self.assertDictEqual(res[0]['geometry'],
+            {'type': 'Point', 'coordinates': [1.6, 0.8]})
+        self.assertDictEqual(res[0]['properties'], {})
+        # the pages given are left unchanged
+        self.assertEqual(features[0]['geometry']['type'], 'Polygon')
+        self.assertDictEqual(features[0]['properties'],
+            {'field_ts': 1, 'field_tag': 'a'})
+        self.assertRaises(ValueError, snowfloat.feature.project_features,
+            features, geometry_format='test')
+
+    @patch.object(requests, 'get')
+    def test_invalid_geometry_format(self, get_mock):
+        """Geometry format is checked before sending the request."""
+        get_mock.__name__ = 'get'
+        self.assertRaises(ValueError, self.client.get_features,
+            'test_layer_1', geometry_format='test')
+        self.assertFalse(get_mock.called)
+
+    def test_slots(self):
+        """Features have no instance dictionary nor shared fields."""
+        feature_1 = snowfloat.feature.Feature(None)
+        feature_2 = snowfloat.feature.Feature(None)
+        self.assertFalse(hasattr(feature_1, '__dict__'))
+        feature_1.fields['ts'] = 1
+        self.assertDictEqual(feature_2.fields, {})
+        self.assertRaises(AttributeError, snowfloat.feature.Feature, None,
+            test=1)
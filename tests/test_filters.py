@@ -0,0 +1,87 @@
+"""Local filters tests."""
+
+import tests.helper
+
+import snowfloat.columnar
+import snowfloat.feature
+import snowfloat.filters
+import snowfloat.geometry
+
+class FilterTests(tests.helper.Tests):
+    """Local filters tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.points = [snowfloat.feature.Feature(
+                snowfloat.geometry.Point([i, i]),
+                uuid='test_feature_%d' % (i,),
+                uri='/geo/1/layers/test_layer_1/features/test_feature_%d'
+                    % (i,),
+                date_created='2013-01-%02d' % (i + 1,),
+                layer_uuid='test_layer_1',
+                fields={'ts': i, 'tag': 'Tag_%d' % (i % 3,)})
+            for i in range(10)]
+        del self.points[4].fields['ts']
+        page = tests.helper.format_features_page(self.points)
+        for feature, geojson in zip(self.points, page):
+            geojson['properties']['date_created'] = feature.date_created
+        self.batch = snowfloat.columnar.parse_feature_batch([page])
+        tests.helper.Tests.setUp(self)
+
+    def check(self, expected, **kwargs):
+        """Check the features and batch rows matching conditions."""
+        query_filter = snowfloat.filters.Filter(**kwargs)
+        self.assertListEqual(
+            [f.uuid for f in query_filter.apply(self.points)],
+            ['test_feature_%d' % (i,) for i in expected])
+        self.assertListEqual(query_filter.apply_batch(self.batch).tolist(),
+            expected)
+
+    def test_conditions(self):
+        """Evaluate fields and attributes conditions."""
+        self.check([6, 7, 8, 9], field_ts_gt=5)
+        self.check([0, 1, 2, 3], field_ts_lt=4)
+        self.check([2, 5, 8], field_tag_exact='Tag_2')
+        self.check([2, 5, 8], field_tag_iexact='tag_2', field_ts_gte=0)
+        self.check([1, 4, 7], field_tag_endswith='1')
+        self.check([4], field_ts_isnull=True)
+        self.check([1, 3], field_ts_in=(1, 3))
+        self.check([3, 5, 6], field_ts_range=(3, 6), field_tag_icontains='T')
+        self.check([0, 1], date_created_lte='2013-01-02')
+        self.check([9], uuid_exact='test_feature_9')
+        self.check(range(10), layer_uuid_exact='test_layer_1', page_size=2)
+        self.check([], field_test_gt=1)
+
+    def test_order_by(self):
+        """Order and slice like the server."""
+        self.check([4, 9, 8, 7, 6, 5, 3, 2, 1, 0], order_by=('-field_ts',))
+        self.check([0, 1, 2, 3, 5, 6, 7, 8, 9, 4], order_by=('field_ts',))
+        self.check([9, 6, 3, 0], order_by=('field_tag', '-field_ts'),
+            query_slice=(0, 4))
+        self.check([2, 3], field_ts_gte=2, query_slice=(0, 2))
+        self.check([8, 9], field_ts_gte=2, query_slice=(5,))
+
+    def test_spatial(self):
+        """Evaluate spatial queries."""
+        polygon = snowfloat.geometry.Polygon(
+            [[[1.5, 1.5], [3.5, 1.5], [3.5, 3.5], [1.5, 3.5], [1.5, 1.5]]])
+        self.check([2, 3], query='intersects', geometry=polygon)
+        # about 157 km between neighbour points
+        self.check([4, 5, 6], query='distance_lte',
+            geometry=snowfloat.geometry.Point([5, 5]), distance=160000,
+            geodesic=True)
+        self.check([5], query='distance_lt',
+            geometry=snowfloat.geometry.Point([5, 5]), distance=150000,
+            geodesic=True)
+        # meters are not evaluated on projected coordinates
+        self.assertRaises(ValueError, snowfloat.filters.Filter,
+            query='distance_lte', geometry=snowfloat.geometry.Point([5, 5]),
+            distance=1.5)
+
+    def test_invalid(self):
+        """Reject conditions not evaluated locally."""
+        for kwargs in ({'field_ts_test': 1}, {'name_exact': 1},
+                       {'spatial_operation': 'intersection'},
+                       {'order_by': ('test',)},
+                       {'query': 'test', 'geometry': None}):
+            self.assertRaises(ValueError, snowfloat.filters.Filter, **kwargs)
@@ -0,0 +1,149 @@
+"""Point grid tests."""
+
+import math
+import random
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.grid
+import snowfloat.layer
+
+class PointGridTests(tests.helper.Tests):
+    """Point grid tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        rand = random.Random(0)
+        self.points = [_get_point('test_point_%d' % (i,),
+                                  rand.uniform(0, 100), rand.uniform(0, 100))
+                       for i in range(500)]
+        tests.helper.Tests.setUp(self)
+
+    def test_nearest(self):
+        """Find the nearest points like a full scan."""
+        grid = snowfloat.grid.PointGrid(self.points + [
+            snowfloat.feature.Feature(
+                snowfloat.geometry.LineString([[0, 0], [1, 1]]))])
+        self.assertEqual(len(grid), 500)
+        for x, y, k in ((50, 50, 1), (0, 0, 5), (-500, 20, 3),
+                (99, 1, 600)):
+            res = grid.nearest([x, y], k=k)
+            expected = sorted(self.points, key=lambda f: _distance(f, x, y))
+            self.assertEqual([feature for feature, _ in res],
+                expected[:k])
+            self.assertAlmostEqual(res[-1][1],
+                _distance(expected[min(k, 500) - 1], x, y))
+        res = grid.nearest(snowfloat.geometry.Point([50, 50]), k=10,
+            max_distance=2)
+        self.assertTrue(all(distance <= 2 for _, distance in res))
+        self.assertEqual(len(res), len(grid.within([50, 50], 2)))
+
+    def test_within(self):
+        """Find the points within a distance like a full scan."""
+        grid = snowfloat.grid.PointGrid(self.points, cell_size=3)
+        res = grid.within([30, 60], 10)
+        expected = sorted([feature for feature in self.points
+                           if _distance(feature, 30, 60) <= 10],
+                          key=lambda f: _distance(f, 30, 60))
+        self.assertEqual([feature for feature, _ in res], expected)
+        self.assertEqual(grid.within([500, 500], 10), [])
+
+    @patch.object(snowfloat.grid, 'MIN_REBUILD_CHANGES', 50)
+    def test_update(self):
+        """Insert and delete points without and with rebuilds."""
+        grid = snowfloat.grid.PointGrid(self.points[:100])
+        grid.insert(_get_point('test_point_new', 50.5, 50.5))
+        self.assertEqual(grid.nearest([50.5, 50.5])[0][0].uuid,
+            'test_point_new')
+        grid.delete('test_point_new')
+        self.assertNotEqual(grid.nearest([50.5, 50.5])[0][0].uuid,
+            'test_point_new')
+        self.assertRaises(KeyError, grid.delete, 'test_point_new')
+        # move a point
+        grid.insert(_get_point('test_point_0', 200, 200))
+        self.assertEqual(grid.nearest([200, 200])[0][0].uuid, 'test_point_0')
+        self.assertEqual(len(grid), 100)
+        for feature in self.points[100:]:
+            grid.insert(feature)
+        for feature in self.points[450:]:
+            grid.delete(feature.uuid)
+            grid.insert(feature)
+        self.assertEqual(len(grid), 500)
+        expected = sorted(self.points[1:] + [grid.nearest([200, 200])[0][0]],
+            key=lambda f: _distance(f, 40, 40))[:20]
+        self.assertEqual([feature for feature, _ in grid.nearest([40, 40],
+            k=20)], expected)
+        for feature in self.points[1:50]:
+            grid.delete(feature.uuid)
+        self.assertEqual(len(grid), 451)
+        x, y = 20, 70
+        expected = sorted(self.points[50:],
+            key=lambda f: _distance(f, x, y))[:8]
+        self.assertEqual([feature for feature, _ in grid.nearest([x, y],
+            k=8)], expected)
+
+    def test_geodesic(self):
+        """Haversine distances in meters for longitudes and latitudes."""
+        points = [_get_point('test_point_0', 1, 0),
+                  _get_point('test_point_1', -179.9, 0),
+                  _get_point('test_point_2', 0, 89.9),
+                  _get_point('test_point_3', 2.35, 48.85)]
+        grid = snowfloat.grid.PointGrid(points, geodesic=True)
+        feature, distance = grid.nearest([0, 0])[0]
+        self.assertEqual(feature.uuid, 'test_point_0')
+        self.assertAlmostEqual(distance, 111195, delta=1)
+        # across the antimeridian and the pole
+        self.assertEqual(grid.nearest([179.9, 0])[0][0].uuid, 'test_point_1')
+        self.assertEqual(grid.nearest([180, 89.95])[0][0].uuid,
+            'test_point_2')
+        res = grid.within([-0.13, 51.51], 400000)
+        self.assertEqual([feature.uuid for feature, _ in res],
+            ['test_point_3'])
+        self.assertAlmostEqual(res[0][1], 344400, delta=1000)
+
+    @patch.object(requests, 'get')
+    @patch.object(requests, 'delete')
+    @patch.object(requests, 'post')
+    def test_get_point_grid(self, post_mock, delete_mock, get_mock):
+        """Build a grid from a layer and follow its writes."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 1)
+        grid = self.layer.get_point_grid()
+        self.assertEqual(len(grid), 1)
+        self.assertEqual(grid.nearest([3, 4])[0][0].uuid, 'test_feature_0')
+
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        self.layer.add_features([snowfloat.feature.Feature(
+            snowfloat.geometry.Point([3.1, 4.1]))])
+        self.assertEqual(len(grid), 2)
+        self.assertEqual(grid.nearest([3, 4])[0][0].uuid, 'test_feature_1')
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1, 'num_features': 1})
+        self.layer.delete_feature('test_feature_1')
+        self.assertEqual(len(grid), 1)
+        self.assertFalse(grid.stale)
+        self.layer.delete_features(field_ts_gte=5)
+        self.assertTrue(grid.stale)
+        grid.close()
+
+
+def _get_point(uuid, x, y):
+    """Returns a point feature."""
+    return snowfloat.feature.Feature(snowfloat.geometry.Point([x, y]),
+        uuid=uuid)
+
+def _distance(feature, x, y):
+    """Returns the planar distance of a point feature."""
+    coordinates = feature.geometry.coordinates
+    return math.hypot(coordinates[0] - x, coordinates[1] - y)
@@ -0,0 +1,145 @@
+"""Spatial index tests."""
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.columnar
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.index
+import snowfloat.layer
+
+class SpatialIndexTests(tests.helper.Tests):
+    """Spatial index tests."""
+
+    def get_points(self, num):
+        """Returns point features on a grid."""
+        return [snowfloat.feature.Feature(
+                    snowfloat.geometry.Point([i % 10, i // 10]),
+                    uuid='test_feature_%d' % (i,), fields={'ts': i})
+                for i in range(num)]
+
+    def test_search(self):
+        """Find the features whose bounding box intersects an extent."""
+        features = self.get_points(100)
+        index = snowfloat.index.SpatialIndex(features, node_capacity=4)
+        self.assertEqual(len(index), 100)
+        res = index.search([2, 3, 5, 6])
+        self.assertListEqual(sorted(f.fields['ts'] for f in res),
+            [52, 53, 62, 63])
+        for extent in ([0, 9, 0, 9], [-1, 0.5, -1, 0.5], [20, 30, 0, 1]):
+            expected = [f.fields['ts'] for f in features
+                if extent[0] <= f.geometry.x <= extent[1]
+                and extent[2] <= f.geometry.y <= extent[3]]
+            self.assertListEqual(sorted(f.fields['ts']
+                for f in index.search(extent)), expected)
+
+    def test_query(self):
+        """Evaluate exact predicates and distances."""
+        index = snowfloat.index.SpatialIndex(self.get_points(100),
+            geodesic=True)
+        polygon = snowfloat.geometry.Polygon(
+            [[[0.5, 0.5], [2.5, 0.5], [0.5, 2.5], [0.5, 0.5]]])
+        self.assertListEqual([f.fields['ts'] for f in index.query(
+            'intersects', polygon)], [11, 12, 21])
+        self.assertEqual(len(index.query('disjoint', polygon)), 97)
+        # one degree is about 111 km
+        point = snowfloat.geometry.Point([5, 5])
+        self.assertListEqual([f.fields['ts'] for f in index.query(
+            'distance_lte', point, distance=112000)], [45, 54, 55, 56, 65])
+        self.assertEqual(len(index.query('distance_gt', point,
+            distance=112000)), 95)
+        self.assertRaises(ValueError, index.query, 'distance_lt', point)
+        self.assertRaises(ValueError, index.query, 'test', point)
+        # meters are not the coordinates units of other layers
+        self.assertRaises(ValueError, snowfloat.index.SpatialIndex(
+            self.get_points(10)).query, 'dwithin', point, distance=1)
+        stats = index.stats()
+        self.assertEqual(stats['queries'], 4)
+        self.assertEqual(stats['results'], 3 + 97 + 5 + 95)
+        self.assertTrue(stats['mean_seconds'] <= stats['max_seconds'])
+
+    def test_distance(self):
+        """Compute haversine meters and search extents."""
+        shape = snowfloat.index.to_shape(snowfloat.geometry.Polygon(
+            [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]))
+        point = snowfloat.index.to_shape(snowfloat.geometry.Point([2, 0]))
+        self.assertAlmostEqual(snowfloat.index.get_distance(shape, point),
+            111195, delta=1)
+        self.assertEqual(snowfloat.index.get_distance(shape,
+            snowfloat.index.to_shape(snowfloat.geometry.Point([1, 1]))), 0)
+        extent = snowfloat.index.get_distance_extent([0, 1, 60, 60],
+            111195)
+        self.assertAlmostEqual(extent[2], 59, places=3)
+        self.assertAlmostEqual(extent[3], 61, places=3)
+        # longitudes degrees are shorter away from the equator
+        self.assertTrue(-2.1 < extent[0] < -1.9 and 2.9 < extent[1] < 3.1)
+        self.assertIsNone(snowfloat.index.get_distance_extent(
+            [0, 1, 89, 89.5], 111195))
+        self.assertIsNone(snowfloat.index.get_distance_extent(
+            [179.5, 179.9, 0, 0], 111195))
+
+    def test_insert_delete(self):
+        """Insert and delete features after packing."""
+        features = self.get_points(100)
+        index = snowfloat.index.SpatialIndex(features[:50], node_capacity=4)
+        for feature in features[50:]:
+            index.insert(feature)
+        index.insert(snowfloat.feature.Feature(None, uuid='test_feature'))
+        for i in range(0, 100, 3):
+            index.delete('test_feature_%d' % (i,))
+        index.delete('test_feature')
+        self.assertRaises(KeyError, index.delete, 'test_feature_0')
+        self.assertEqual(len(index), 66)
+        self.assertListEqual(sorted(f.fields['ts']
+            for f in index.search([0, 9, 0, 9])),
+            [i for i in range(100) if i % 3])
+
+    def test_insert_update(self):
+        """Replace the features inserted with a known uuid."""
+        features = self.get_points(20)
+        index = snowfloat.index.SpatialIndex(features, node_capacity=4)
+        for uuid, point in (('test_feature_0', [50, 50]),
+                            ('test_feature_0', [60, 60]),
+                            ('test_feature_19', [70, 70])):
+            index.insert(snowfloat.feature.Feature(
+                snowfloat.geometry.Point(point), uuid=uuid))
+        self.assertEqual(len(index), 20)
+        self.assertEqual(index.search([0, 0, 0, 0]), [])
+        self.assertEqual(index.search([50, 50, 50, 50]), [])
+        self.assertListEqual([f.geometry.coordinates
+            for f in index.search([40, 80, 40, 80])], [[60, 60], [70, 70]])
+        index.delete('test_feature_0')
+        self.assertEqual(len(index), 19)
+        self.assertEqual(len(index.search([40, 80, 40, 80])), 1)
+        self.assertRaises(KeyError, index.delete, 'test_feature_0')
+
+    def test_feature_batch(self):
+        """Index a columnar batch."""
+        features = self.get_points(20)
+        features[3].geometry = snowfloat.geometry.LineString(
+            [[3, 0], [8, 4]])
+        page = tests.helper.format_features_page(features)
+        page[5]['geometry'] = None
+        batch = snowfloat.columnar.parse_feature_batch([page])
+        extents = snowfloat.index.get_batch_extents(batch)
+        self.assertListEqual(extents[3], [3, 8, 0, 4])
+        self.assertIsNone(extents[5])
+        self.assertListEqual(extents[19], [9, 9, 1, 1])
+        index = snowfloat.index.SpatialIndex(batch)
+        self.assertListEqual(sorted(f.fields['ts']
+            for f in index.search([7.5, 8.5, 2, 3])), [3])
+
+    @patch.object(requests, 'get')
+    def test_layer_spatial_index(self, get_mock):
+        """Index a layer's features."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        layer = snowfloat.layer.Layer(uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        index = layer.get_spatial_index()
+        self.assertEqual(len(index), 4)
+        self.assertListEqual([f.uuid for f in index.query('intersects',
+            snowfloat.geometry.Point([2, 3]))], ['test_feature_2'])
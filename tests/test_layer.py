@@ -10,6 +10,7 @@ import tests.helper
 
 import snowfloat.geometry
 import snowfloat.layer
+import snowfloat.signals
 
 class LayerTests(tests.helper.Tests):
     """Layer tests."""
@@ -31,6 +32,55 @@ class LayerTests(tests.helper.Tests):
         """Get layer features."""
         self.get_features_test(get_mock, self.layer.get_features)
     
+    @patch.object(requests, 'get')
+    def test_iter_features(self, get_mock):
+        """Iterate over layer features."""
+        self.get_features_test(get_mock,
+            lambda **kwargs: list(self.layer.iter_features(**kwargs)))
+
+    @patch.object(requests, 'get')
+    def test_count_features(self, get_mock):
+        """Count layer features from a single feature page."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(3, 2)
+        self.assertEqual(self.layer.count_features(field_ts_gte=1), 6)
+        self.assertEqual(get_mock.call_count, 1)
+        self.assertDictEqual(get_mock.call_args[1]['params'],
+            {'field_ts__gte': 1, 'slice_start': 0, 'slice_end': 1,
+             'page_size': 1, 'geometry_format': 'none'})
+        self.assertTrue(self.layer.exists(field_ts_gte=1))
+        self.assertEqual(get_mock.call_count, 1)
+        get_mock.side_effect = tests.helper.get_features_pages(1, 0)
+        self.assertFalse(self.layer.exists(field_ts_gte=2))
+        self.assertEqual(get_mock.call_count, 2)
+        self.layer.clear_count_cache()
+        get_mock.side_effect = tests.helper.get_features_pages(1, 0)
+        self.assertEqual(self.layer.count_features(field_ts_gte=1), 0)
+        # list values are cached too
+        get_mock.side_effect = tests.helper.get_features_pages(2, 2)
+        self.assertEqual(self.layer.count_features(
+            field_tag_in=['test_tag_1', 'test_tag_2']), 4)
+        self.assertEqual(self.layer.count_features(
+            field_tag_in=['test_tag_1', 'test_tag_2']), 4)
+        self.assertEqual(get_mock.call_count, 4)
+        # shared by the layer's objects, paging arguments ignored
+        other = snowfloat.layer.Layer(uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.assertEqual(other.count_features(
+            field_tag_in=['test_tag_1', 'test_tag_2'], page_size=2,
+            prefetch=1, limit=3), 4)
+        self.assertEqual(get_mock.call_count, 4)
+        # dropped on writes through the client
+        snowfloat.signals.send('test_layer_2', 'update', [])
+        self.assertEqual(other.count_features(
+            field_tag_in=['test_tag_1', 'test_tag_2']), 4)
+        self.assertEqual(get_mock.call_count, 4)
+        snowfloat.signals.send('test_layer_1', 'update', [])
+        get_mock.side_effect = tests.helper.get_features_pages(1, 1)
+        self.assertEqual(other.count_features(
+            field_tag_in=['test_tag_1', 'test_tag_2']), 1)
+        self.assertEqual(get_mock.call_count, 5)
+
     @patch.object(requests, 'post')
     def test_add_features(self, post_mock):
         """Add layer features."""
@@ -0,0 +1,163 @@
+"""Membership filter tests."""
+
+import itertools
+import os
+import shutil
+import tempfile
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.membership
+
+class MembershipFilterTests(tests.helper.Tests):
+    """Membership filter tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'uuids.bloom')
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    def test_filter(self):
+        """No false negatives and few false positives."""
+        membership = snowfloat.membership.MembershipFilter(capacity=2000,
+            error_rate=0.01)
+        for i in range(2000):
+            membership.add('test_feature_%d' % (i,))
+        self.assertTrue(all('test_feature_%d' % (i,) in membership
+                            for i in range(2000)))
+        false_positives = sum(1 for i in range(10000)
+                              if 'test_other_%d' % (i,) in membership)
+        self.assertTrue(false_positives < 200)
+
+        self.assertEqual(membership.stats()['keys'], 2000)
+        # 9.6 bits per key at 1%
+        membership.save(self.path)
+        self.assertTrue(os.path.getsize(self.path) < 2000 * 1.2 + 200)
+
+        membership.add(4)
+        membership.add(u'test_\xe9')
+        self.assertTrue(4 in membership)
+        self.assertTrue(u'test_\xe9' in membership)
+        self.assertRaises(snowfloat.errors.Error, membership.exists, 4)
+        self.assertRaises(ValueError, snowfloat.membership.MembershipFilter,
+            error_rate=2)
+
+    @patch.object(requests, 'get')
+    def test_get_membership_filter(self, get_mock):
+        """Build, save and load a filter, and check keys on possible
+        hits."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(10)] + \
+            tests.helper.get_features_pages(2, 5)
+        membership = self.layer.get_membership_filter(path=self.path)
+        self.assertEqual(get_mock.call_args_list[1][1]['params'],
+            {'fields': '', 'geometry_format': 'none'})
+        self.assertEqual(membership.stats()['keys'], 10)
+        self.assertEqual(membership.layer_version, [10, 9])
+        membership.close()
+
+        # read from the file while the layer is unchanged
+        tests.helper.set_method_mock(get_mock, 'get', 200,
+            {'next_page_uri': None, 'total': 1,
+             'geo': {'type': 'FeatureCollection', 'features': []}})
+        get_mock.side_effect = itertools.chain(
+            [tests.helper.get_layer_version_mock(10)],
+            itertools.repeat(get_mock.return_value))
+        membership = self.layer.get_membership_filter(path=self.path)
+        self.assertEqual(get_mock.call_count, 4)
+        self.assertTrue(membership.exists('test_feature_3'))
+        self.assertEqual(get_mock.call_count, 5)
+        self.assertEqual(get_mock.call_args[1]['params']['uuid__exact'],
+            'test_feature_3')
+        self.assertEqual(membership.get_existing(
+            ['test_other_%d' % (i,) for i in range(20)]), [])
+        stats = membership.stats()
+        self.assertEqual(stats['negatives'] + stats['possible_hits'], 21)
+        self.assertEqual(get_mock.call_count,
+            4 + stats['possible_hits'])
+        membership.close()
+
+        # built again once the layer changed
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(3),
+            tests.helper.get_layer_version_mock(3)] + \
+            tests.helper.get_features_pages(1, 3)
+        membership = self.layer.get_membership_filter(path=self.path)
+        self.assertEqual(membership.stats()['keys'], 3)
+        membership.close()
+
+        # another key is built again
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(3)] + \
+            tests.helper.get_features_pages(1, 3)
+        membership = self.layer.get_membership_filter(key='tag',
+            path=self.path)
+        self.assertEqual(get_mock.call_args[1]['params'],
+            {'fields': 'field_tag', 'geometry_format': 'none'})
+        self.assertTrue('test_tag_2' in membership)
+        self.assertFalse('test_feature_2' in membership)
+        membership.close()
+
+        self.assertRaises(snowfloat.errors.Error,
+            snowfloat.membership.load_filter, self.path,
+            uri='/geo/1/layers/test_layer_2')
+        # a subset would answer the other keys as absent
+        self.assertRaises(TypeError, self.layer.get_membership_filter,
+            field_ts_gte=5)
+
+    @patch.object(requests, 'get')
+    @patch.object(requests, 'delete')
+    @patch.object(requests, 'post')
+    def test_writes(self, post_mock, delete_mock, get_mock):
+        """Follow the writes made through the client."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(0)] + \
+            tests.helper.get_features_pages(1, 0)
+        membership = self.layer.get_membership_filter()
+        self.assertFalse('test_feature_1' in membership)
+
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        self.layer.add_features([snowfloat.feature.Feature(
+            snowfloat.geometry.Point([1, 2]))])
+        self.assertTrue('test_feature_1' in membership)
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1})
+        # deleted keys are possible hits, other keys keep matching
+        membership.add('test_feature_2')
+        self.layer.delete_feature('test_feature_1')
+        self.assertTrue('test_feature_1' in membership)
+        self.assertEqual(membership.stats()['keys'], 2)
+        self.layer.delete_feature('test_other_1')
+        self.assertTrue('test_feature_2' in membership)
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1, 'num_features': 1})
+        self.layer.delete_features(field_ts_gte=5)
+        self.assertTrue('test_feature_2' in membership)
+        self.assertFalse(membership.stale)
+
+        post_mock.side_effect = snowfloat.errors.RequestError(500, None,
+            'error', None)
+        self.assertRaises(snowfloat.errors.RequestError,
+            self.layer.add_features, [snowfloat.feature.Feature(
+                snowfloat.geometry.Point([1, 2]))])
+        self.assertTrue(membership.stale)
+        membership.save(self.path)
+        membership.close()
+        self.assertTrue(snowfloat.membership.load_filter(self.path).stale)
@@ -0,0 +1,142 @@
+"""SQLite mirror tests."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.layer
+
+class MirrorTests(tests.helper.Tests):
+    """SQLite mirror tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            fields=[{'name': 'ts', 'type': 'integer'}])
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'layer.db')
+        self.server = dict((feature['id'], feature) for feature in
+            tests.helper.get_features_pages(1, 4)[0].json()['geo'][
+                'features'])
+        self.calls = []
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    def get_side_effect(self, *args, **kwargs):
+        """Returns the server features matching the keyset conditions."""
+        # pylint: disable=W0613
+        params = kwargs['params']
+        self.calls.append(params)
+        value = lambda f, name: f['id'] if name == 'uuid' else \
+            f['properties'][name]
+        features = sorted(self.server.values(), key=lambda f: [
+            value(f, name) for name in params['order_by'].split(',')])
+        for param, arg in params.iteritems():
+            if param.endswith('__exact'):
+                features = [f for f in features if value(f, param[:-7]) == arg]
+            elif param.endswith('__gt'):
+                features = [f for f in features if value(f, param[:-4]) > arg]
+        features = features[params['slice_start']:params['slice_end']]
+        if params.get('geometry_format') == 'none':
+            features = [{'type': 'Feature', 'id': f['id'], 'geometry': None,
+                         'properties': {}} for f in features]
+        mock = Mock()
+        mock.status_code = 200
+        mock.json.return_value = {'next_page_uri': None,
+            'total': len(features),
+            'geo': {'type': 'FeatureCollection', 'features': features}}
+        return mock
+
+    @patch.object(requests, 'get')
+    def test_sync(self, get_mock):
+        """Snapshot a layer then pull its changes."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = self.get_side_effect
+        mirror = self.layer.mirror(self.path)
+        stats = mirror.sync(page_size=2)
+        self.assertEqual((stats['added'], stats['updated'],
+            stats['deleted']), (4, 0, 0))
+        self.assertDictEqual(self.calls[0], {'order_by': 'date_modified,uuid',
+            'slice_start': 0, 'slice_end': 2, 'page_size': 2})
+        self.assertEqual(mirror.count(), 4)
+        feature = mirror.get_feature('test_feature_1')
+        self.assertDictEqual(feature.fields, {'ts': 1, 'tag': 'test_tag_1'})
+        self.assertListEqual(feature.geometry.coordinates, [1, 2])
+        self.assertEqual(feature.layer_uuid, 'test_layer_1')
+        self.assertIsNone(mirror.get_feature('test_feature_9'))
+        self.assertListEqual([f.uuid for f in mirror.get_features(
+            extent=[0.5, 2.5, 0, 2.5])], ['test_feature_1'])
+        self.assertEqual(len(mirror.get_features(limit=3)), 3)
+        self.assertListEqual([f.uuid for f in mirror.get_features(
+            field_ts_gte=1, order_by=('-field_ts',), limit=2)],
+            ['test_feature_3', 'test_feature_2'])
+        mirror.close()
+
+        # feature 1 modified, feature 4 added and feature 2 deleted
+        self.server['test_feature_1']['properties'].update(
+            {'field_ts': 10, 'date_modified': 5})
+        feature = tests.helper.get_features_pages(1, 5)[0].json()['geo'][
+            'features'][4]
+        feature['properties']['date_modified'] = 6
+        self.server['test_feature_4'] = feature
+        del self.server['test_feature_2']
+        self.calls = []
+        with self.layer.mirror(self.path) as mirror:
+            stats = mirror.sync()
+            self.assertEqual((stats['added'], stats['updated'],
+                stats['deleted']), (1, 1, 1))
+            # resumed after the last feature synced
+            self.assertEqual(self.calls[0]['date_modified__exact'], 3)
+            self.assertEqual(self.calls[0]['uuid__gt'], 'test_feature_3')
+            self.assertEqual(self.calls[1]['date_modified__gt'], 3)
+            self.assertEqual(self.calls[2]['order_by'], 'uuid')
+            self.assertEqual(self.calls[2]['fields'], '')
+            self.assertEqual(self.calls[2]['geometry_format'], 'none')
+            self.assertEqual(mirror.count(), 4)
+            self.assertEqual(mirror.get_feature('test_feature_1').fields['ts'],
+                10)
+            self.assertIsNone(mirror.get_feature('test_feature_2'))
+            self.assertListEqual([f.uuid for f in mirror.get_features(
+                extent=[3.5, 5, 0, 10])], ['test_feature_4'])
+            self.calls = []
+            mirror.sync(detect_deletes=False)
+            self.assertEqual(self.calls[0]['date_modified__exact'], 6)
+            self.assertEqual(self.calls[0]['uuid__gt'], 'test_feature_4')
+            self.assertEqual(len(self.calls), 2)
+
+    @patch.object(requests, 'get')
+    def test_new_fields(self, get_mock):
+        """Add the columns of the fields added to the layer."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = self.get_side_effect
+        self.server['test_feature_1']['properties']['field_a"b'] = 'x'
+        with self.layer.mirror(self.path) as mirror:
+            mirror.sync()
+
+        self.layer.fields = self.layer.fields + [
+            {'name': 'tag', 'type': 'string'},
+            {'name': 'a"b', 'type': 'string'}]
+        with self.layer.mirror(self.path) as mirror:
+            self.assertDictEqual(mirror.get_feature('test_feature_1').fields,
+                {'ts': 1, 'tag': 'test_tag_1', 'a"b': 'x'})
+            self.assertEqual(len(mirror.get_features(field_tag_exact=
+                'test_tag_2')), 1)
+        conn = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(conn.execute('SELECT "field_a""b", fields '
+                'FROM features WHERE uuid = ?', ('test_feature_1',)
+                ).fetchone(), ('x', None))
+        finally:
+            conn.close()
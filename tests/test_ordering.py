@@ -0,0 +1,126 @@
+"""Spatial ordering tests."""
+
+import json
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.ordering
+import snowfloat.settings
+
+class OrderingTests(tests.helper.Tests):
+    """Spatial ordering tests."""
+
+    def get_grid_points(self, side):
+        """Returns point features on a grid, row by row."""
+        return [snowfloat.feature.Feature(
+                    snowfloat.geometry.Point([x, y]), fields={'ts': x})
+                for y in range(side) for x in range(side)]
+
+    def test_hilbert_key(self):
+        """Consecutive Hilbert keys are neighbour cells."""
+        order = 3
+        cells = dict((snowfloat.ordering.hilbert_key(x, y, order), (x, y))
+                     for x in range(8) for y in range(8))
+        self.assertListEqual(sorted(cells), range(64))
+        for key in range(63):
+            (x1, y1), (x2, y2) = cells[key], cells[key + 1]
+            self.assertEqual(abs(x1 - x2) + abs(y1 - y2), 1)
+
+    def test_zorder_key(self):
+        """Z-order keys interleave the cell bits."""
+        self.assertEqual(snowfloat.ordering.zorder_key(0, 0, 2), 0)
+        self.assertEqual(snowfloat.ordering.zorder_key(1, 0, 2), 1)
+        self.assertEqual(snowfloat.ordering.zorder_key(0, 1, 2), 2)
+        self.assertEqual(snowfloat.ordering.zorder_key(3, 3, 2), 15)
+
+    def test_sort_features(self):
+        """Sort features in memory and with sorted runs on disk."""
+        features = self.get_grid_points(8)
+        features.insert(0,
+            snowfloat.feature.Feature(None, fields={'ts': -1}))
+        in_memory = list(snowfloat.ordering.sort_features(features, order=3))
+        self.assertEqual(in_memory[0].fields['ts'], -1)
+        key_func = snowfloat.ordering.get_key_func([0, 7, 0, 7], order=3)
+        keys = [key_func(f) for f in in_memory]
+        self.assertListEqual(keys, sorted(keys))
+        external = list(snowfloat.ordering.sort_features(iter(features),
+            extent=[0, 7, 0, 7], order=3, max_in_memory=10))
+        self.assertListEqual([f.geometry.coordinates for f in external[1:]],
+            [f.geometry.coordinates for f in in_memory[1:]])
+        self.assertIsNone(external[0].geometry)
+        self.assertDictEqual(external[1].fields, in_memory[1].fields)
+
+    def test_sort_features_spatial(self):
+        """Spatial results are kept through the runs on disk."""
+        features = self.get_grid_points(2)
+        features[0].spatial = snowfloat.geometry.Point([5, 6])
+        features[1].spatial = 12.5
+        external = list(snowfloat.ordering.sort_features(iter(features),
+            extent=[0, 1, 0, 1], order=1, max_in_memory=1))
+        spatial = dict((tuple(f.geometry.coordinates), f.spatial)
+                       for f in external)
+        self.assertEqual(spatial[(0, 0)].coordinates, [5, 6])
+        self.assertEqual(spatial[(1, 0)], 12.5)
+        self.assertIsNone(spatial[(1, 1)])
+
+    def test_order_features(self):
+        """Order the features given without copies."""
+        features = self.get_grid_points(8)
+        ordered = snowfloat.ordering.order_features(features, order=3)
+        self.assertEqual(len(ordered), 64)
+        self.assertEqual(set(id(f) for f in ordered),
+            set(id(f) for f in features))
+        self.assertListEqual([f.geometry.coordinates for f in ordered],
+            [f.geometry.coordinates for f in snowfloat.ordering.sort_features(
+                features, order=3)])
+
+    def test_sort_features_errors(self):
+        """Invalid curve or missing extent."""
+        features = self.get_grid_points(2)
+        self.assertRaises(ValueError, list,
+            snowfloat.ordering.sort_features(features, curve='test'))
+        self.assertRaises(ValueError, list,
+            snowfloat.ordering.sort_features(iter(features)))
+
+    def test_extent(self):
+        """Geometries spatial extent."""
+        self.assertListEqual(self.features[2].geometry.extent(),
+            [11, 27, 12, 28])
+        self.assertListEqual(self.features[6].geometry.extent(),
+            [1, 14, 2, 15])
+        collection = snowfloat.geometry.GeometryCollection([])
+        self.assertIsNone(collection.extent())
+
+    @patch.object(requests, 'post')
+    def test_layer_add_features(self, post_mock):
+        """Add features to a layer in Z-order."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        layer = snowfloat.layer.Layer(uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        features = layer.add_features(self.get_grid_points(2),
+            spatial_order='zorder')
+        posted = json.loads(post_mock.call_args[1]['data'])['features']
+        self.assertListEqual([f['geometry']['coordinates'] for f in posted],
+            [[0, 0], [1, 0], [0, 1], [1, 1]])
+        self.assertEqual(features[2].uuid, 'test_feature_3')
+
+    @patch.object(snowfloat.settings, 'ORDERING_MAX_IN_MEMORY', 2)
+    @patch.object(requests, 'post')
+    def test_layer_add_features_large(self, post_mock):
+        """The features given get their uuids whatever their number."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        layer = snowfloat.layer.Layer(uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        points = self.get_grid_points(4)
+        points[0].spatial = 1
+        layer.add_features(points, spatial_order='hilbert')
+        self.assertTrue(all(f.uuid for f in points))
+        self.assertEqual(points[0].spatial, 1)
@@ -0,0 +1,149 @@
+"""Partitioned scans tests."""
+
+import json
+import threading
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.partition
+
+class PartitionTests(tests.helper.Tests):
+    """Partitioned scans tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            extent=[0, 9, 0, 9])
+        # 10 is outside the layer extent and 11 has no geometry
+        self.points = range(12)
+        # mock call_count is not thread-safe
+        self.calls = []
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        # workers of a scan stopped early may still be requesting a page
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread():
+                thread.join(1)
+        tests.helper.Tests.tearDown(self)
+
+    def get_side_effect(self, *args, **kwargs):
+        """Returns the points matching a tile or a slice."""
+        # pylint: disable=W0613
+        params = kwargs['params']
+        self.calls.append(params)
+        points = self.points
+        if 'geometry__intersects' in params:
+            ring = json.loads(
+                params['geometry__intersects'])['coordinates'][0]
+            xmin, xmax = ring[0][0], ring[1][0]
+            ymin, ymax = ring[0][1], ring[2][1]
+            points = [i for i in points if i < 11
+                      and xmin <= i <= xmax and ymin <= i <= ymax]
+        elif params.get('geometry__isnull'):
+            points = [11]
+        total = len(points)
+        if 'slice_start' in params:
+            points = points[params['slice_start']:params.get('slice_end')]
+        features = [{
+            'type': 'Feature',
+            'id': 'test_feature_%d' % (i,),
+            'geometry': {'type': 'Point', 'coordinates': [i, i]}
+                if i < 11 else None,
+            'properties': {
+                'uri': '/geo/1/layers/test_layer_1/features/'
+                       'test_feature_%d' % (i,),
+                'field_ts': i,
+                'date_created': i,
+                'date_modified': i,
+                'spatial': None}} for i in points]
+        mock = Mock()
+        mock.status_code = 200
+        mock.json.return_value = {
+            'next_page_uri': None,
+            'total': total,
+            'geo': {'type': 'FeatureCollection', 'features': features}}
+        return mock
+
+    def test_tile_partitions(self):
+        """Split an extent in tiles."""
+        partitions = snowfloat.partition.tile_partitions([0, 4, 0, 2], 4,
+            world=[-10, 10, -5, 5])
+        self.assertEqual(len(partitions), 5)
+        self.assertEqual(partitions[0]['query'], 'intersects')
+        self.assertListEqual(partitions[0]['geometry'].coordinates,
+            [[[-10, -5], [2.0, -5], [2.0, 1.0], [-10, 1.0], [-10, -5]]])
+        self.assertListEqual(partitions[3]['geometry'].coordinates,
+            [[[2.0, 1.0], [10, 1.0], [10, 5], [2.0, 5], [2.0, 1.0]]])
+        self.assertEqual(partitions[4], {'geometry_isnull': True})
+        partitions = snowfloat.partition.tile_partitions([0, 4, 0, 2], 3)
+        self.assertEqual(len(partitions), 4)
+        self.assertEqual(partitions[0]['geometry'].coordinates[0][0],
+            [-snowfloat.partition.UNBOUNDED, -snowfloat.partition.UNBOUNDED])
+
+    def test_slice_partitions(self):
+        """Split an ordered result in ranges."""
+        self.assertListEqual(
+            [p['query_slice'] for p in
+             snowfloat.partition.slice_partitions(10, 3)],
+            [(0, 3), (3, 6), (6,)])
+        self.assertEqual(len(snowfloat.partition.slice_partitions(2, 4)), 2)
+        self.assertListEqual(
+            [p['query_slice'] for p in
+             snowfloat.partition.slice_partitions(0, 4)], [(0,)])
+
+    @patch.object(requests, 'get')
+    def test_scan_tiles(self, get_mock):
+        """Scan tiles once each feature."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = self.get_side_effect
+        features = list(self.layer.scan(num_partitions=9, max_workers=3))
+        self.assertEqual(len(self.calls), 10)
+        self.assertListEqual(sorted(f.fields['ts'] for f in features),
+            range(12))
+        self.assertRaises(ValueError, self.layer.scan, query='intersects',
+            geometry=snowfloat.geometry.Point([1, 1]))
+
+    @patch.object(requests, 'get')
+    def test_scan_slices(self, get_mock):
+        """Scan slice ranges ordered by uuid."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = self.get_side_effect
+        features = list(self.layer.scan(num_partitions=3, by='slices',
+            field_ts_gte=0))
+        self.assertEqual(len(self.calls), 4)
+        self.assertListEqual(sorted(f.fields['ts'] for f in features),
+            range(12))
+        params = self.calls[-1]
+        self.assertEqual(params['order_by'], 'uuid')
+        self.assertEqual(params['field_ts__gte'], 0)
+        self.assertRaises(ValueError, self.layer.scan, by='test')
+
+        # features added after a cached count are still scanned
+        self.points = range(6)
+        self.assertEqual(self.layer.count_features(field_ts_gte=0), 6)
+        self.points = range(12)
+        features = list(self.layer.scan(num_partitions=3, by='slices',
+            field_ts_gte=0))
+        self.assertListEqual(sorted(f.fields['ts'] for f in features),
+            range(12))
+
+    @patch.object(requests, 'get')
+    def test_scan_error(self, get_mock):
+        """Partition errors are raised to the consumer."""
+        get_mock.__name__ = 'get'
+        mock = Mock()
+        mock.status_code = 404
+        mock.json.return_value = {'code': 1, 'message': 'test', 'more': None}
+        get_mock.return_value = mock
+        self.assertRaises(snowfloat.errors.RequestError, list,
+            self.layer.scan(num_partitions=2))
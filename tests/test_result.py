@@ -5,6 +5,7 @@ import requests.exceptions
 
 import tests.helper
 
+import snowfloat.result
 import snowfloat.task
 
 class ResultsTests(tests.helper.Tests):
@@ -30,3 +31,10 @@ class ResultsTests(tests.helper.Tests):
 
 
 
+
+    def test_slots(self):
+        """Tasks and results have no instance dictionary."""
+        task = snowfloat.task.Task()
+        self.assertFalse(hasattr(task, '__dict__'))
+        self.assertIsNot(task.extras, snowfloat.task.Task().extras)
+        self.assertFalse(hasattr(snowfloat.result.Result(), '__dict__'))
@@ -0,0 +1,132 @@
+"""Schema validation tests."""
+
+import json
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.schema
+
+class ValidatorTests(tests.helper.Tests):
+    """Validator tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        tests.helper.Tests.setUp(self)
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            fields=[{'name': 'tag', 'type': 'string', 'size': 5,
+                     'required': True},
+                    {'name': 'ts', 'type': 'integer'},
+                    {'name': 'ratio', 'type': 'real'},
+                    {'name': 'flag', 'type': 'boolean'},
+                    {'name': 'day', 'type': 'date'}],
+            srid=4326,
+            dims=2)
+        self.validator = self.layer.get_validator()
+
+    def get_feature(self, coordinates=None, **fields):
+        """Returns a point feature."""
+        return snowfloat.feature.Feature(
+            snowfloat.geometry.Point(coordinates or [1, 2]), fields=fields)
+
+    def test_coerce(self):
+        """Values are coerced to the fields types."""
+        feature = self.get_feature(tag=12, ts='3', ratio='0.5', flag=1,
+            day='2013-01-01')
+        self.assertListEqual(self.validator.validate(feature), [])
+        self.assertDictEqual(feature.fields, {'tag': u'12', 'ts': 3,
+            'ratio': 0.5, 'flag': True, 'day': '2013-01-01'})
+        feature = self.get_feature(tag='a', ts=4.0, ratio=2, flag=None)
+        self.assertListEqual(self.validator.validate(feature), [])
+        self.assertEqual(feature.fields['ts'], 4)
+
+    def test_invalid_fields(self):
+        """Invalid field values are reported."""
+        feature = self.get_feature(tag='abcdef', ts=True, ratio='a',
+            flag='b', other=1)
+        messages = self.validator.validate(feature)
+        self.assertEqual(len(messages), 5)
+        for val in (4.5, 'a', [1]):
+            messages = self.validator.validate(self.get_feature(tag='a',
+                ts=val))
+            self.assertEqual(len(messages), 1)
+        for val in ([1], True):
+            messages = self.validator.validate(self.get_feature(tag=val))
+            self.assertEqual(len(messages), 1)
+        messages = self.validator.validate(self.get_feature(ratio=True))
+        self.assertListEqual(messages, ['Field tag is required.',
+            "Field ratio: True is not a real."])
+
+    def test_invalid_geometry(self):
+        """Invalid geometries are reported."""
+        messages = self.validator.validate(self.get_feature([1, 2, 3],
+            tag='a'))
+        self.assertListEqual(messages,
+            ['Geometry has 3 dimensions, expected 2.'])
+        messages = self.validator.validate(self.get_feature([200, 2],
+            tag='a'))
+        self.assertListEqual(messages,
+            ['Geometry coordinates out of range for SRID 4326.'])
+        geometry = snowfloat.geometry.GeometryCollection(
+            [snowfloat.geometry.Point([1, 2, 3])])
+        feature = snowfloat.feature.Feature(geometry, fields={'tag': 'a'})
+        self.assertEqual(len(self.validator.validate(feature)), 1)
+        geometry = snowfloat.geometry.Geometry([1, 2])
+        feature = snowfloat.feature.Feature(geometry, fields={'tag': 'a'})
+        self.assertEqual(len(self.validator.validate(feature)), 1)
+
+    def test_check(self):
+        """Check raises on invalid features."""
+        features = [self.get_feature(tag='a'), self.get_feature(ts='a')]
+        try:
+            self.validator.check(features)
+        except snowfloat.errors.ValidationError, exception:
+            self.assertEqual(len(exception.errors), 1)
+            self.assertEqual(exception.errors[0][0], 1)
+            self.assertEqual(str(exception),
+                "ValidationError: message=1 invalid features., errors="
+                "[(1, ['Field tag is required.', "
+                "\"Field ts: 'a' is not an integer.\"])]")
+        else:
+            self.fail('ValidationError not raised.')
+        self.validator.check(features[:1])
+
+    @patch.object(requests, 'put')
+    @patch.object(requests, 'post')
+    def test_layer_add_features(self, post_mock, put_mock):
+        """Valid features are sent and invalid ones reported."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        features = [self.get_feature(tag='a', ts='1'),
+                    self.get_feature(tag='b', ts='b'),
+                    self.get_feature(tag='c')]
+        try:
+            self.layer.add_features(features, validate=True)
+        except snowfloat.errors.ValidationError, exception:
+            self.assertListEqual([e[0] for e in exception.errors], [1])
+            self.assertListEqual([f.uuid for f in exception.features],
+                ['test_feature_1', 'test_feature_2'])
+        else:
+            self.fail('ValidationError not raised.')
+        posted = json.loads(post_mock.call_args[1]['data'])['features']
+        self.assertEqual(posted[0]['properties']['field_ts'], 1)
+        self.assertEqual(self.layer.num_features, 2)
+
+        tests.helper.set_method_mock(put_mock, 'put', 200, {})
+        self.layer.update(dims=3)
+        self.assertIsNot(self.layer.get_validator(), self.validator)
+        self.assertEqual(self.layer.get_validator().dims, 3)
+
+    def test_no_schema(self):
+        """Fields are not checked without a schema."""
+        validator = snowfloat.schema.Validator()
+        self.assertListEqual(validator.validate(self.get_feature(a=1)), [])
@@ -0,0 +1,205 @@
+"""Layer statistics tests."""
+
+import collections
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.stats
+
+class LayerStatsTests(tests.helper.Tests):
+    """Layer statistics tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stats.json')
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    def test_hyperloglog(self):
+        """Estimate distinct values within the standard error."""
+        hll = snowfloat.stats.HyperLogLog(10)
+        for i in range(20000):
+            hll.add(i % 5000)
+        self.assertAlmostEqual(hll.count(), 5000, delta=5000 * 0.1)
+        small = snowfloat.stats.HyperLogLog(10)
+        for value in ('a', u'a', 'b', 1, 1.5, None):
+            small.add(value)
+        self.assertEqual(small.count(), 5)
+        other = snowfloat.stats.HyperLogLog(10)
+        other.add('c')
+        small.merge(other)
+        self.assertEqual(small.count(), 6)
+        self.assertRaises(ValueError, small.merge,
+            snowfloat.stats.HyperLogLog(11))
+        self.assertRaises(ValueError, snowfloat.stats.HyperLogLog, 3)
+
+    @patch.object(requests, 'get')
+    def test_get_stats(self, get_mock):
+        """Compute the statistics in one pass and read them back."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(7)] + \
+            _get_pages(self.features)
+        stats = self.layer.get_stats(self.path, page_size=2)
+        self.assertEqual(get_mock.call_count, 3)
+        self.assertEqual(get_mock.call_args_list[0][1]['params'],
+            {'order_by': '-date_modified', 'slice_start': 0, 'slice_end': 1,
+             'page_size': 1, 'fields': '', 'geometry_format': 'none'})
+        self.assertEqual(get_mock.call_args_list[1][1]['params'],
+            {'page_size': 2})
+        self._assert_stats(stats)
+        self.assertEqual(stats.layer_version, [7, 6])
+        stats.close()
+
+        # read from the file while the layer is unchanged
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(7)]
+        stats = self.layer.get_stats(self.path)
+        self.assertEqual(get_mock.call_count, 4)
+        self._assert_stats(stats)
+        stats.close()
+
+        # computed again once the layer changed
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(1),
+            tests.helper.get_layer_version_mock(1)] + \
+            _get_pages(self.features[:1])
+        stats = self.layer.get_stats(self.path)
+        self.assertEqual(stats.num_features, 1)
+        self.assertEqual(stats.fields['tag'],
+            {'count': 1, 'min': 'test_tag_1', 'max': 'test_tag_1',
+             'distinct': 1})
+        stats.close()
+
+        # computed again on request
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(7)] + \
+            _get_pages(self.features)
+        stats = self.layer.get_stats(self.path, refresh=True)
+        self.assertEqual(get_mock.call_count, 11)
+        self.assertEqual(stats.num_features, 7)
+        stats.close()
+
+        # computed again with another precision
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(7)] + \
+            _get_pages(self.features)
+        stats = self.layer.get_stats(self.path, precision=4)
+        self.assertEqual(get_mock.call_count, 14)
+        self.assertEqual(stats.precision, 4)
+        stats.close()
+        self.assertEqual(snowfloat.stats.load_stats(self.path).precision, 4)
+        # statistics cover all the features
+        self.assertRaises(TypeError, self.layer.get_stats, self.path,
+            field_ts_gte=5)
+
+        self.assertRaises(snowfloat.errors.Error, snowfloat.stats.load_stats,
+            self.path, layer_uuid='test_layer_2')
+        self.assertRaises(snowfloat.errors.Error, snowfloat.stats.load_stats,
+            os.path.join(self.directory, 'missing.json'))
+
+    @patch.object(requests, 'get')
+    @patch.object(requests, 'delete')
+    @patch.object(requests, 'post')
+    @patch.object(requests, 'put')
+    def test_writes(self, put_mock, post_mock, delete_mock, get_mock):
+        """Follow the writes made through the client."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(2)] + \
+            _get_pages(self.features[:2])
+        stats = self.layer.get_stats(self.path)
+
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        self.layer.add_features([snowfloat.feature.Feature(
+            snowfloat.geometry.Point([-5, 100]),
+            fields={'ts': 100, 'tag': 'test_tag_9'})])
+        self.assertEqual(stats.num_features, 3)
+        self.assertEqual(stats.num_points, 1 + 4 + 1)
+        self.assertEqual(stats.extent, [-5, 17, 2, 100])
+        self.assertEqual(stats.geometry_types, {'Point': 2, 'Polygon': 1})
+        self.assertEqual(stats.fields['ts'],
+            {'count': 3, 'min': 4, 'max': 100, 'distinct': 3})
+        self.assertTrue(stats.exact)
+
+        tests.helper.set_method_mock(put_mock, 'put', 200,
+            tests.helper.format_features_page(self.features[:1])[0])
+        feature = snowfloat.feature.Feature(snowfloat.geometry.Point([1, 2]),
+            uuid='test_feature_0',
+            uri='/geo/1/layers/test_layer_1/features/test_feature_0',
+            fields={'ts': -1, 'tag': 'test_tag_1'})
+        feature.update()
+        self.assertEqual(stats.num_features, 3)
+        self.assertEqual(stats.fields['ts']['min'], -1)
+        self.assertFalse(stats.exact)
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1})
+        self.layer.delete_feature('test_feature_1')
+        self.assertEqual(stats.num_features, 2)
+        self.assertFalse(stats.exact)
+        self.assertFalse(stats.stale)
+        stats.save(self.path)
+        self.assertEqual(snowfloat.stats.load_stats(self.path).num_features,
+            2)
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1, 'num_features': 1})
+        self.layer.delete_features(field_ts_gte=5)
+        self.assertTrue(stats.stale)
+        stats.save(self.path)
+        stats.close()
+
+        # stale statistics are computed again
+        get_mock.side_effect = [tests.helper.get_layer_version_mock(1)] + \
+            _get_pages(self.features[:1])
+        stats = self.layer.get_stats(self.path)
+        self.assertEqual(stats.num_features, 1)
+        self.assertFalse(stats.stale)
+        stats.close()
+
+    def _assert_stats(self, stats):
+        """Check the statistics of the helper features."""
+        self.assertEqual(stats.num_features, 7)
+        self.assertEqual(stats.num_points, sum(
+            [feature.geometry.num_points() for feature in self.features]))
+        extents = [feature.geometry.extent() for feature in self.features]
+        self.assertEqual(stats.extent, [min([e[0] for e in extents]),
+            max([e[1] for e in extents]), min([e[2] for e in extents]),
+            max([e[3] for e in extents])])
+        self.assertEqual(stats.geometry_types, dict(collections.Counter(
+            feature.geometry.geometry_type for feature in self.features)))
+        self.assertEqual(stats.fields, {
+            'ts': {'count': 7, 'min': 4, 'max': 61, 'distinct': 7},
+            'tag': {'count': 7, 'min': 'test_tag_1', 'max': 'test_tag_7',
+                    'distinct': 7}})
+        self.assertTrue(stats.exact)
+
+
+def _get_pages(features):
+    """Returns requests get mocks of the features in two pages."""
+    page = tests.helper.format_features_page(features)
+    mocks = []
+    for i, page_features in enumerate((page[:2], page[2:])):
+        mock = Mock()
+        mock.status_code = 200
+        mock.json.return_value = {
+            'next_page_uri': '/geo/1/layers/test_layer_1/features?page=1'
+                if i == 0 else None,
+            'total': len(page),
+            'geo': {'type': 'FeatureCollection', 'features': page_features}}
+        mocks.append(mock)
+    return mocks
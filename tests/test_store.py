@@ -0,0 +1,91 @@
+"""Coordinate store tests."""
+
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+import numpy
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.layer
+import snowfloat.store
+
+class CoordinateStoreTests(tests.helper.Tests):
+    """Coordinate store tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'store')
+        tests.helper.Tests.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        tests.helper.Tests.tearDown(self)
+
+    @patch.object(requests, 'get')
+    def test_write_store(self, get_mock):
+        """Stream pages of features to a store and read it back."""
+        get_mock.__name__ = 'get'
+        page = tests.helper.format_features_page(self.features)
+        mocks = []
+        for i, features in enumerate((page[:3], page[3:])):
+            mock = Mock()
+            mock.status_code = 200
+            mock.json.return_value = {
+                'next_page_uri': '/geo/1/layers/test_layer_1/features?page=1'
+                    if i == 0 else None,
+                'total': len(page),
+                'geo': {'type': 'FeatureCollection', 'features': features}}
+            mocks.append(mock)
+        get_mock.side_effect = mocks
+        stats = self.layer.write_coordinate_store(self.path,
+            order_by=('uuid',))
+        self.assertEqual(stats, {'features': 7, 'vertices': 25})
+        self.assertEqual(get_mock.call_args_list[0][1]['params'],
+            {'order_by': 'uuid', 'fields': ''})
+
+        store = snowfloat.store.CoordinateStore(self.path)
+        self.assertEqual(len(store), 7)
+        self.assertEqual(store.dims, 3)
+        for i, feature in enumerate(self.features):
+            geometry = store.get_geometry(i)
+            self.assertEqual(geometry.geometry_type,
+                feature.geometry.geometry_type)
+            self.assertEqual(store.batch.get_geojson(i), page[i]['geometry'])
+            self.assertEqual(store.get_row('test_feature_%d' % (i,)), i)
+            self.assertEqual(store.get_uuid(i), 'test_feature_%d' % (i,))
+        self.assertEqual(store.get_row(u'test_feature_9'), None)
+        vertices = store.get_vertices(2)
+        self.assertEqual(vertices.tolist(), [[11, 12, 13], [14, 15, 16],
+            [17, 18, 19], [11, 12, 13], [21, 22, 23], [24, 25, 26],
+            [27, 28, 29], [21, 22, 23]])
+        self.assertTrue(isinstance(store.batch.coordinates, numpy.memmap))
+        self.assertFalse(vertices.flags.writeable)
+
+        # an interrupted rewrite leaves no store
+        get_mock.side_effect = snowfloat.errors.RequestError(500, None,
+            'error', None)
+        self.assertRaises(snowfloat.errors.RequestError,
+            self.layer.write_coordinate_store, self.path)
+        self.assertRaises(snowfloat.errors.Error,
+            snowfloat.store.CoordinateStore, self.path)
+
+    @patch.object(requests, 'get')
+    def test_write_empty_store(self, get_mock):
+        """Write a store without features."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = tests.helper.get_features_pages(1, 0)
+        self.assertEqual(self.layer.write_coordinate_store(self.path),
+            {'features': 0, 'vertices': 0})
+        store = snowfloat.store.CoordinateStore(self.path)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.get_row('test_feature_0'), None)
@@ -0,0 +1,145 @@
+"""Tile cache tests."""
+
+import json
+
+from mock import Mock, patch
+import requests
+
+import tests.helper
+
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.tiles
+
+class TileCacheTests(tests.helper.Tests):
+    """Tile cache tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1',
+            srid=4326)
+        tests.helper.Tests.setUp(self)
+
+    def test_get_tiles(self):
+        """Split extents in tiles."""
+        world = snowfloat.tiles.WORLD_EXTENTS[4326]
+        self.assertEqual(snowfloat.tiles.get_tiles([-10, 10, -10, 10], 1,
+            world), [(1, 0, 0), (1, 1, 0), (1, 0, 1), (1, 1, 1)])
+        self.assertEqual(snowfloat.tiles.get_tiles([10, 20, 10, 20], 2,
+            world), [(2, 2, 1)])
+        self.assertEqual(snowfloat.tiles.get_tiles([-200, 200, 80, 100], 1,
+            world), [(1, 0, 0), (1, 1, 0)])
+        self.assertEqual(snowfloat.tiles.get_tile_extent((2, 2, 1), world),
+            [0.0, 90.0, 0.0, 45.0])
+        polygon = snowfloat.tiles.get_tile_polygon((0, 0, 0), world)
+        self.assertEqual(polygon.coordinates, [[[-180.0, -90.0],
+            [180.0, -90.0], [180.0, 90.0], [-180.0, 90.0], [-180.0, -90.0]]])
+
+    @patch.object(requests, 'get')
+    def test_get_features(self, get_mock):
+        """Fetch the missing tiles only and deduplicate their features."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = _get_tile
+        cache = self.layer.tile_cache(1)
+        features = cache.get_features([-100, 100, -50, 50], field_ts_gte=0)
+        self.assertEqual(get_mock.call_count, 4)
+        self.assertEqual(json.loads(get_mock.call_args[1]['params'][
+            'geometry__intersects'])['type'], 'Polygon')
+        self.assertEqual(get_mock.call_args[1]['params']['field_ts__gte'], 0)
+        self.assertEqual(sorted(feature.uuid for feature in features),
+            ['test_feature_0', 'test_feature_0_0', 'test_feature_0_1',
+             'test_feature_1_0', 'test_feature_1_1'])
+
+        # viewport in a tile already fetched
+        features = cache.get_features([0, 5, -5, 0], field_ts_gte=0)
+        self.assertEqual(get_mock.call_count, 4)
+        self.assertEqual([feature.uuid for feature in features],
+            ['test_feature_0'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['tiles']),
+            (1, 4, 4))
+
+        # paging arguments are not conditions
+        features = cache.get_features([0, 5, -5, 0], field_ts_gte=0,
+            page_size=10, prefetch=2)
+        self.assertEqual(get_mock.call_count, 4)
+        self.assertEqual([feature.uuid for feature in features],
+            ['test_feature_0'])
+
+        # other conditions are other tiles
+        cache.get_features([1, 5, -5, -1], page_size=10, prefetch=2)
+        self.assertEqual(get_mock.call_count, 5)
+        self.assertEqual(get_mock.call_args[1]['params']['page_size'], 10)
+        self.assertNotIn('prefetch', get_mock.call_args[1]['params'])
+
+        # fetched features would be missing their geometry
+        self.assertRaises(ValueError, cache.get_features, [1, 5, -5, -1],
+            include_fields=['ts'])
+        self.assertRaises(ValueError, cache.get_features, [1, 5, -5, -1],
+            geometry_format='wkt')
+        self.assertEqual(get_mock.call_count, 5)
+        cache.close()
+
+    @patch.object(requests, 'get')
+    @patch.object(requests, 'delete')
+    def test_evict(self, delete_mock, get_mock):
+        """Evict tiles on size, age and writes."""
+        get_mock.__name__ = 'get'
+        get_mock.side_effect = _get_tile
+        cache = self.layer.tile_cache(1, max_tiles=2)
+        cache.get_features([-10, 10, -10, 10])
+        self.assertEqual((cache.stats()['tiles'],
+            cache.stats()['evictions']), (2, 2))
+        # bottom tiles fetched last are kept
+        cache.get_features([1, 5, -5, -1])
+        self.assertEqual(get_mock.call_count, 4)
+        cache.get_features([1, 5, 1, 5])
+        self.assertEqual(get_mock.call_count, 5)
+
+        expired = self.layer.tile_cache(1, ttl=-1)
+        expired.get_features([1, 5, 1, 5])
+        expired.get_features([1, 5, 1, 5])
+        self.assertEqual(expired.stats()['expirations'], 1)
+        self.assertEqual(get_mock.call_count, 7)
+        expired.close()
+
+        tests.helper.set_method_mock(delete_mock, 'delete', 200,
+            {'num_points': 1})
+        self.layer.delete_feature('test_feature_0')
+        self.assertEqual(cache.stats()['tiles'], 0)
+        cache.close()
+
+        self.layer.srid = 2154
+        self.assertRaises(ValueError, self.layer.tile_cache, 1)
+
+
+def _get_tile(*args, **kwargs):
+    """Requests get side effect returning a point at the origin and one
+    point in the middle of the tile queried."""
+    # pylint: disable=W0613
+    ring = json.loads(kwargs['params']['geometry__intersects'])[
+        'coordinates'][0]
+    x = (ring[0][0] + ring[1][0]) / 2
+    y = (ring[0][1] + ring[2][1]) / 2
+    features = []
+    for uuid, coordinates in (('test_feature_0', [0, 0]),
+            ('test_feature_%d_%d' % (x > 0, y > 0), [x, y])):
+        features.append({
+            'type': 'Feature',
+            'id': uuid,
+            'geometry': {'type': 'Point', 'coordinates': coordinates},
+            'properties': {
+                'uri': '/geo/1/layers/test_layer_1/features/%s' % (uuid,),
+                'date_created': 1,
+                'date_modified': 1,
+                'spatial': None}})
+    mock = Mock()
+    mock.status_code = 200
+    mock.json.return_value = {
+        'next_page_uri': None,
+        'total': len(features),
+        'geo': {'type': 'FeatureCollection', 'features': features}}
+    return mock
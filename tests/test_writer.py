@@ -0,0 +1,105 @@
+"""Batch writer tests."""
+
+from mock import patch
+import requests
+
+import tests.helper
+
+import snowfloat.errors
+import snowfloat.feature
+import snowfloat.geometry
+import snowfloat.layer
+import snowfloat.pool
+import snowfloat.writer
+
+class BatchWriterTests(tests.helper.Tests):
+    """Batch writer tests."""
+
+    # pylint: disable=C0103
+    def setUp(self):
+        self.layer = snowfloat.layer.Layer(
+            name='test_tag_1',
+            uuid='test_layer_1',
+            uri='/geo/1/layers/test_layer_1')
+        tests.helper.Tests.setUp(self)
+
+    def get_points(self, num):
+        """Returns point features."""
+        return [snowfloat.feature.Feature(
+                    snowfloat.geometry.Point([i, i]), fields={'ts': i})
+                for i in range(num)]
+
+    @patch.object(requests, 'post')
+    def test_max_features(self, post_mock):
+        """Flush when the number of features is reached."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        with self.layer.batch_writer(max_features=2, max_age=60) as writer:
+            futures = [writer.add(f) for f in self.get_points(5)]
+            futures[1].result(timeout=5)
+            self.assertEqual(futures[0].result(), 'test_feature_1')
+        self.assertEqual(post_mock.call_count, 3)
+        self.assertEqual(sorted([f.result() for f in futures]),
+            ['test_feature_%d' % (i,) for i in range(1, 6)])
+        self.assertEqual(self.layer.num_features, 5)
+        self.assertEqual(self.layer.num_points, 5)
+
+    @patch.object(requests, 'post')
+    def test_max_bytes(self, post_mock):
+        """Flush when the serialized size is reached."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        writer = snowfloat.writer.BatchWriter(self.layer, max_bytes=150,
+            max_age=60)
+        for feature in self.get_points(4):
+            writer.add(feature)
+        writer.flush()
+        self.assertEqual(post_mock.call_count, 4)
+        writer.close()
+        writer.close()
+        self.assertRaises(snowfloat.errors.Error, writer.add,
+            self.get_points(1)[0])
+
+    @patch.object(requests, 'post')
+    def test_max_age(self, post_mock):
+        """Flush when the oldest feature is too old."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect()
+        with self.layer.batch_writer(max_age=0.1) as writer:
+            future = writer.add(self.get_points(1)[0])
+            self.assertEqual(future.result(timeout=5), 'test_feature_1')
+            self.assertEqual(post_mock.call_count, 1)
+
+    @patch.object(requests, 'post')
+    def test_error(self, post_mock):
+        """Request errors are set on the features futures."""
+        post_mock.__name__ = 'post'
+        post_mock.side_effect = tests.helper.add_features_side_effect(
+            status_codes=[400])
+        with self.layer.batch_writer(max_age=60) as writer:
+            future = writer.add(self.get_points(1)[0])
+        self.assertTrue(future.done())
+        self.assertRaises(snowfloat.errors.RequestError, future.result)
+        self.assertEqual(future.exception().status, 400)
+        self.assertEqual(self.layer.num_features, 0)
+
+
+class PoolTests(tests.helper.Tests):
+    """Worker pool and futures tests."""
+
+    def test_map(self):
+        """Map a function on worker threads."""
+        with snowfloat.pool.WorkerPool(2) as pool:
+            self.assertListEqual(list(pool.map(abs, [-1, -2, 3])), [1, 2, 3])
+        self.assertRaises(snowfloat.errors.Error, pool.submit, abs, 1)
+        pool.shutdown()
+
+    def test_future_timeout(self):
+        """Waiting on a future times out."""
+        future = snowfloat.pool.Future()
+        self.assertRaises(snowfloat.errors.TimeoutError, future.result,
+            timeout=0.01)
+        future.set_result(1)
+        results = []
+        future.add_done_callback(lambda f: results.append(f.result()))
+        self.assertListEqual(results, [1])